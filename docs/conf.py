@@ -93,6 +93,8 @@ This page provides a list of the Providers that are available in this package.
 
 ''')
     for name, val in sorted(ir_measures.providers.registry.items()):
+        if isinstance(val, ir_measures.providers.LazyProvider):
+            val = val.load()
         f.write(f'''
 .. _providers.{name}:
 
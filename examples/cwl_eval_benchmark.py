@@ -0,0 +1,43 @@
+"""
+Times the C/W/L measures on a large synthetic run, for each engine of the cwl_eval provider.
+
+    python examples/cwl_eval_benchmark.py --queries 50000 --engines native cwl
+
+Qrels and run are generated from a fixed seed (10 judgments and 20 retrieved documents per query, relevance 0-3), so
+timings (and aggregates) can be compared across versions of ir_measures by running the script on each of them.
+Only the evaluation is timed, not building the evaluator.
+"""
+import argparse
+import random
+import time
+import ir_measures
+from ir_measures import P, RR, RBP, SDCG, INSQ, NERR10
+from ir_measures.providers.cwl_eval import CwlEvalProvider
+
+
+MEASURES = [P@10, RR, RBP(rel=1), SDCG(max_rel=3)@10, INSQ(max_rel=3), NERR10(max_rel=3)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--queries', type=int, default=50_000)
+    parser.add_argument('--docs', type=int, default=20, help='retrieved documents per query')
+    parser.add_argument('--engines', nargs='+', default=list(CwlEvalProvider.ENGINES), choices=CwlEvalProvider.ENGINES)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    qrels = [ir_measures.Qrel(str(q), f'd{rng.randint(0, 40)}', rng.randint(0, 3)) for q in range(args.queries) for _ in range(10)]
+    run = [ir_measures.ScoredDoc(str(q), f'd{rng.randint(0, 40)}', rng.random()) for q in range(args.queries) for _ in range(args.docs)]
+
+    for engine in args.engines:
+        evaluator = CwlEvalProvider(engine).evaluator(MEASURES, qrels)
+        start = time.perf_counter()
+        result = evaluator.calc_aggregate(run)
+        elapsed = time.perf_counter() - start
+        print(f'{engine}: {elapsed:.1f}s, {elapsed / args.queries * 1e6:.0f}us/query')
+        print('  ' + ', '.join(f'{measure}={value:.6f}' for measure, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Times `import ir_measures` (and the CLI's startup) in fresh interpreters, using python's -X importtime.
+
+    python examples/import_time_benchmark.py --repeat 5 --top 15
+
+For each target, the fastest of --repeat runs is reported (the others include noise, such as cold file caches),
+followed by the modules that took the longest to import themselves (not counting the modules they import) in that
+run. Compare against `import numpy` to see what is left for ir_measures itself. Timings can be compared across
+versions of ir_measures by running the script on each of them.
+"""
+import argparse
+import subprocess
+import sys
+
+
+TARGETS = {
+    'import ir_measures': 'import ir_measures',
+    'CLI startup': 'import ir_measures.__main__',
+    'import numpy (reference)': 'import numpy',
+}
+
+
+def import_times(code):
+    # [(module, self time, cumulative time, whether it is imported at the top level)] in microseconds, in the order
+    # that -X importtime reports them
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True).stderr
+    result = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        top_level = len(module) - len(module.lstrip()) == 1 # nested imports are indented further
+        result.append((module.strip(), int(self_us), int(cumulative_us), top_level))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='number of slowest modules to list')
+    args = parser.parse_args()
+
+    # modules that the interpreter imports at startup (e.g., site) are not counted
+    startup = {module for module, _, _, _ in import_times('pass')}
+    def total(run):
+        return sum(cumulative for module, _, cumulative, top_level in run if top_level and module not in startup)
+
+    for name, code in TARGETS.items():
+        best = min((import_times(code) for _ in range(args.repeat)), key=total)
+        print(f'{name}: {total(best) / 1000:.1f}ms')
+        modules = [(module, self_us) for module, self_us, _, _ in best if module not in startup]
+        for module, self_us in sorted(modules, key=lambda m: -m[1])[:args.top]:
+            print(f'  {self_us / 1000:6.1f}ms {module}')
+
+
+if __name__ == '__main__':
+    main()
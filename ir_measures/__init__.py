@@ -4,8 +4,8 @@ import logging
 from ir_measures import util
 from ir_measures import lazylibs
 from ir_measures.util import (
-    parse_measure, parse_trec_measure, read_trec_qrels, read_trec_run,
-    Qrel, ScoredDoc, Metric, CalcResults,
+    parse_measure, parse_trec_measure, read_trec_qrels, read_trec_run, read_trec_qrels_columnar, read_trec_run_columnar,
+    Qrel, ScoredDoc, Metric, CalcResults, CurveResults, ColumnarResults, ColumnarRun, ColumnarQrels,
     GenericQrel, # deprecated; replaced with Qrel
     GenericScoredDoc, # deprecated; replaced with ScoredDoc
     convert_trec_name, # deprecated; replaced with parse_trec_measure
@@ -21,6 +21,7 @@ from ir_measures.measures import (
 )
 from ir_measures import providers
 from ir_measures.providers import Provider, Evaluator
+from ir_measures import stats
 
 
 
@@ -39,17 +40,24 @@ pytrec_eval = providers.registry['pytrec_eval']
 trectools = providers.registry['trectools']
 judged = providers.registry['judged']
 msmarco = providers.registry['msmarco']
+native = providers.registry['native']
 pyndeval = providers.registry['pyndeval']
 ranx = providers.registry['ranx']
 runtime = providers.registry['runtime']
 
 define = providers.define
 define_byquery = providers.define_byquery
+define_batched = providers.define_batched
 
-CwlMetric = providers.CwlMetric
+def __getattr__(name):
+    # CwlMetric lives in the cwl_eval provider module, which is only imported when needed
+    if name == 'CwlMetric':
+        return providers.CwlMetric
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 DefaultPipeline = providers.FallbackProvider([
     runtime,
+    native,
     pytrec_eval,
     cwl_eval,
     compat,
@@ -69,13 +77,39 @@ calc = DefaultPipeline.calc
 run_inputs = DefaultPipeline.run_inputs
 qrel_inputs = DefaultPipeline.qrel_inputs
 
+def dense_evaluator(measures):
+    """
+    Returns a :class:`~ir_measures.providers.DenseEvaluator` for these measures, which evaluates (queries x candidates)
+    NumPy matrices of scores and relevance labels directly, without query or document IDs::
+
+        evaluator = ir_measures.dense_evaluator([nDCG@10, RR, AP, P@5, R@100])
+        evaluator.calc_aggregate(scores, labels, mask=mask)
+
+    The measures are calculated by :ref:`providers.native`.
+    """
+    return native.dense_evaluator(measures)
+
+def calc_curve(measures, qrels, run, cutoffs=1000):
+    """
+    Calculates measures at every cutoff (``1..cutoffs`` if an int, or each of a sequence of cutoffs) in a single pass
+    over the run, which is far cheaper than evaluating ``P@1``, ``P@2``, ..., ``P@1000`` as separate measures::
+
+        curve = ir_measures.calc_curve([P, R, nDCG], qrels, run, cutoffs=100)
+        curve.aggregated[P] # array of P@1..P@100 (mean over queries)
+        curve.per_query[nDCG] # (queries x cutoffs) array, with rows in the order of curve.query_ids
+
+    The measures (P, R, AP, nDCG, and Success) are given without cutoffs. Queries in the qrels that are missing from
+    the run have values of 0. The measures are calculated by :ref:`providers.native`.
+    """
+    return native.calc_curve(measures, qrels, run, cutoffs)
+
 __all__ = [
-    'accuracy', 'cwl_eval', 'compat', 'gdeval', 'pytrec_eval', 'trectools', 'judged', 'msmarco', 'pyndeval', 'ranx',
-    'runtime',
-    'define', 'define_byquery',
+    'accuracy', 'cwl_eval', 'compat', 'gdeval', 'pytrec_eval', 'trectools', 'judged', 'msmarco', 'native', 'pyndeval',
+    'ranx', 'runtime',
+    'define', 'define_byquery', 'define_batched',
     'CwlMetric',
     'DefaultPipeline',
-    'evaluator', 'calc_ctxt', 'iter_calc', 'calc_aggregate', 'calc',
+    'evaluator', 'calc_ctxt', 'iter_calc', 'calc_aggregate', 'calc', 'dense_evaluator', 'calc_curve',
     'Accuracy', 'alpha_DCG', 'alpha_nDCG', 'AP', 'AP_IA', 'BaseMeasure', 'BPM', 'Bpref', 'BPref', 'Compat', 'ERR',
     'ERR_IA', 'infAP', 'INSQ', 'INST', 'IPrec', 'Judged', 'MAP', 'MAP_IA', 'MeanAgg', 'Measure', 'MRR', 'nDCG', 'NDCG',
     'NERR10', 'NERR11', 'NERR8', 'NERR9', 'nERR_IA', 'nNRBP', 'NRBP', 'NumQ', 'NumRel', 'NumRelRet', 'NumRet', 'P',
@@ -83,14 +117,14 @@ __all__ = [
     'SetR', 'SetRelP', 'StRecall', 'Success', 'SumAgg', 'α_DCG', 'α_nDCG',
     'Measure',
     'Provider', 'Evaluator',
-    'Qrel', 'ScoredDoc', 'Metric', 'CalcResults',
+    'Qrel', 'ScoredDoc', 'Metric', 'CalcResults', 'CurveResults', 'ColumnarResults', 'ColumnarRun', 'ColumnarQrels',
     'GenericQrel', 'GenericScoredDoc',
     'convert_trec_name', 'parse_trec_measure',
-    'read_trec_qrels', 'read_trec_run',
+    'read_trec_qrels', 'read_trec_run', 'read_trec_qrels_columnar', 'read_trec_run_columnar',
     'parse_measure', 'parse_trec_qrels', 'parse_trec_run',
     'util',
     'measures',
     'providers',
-    'lazylibs',
+    'lazylibs', 'stats',
     '__version__',
 ]
@@ -14,21 +14,24 @@ def tsv_output(args):
         place_format = '' # --places -1 indicates no format string (show all places, exp notation, etc.)
     else:
         place_format = f'.{args.places}f'
-    def wrapped(result):
+    def wrapped(result, run_name=None):
+        prefix = f'{run_name}\t' if run_name is not None else ''
         if args.by_query:
-            print(f'{result.query_id}\t{result.measure}\t{result.value:{place_format}}')
+            print(f'{prefix}{result.query_id}\t{result.measure}\t{result.value:{place_format}}')
         else:
-            print(f'{result.measure}\t{result.value:{place_format}}')
+            print(f'{prefix}{result.measure}\t{result.value:{place_format}}')
     return wrapped
 
 
 def jsonl_output(args):
     if args.places != DEFAULT_PLACES:
         sys.stderr.write('--places is ignored when using --output jsonl\n')
-    def wrapped(result):
+    def wrapped(result, run_name=None):
         result = result._replace(measure=str(result.measure))._asdict()
         if not args.by_query:
             del result['query_id']
+        if run_name is not None:
+            result = {'run': run_name, **result}
         print(json.dumps(result))
     return wrapped
 
@@ -49,34 +52,72 @@ def main_cli():
     parser.add_argument('--no_summary', '-n', action='store_true')
     parser.add_argument('--output_format', '-o', choices=OUTPUT_FORMATS.keys(), default='tsv')
     parser.add_argument('--provider', choices=ir_measures.providers.registry.keys())
+    parser.add_argument('--runs', '-r', nargs='+', default=[], help='additional run files to evaluate; output lines are prefixed with the run file')
+    parser.add_argument('--n_jobs', '-j', type=int, default=1, help='number of processes to use when evaluating multiple runs (-1 for all CPUs)')
+    parser.add_argument('--explain', action='store_true', help='print (to stderr) which provider calculates each measure')
+    parser.add_argument('--stream', action='store_true', help='evaluate the run a few queries at a time, rather than loading it into memory (the run must be grouped by query)')
     args = parser.parse_args()
     qrels = _get_qrels(args)
-    run = ir_measures.read_trec_run(args.run)
     measures = _get_measures(args)
     calc_obj = ir_measures
     if args.provider:
         calc_obj = ir_measures.providers.registry[args.provider]
+    if args.explain:
+        if args.provider:
+            print(f'All measures are calculated by {args.provider}', file=sys.stderr)
+        else:
+            print(ir_measures.DefaultPipeline.explain(measures, qrels), file=sys.stderr)
     output = OUTPUT_FORMATS[args.output_format](args)
-    if args.by_query:
+    if not args.by_query:
+        assert not args.no_summary, "--no_summary (-n) only supported with --by_query (-q)"
+    if args.runs:
+        _multi_run(args, calc_obj, measures, qrels, output)
+        return
+    if args.by_query or args.stream:
+        if args.stream:
+            results = calc_obj.evaluator(measures, qrels).iter_calc_stream(args.run)
+        else:
+            results = calc_obj.iter_calc(measures, qrels, ir_measures.util.read_run(args.run))
         aggs = {m: m.aggregator() for m in measures} if not args.no_summary else None
-        for result in calc_obj.iter_calc(measures, qrels, run):
-            output(result)
+        for result in results:
+            if args.by_query:
+                output(result)
             if aggs:
                 aggs[result.measure].add(result.value)
         if aggs:
             for measure in measures:
                 output(Metric(query_id=SUMMARY_QID, measure=measure, value=aggs[measure].result()))
     else:
-        assert not args.no_summary, "--no_summary (-n) only supported with --by_query (-q)"
+        run = ir_measures.util.read_run(args.run)
         results = calc_obj.calc_aggregate(measures, qrels, run)
         for measure in measures:
             output(Metric(query_id=SUMMARY_QID, measure=measure, value=results[measure]))
 
 
+def _multi_run(args, calc_obj, measures, qrels, output):
+    run_paths = [args.run] + [r for r in args.runs if r != args.run]
+    evaluator = calc_obj.evaluator(measures, qrels)
+    if args.by_query:
+        results = evaluator.calc_many({path: path for path in run_paths}, n_jobs=args.n_jobs)
+        for path in run_paths:
+            for result in results[path].per_query:
+                output(result, path)
+            if not args.no_summary:
+                for measure in measures:
+                    output(Metric(query_id=SUMMARY_QID, measure=measure, value=results[path].aggregated[measure]), path)
+    else:
+        results = evaluator.calc_aggregate_many({path: path for path in run_paths}, n_jobs=args.n_jobs)
+        for path in run_paths:
+            for measure in measures:
+                output(Metric(query_id=SUMMARY_QID, measure=measure, value=results[path][measure]), path)
+
+
 def _get_qrels(args):
     # gets the qrels, either from a file (priority) or from ir_datasets (if installed)
     if os.path.exists(args.qrels):
-        return ir_measures.read_trec_qrels(args.qrels)
+        if ir_measures.util.is_columnar_file(args.qrels):
+            return ir_measures.util.ColumnarQrels.load(args.qrels)
+        return ir_measures.util.read_trec_qrels_columnar(args.qrels)
     irds_available = False
     try:
         import ir_datasets
@@ -0,0 +1,187 @@
+#!/usr/bin/perl -w
+
+# A long-lived version of gdeval.pl (version 1.2a), used by ir_measures to score many runs against the same qrels
+# without starting a new process (or writing temporary files) for each run and cutoff. The qrels parsing, sort
+# orders, and measure calculations are those of gdeval.pl.
+#
+# Protocol (over stdin/stdout), with the cutoffs given as arguments:
+#  1. the qrels are written to stdin (in the qrels format of gdeval.pl), followed by an empty line; the worker
+#     replies "ready" once they are loaded
+#  2. each run is written to stdin (in the run format of gdeval.pl), followed by an empty line; the worker replies
+#     with a "topic,k,ndcg@k,err@k" line for each topic and cutoff, followed by an empty line
+# The worker exits at the end of stdin, and dies (like gdeval.pl) on a format error.
+
+$usage = "usage: $0 k [k ...]";
+
+$MAX_JUDGMENT = 4; # Maximum gain value allowed in qrels file.
+
+die $usage unless $#ARGV >= 0;
+@K = @ARGV;
+
+$| = 1; # flush each reply
+
+# Read qrels, check format, and sort
+$line = 0;
+while (<STDIN>) {
+  $line++;
+  s/[\r\n]//g;
+  last if $_ eq "";
+  ($topic, $zero, $docno, $judgment) = split (' ');
+  $topic =~ s/^.*\-//;
+  die "$0: format error on line $line of qrels\n"
+    unless
+      $topic =~ /^[0-9]+$/ && $zero == 0
+      && $judgment =~ /^-?[0-9]+$/ && $judgment <= $MAX_JUDGMENT;
+  if ($judgment > 0) {
+    $qrels[$#qrels + 1]= "$topic $docno $judgment";
+    $seen{$topic} = 1;
+  }
+}
+@qrels = sort qrelsOrder (@qrels);
+
+# Process qrels: store judgments and compute ideal gains (for each cutoff)
+$topicCurrent = -1;
+for ($i = 0; $i <= $#qrels; $i++) {
+  ($topic, $docno, $judgment) = split (' ', $qrels[$i]);
+  if ($topic != $topicCurrent) {
+    if ($topicCurrent >= 0) {
+      &idealDone ($topicCurrent, @gain);
+      $#gain = -1;
+    }
+    $topicCurrent = $topic;
+  }
+  next if $judgment < 0;
+  $judgment{"$topic:$docno"} = $gain[$#gain + 1] = $judgment;
+}
+if ($topicCurrent >= 0) {
+  &idealDone ($topicCurrent, @gain);
+  $#gain = -1;
+}
+print "ready\n";
+
+# Read and score runs, one at a time
+while (1) {
+  @run = ();
+  $line = 0;
+  $more = 0;
+  while (<STDIN>) {
+    $more = 1;
+    $line++;
+    s/[\r\n]//g;
+    last if $_ eq "";
+    ($topic, $q0, $docno, $rank, $score, $runid) = split (' ');
+    $topic =~ s/^.*\-//;
+    die "$0: format error on line $line of run\n"
+      unless
+        $topic =~ /^[0-9]+$/ && $q0 eq "Q0" && $rank =~ /^[0-9]+$/ && $runid;
+    $run[$#run + 1] = "$topic $docno $score";
+  }
+  last unless $more;
+
+  @run = sort runOrder (@run);
+
+  $topicCurrent = -1;
+  for ($i = 0; $i <= $#run; $i++) {
+    ($topic, $docno, $score) = split (' ', $run[$i]);
+    if ($topic != $topicCurrent) {
+      if ($topicCurrent >= 0) {
+        &topicDone ($topicCurrent, @gain);
+        $#gain = -1;
+      }
+      $topicCurrent = $topic;
+    }
+    $j  = $judgment{"$topic:$docno"};
+    $j = 0 unless $j;
+    $gain[$#gain + 1] = $j;
+  }
+  if ($topicCurrent >= 0) {
+    &topicDone ($topicCurrent, @gain);
+    $#gain = -1;
+  }
+  print "\n";
+}
+
+exit 0;
+
+# comparison function for qrels: by topic then judgment
+sub qrelsOrder {
+  my ($topicA, $docnoA, $judgmentA) = split (' ', $a);
+  my ($topicB, $docnoB, $judgmentB) = split (' ', $b);
+
+  if ($topicA < $topicB) {
+    return -1;
+  } elsif ($topicA > $topicB) {
+    return 1;
+  } else {
+    return $judgmentB <=> $judgmentA;
+  }
+}
+
+# comparison function for runs: by topic then score then docno
+sub runOrder {
+  my ($topicA, $docnoA, $scoreA) = split (' ', $a);
+  my ($topicB, $docnoB, $scoreB) = split (' ', $b);
+
+  if ($topicA < $topicB) {
+    return -1;
+  } elsif ($topicA > $topicB) {
+    return 1;
+  } elsif ($scoreA < $scoreB) {
+    return 1;
+  } elsif ($scoreA > $scoreB) {
+    return -1;
+  } elsif ($docnoA lt $docnoB) {
+    return 1;
+  } elsif ($docnoA gt $docnoB) {
+    return -1;
+  } else {
+    return 0;
+  }
+}
+
+# compute DCG over a sorted array of gain values, reporting at depth $k
+sub dcg {
+ my ($k, @gain) = @_;
+ my ($i, $score) = (0, 0);
+
+ for ($i = 0; $i <= ($k <= $#gain ? $k - 1 : $#gain); $i++) {
+   $score += (2**$gain[$i] - 1)/log ($i + 2);
+ }
+ return $score;
+}
+
+# compute ERR over a sorted array of gain values, reporting at depth $k
+sub err {
+  my ($k, @gain) = @_;
+  my ($i, $score, $decay, $r);
+
+ $score = 0.0;
+ $decay = 1.0;
+ for ($i = 0; $i <= ($k <= $#gain ? $k - 1 : $#gain); $i++) {
+   $r = (2**$gain[$i] - 1)/(2**$MAX_JUDGMENT);
+   $score += $r*$decay/($i + 1);
+   $decay *= (1 - $r);
+ }
+ return $score;
+}
+
+# store the ideal DCG of a topic at each cutoff
+sub idealDone {
+  my ($topic, @gain) = @_;
+  foreach $k (@K) {
+    $ideal{"$topic:$k"} = &dcg($k, @gain);
+  }
+}
+
+# compute and report information for current topic, at each cutoff
+sub topicDone {
+  my ($topic, @gain) = @_;
+  my($ndcg, $err) = (0, 0);
+  if ($seen{$topic}) {
+    foreach $k (@K) {
+      $ndcg = &dcg($k, @gain)/$ideal{"$topic:$k"};
+      $err = &err ($k, @gain);
+      printf  "$topic,$k,%.5f,%.5f\n",$ndcg,$err;
+    }
+  }
+}
@@ -7,3 +7,15 @@ def pandas():
         import pandas
         _cache['pandas'] = pandas
     return _cache['pandas']
+
+def numpy():
+    if 'numpy' not in _cache:
+        import numpy
+        _cache['numpy'] = numpy
+    return _cache['numpy']
+
+def scipy():
+    if 'scipy' not in _cache:
+        import scipy.special
+        _cache['scipy'] = scipy
+    return _cache['scipy']
@@ -13,6 +13,7 @@ class _AP(measures.Measure):
     """
     __name__ = 'AP'
     NAME = __name__
+    CUTOFF_BOUNDS_DEPTH = True
     PRETTY_NAME = '(Mean) Average Precision'
     SHORT_DESC = 'The mean of the precision scores at each relevant item retrieved.'
     SUPPORTED_PARAMS = {
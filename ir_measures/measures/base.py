@@ -38,6 +38,7 @@ class Measure:
     AT_PARAM = 'cutoff' # allows measures to configure which param measure@X updates (default is cutoff)
     SUPPORTED_PARAMS: Dict[str, ParamInfo] = {}
     DEFAULT = 0. # value if no documents are returned for this query
+    CUTOFF_BOUNDS_DEPTH = False # whether the value only depends on the documents ranked within the cutoff (see max_depth)
 
     def __init__(self, **params):
         self.params = params
@@ -67,6 +68,17 @@ class Measure:
         default = self.SUPPORTED_PARAMS[key].default
         return self.params.get(key, default)
 
+    def max_depth(self) -> Optional[int]:
+        """
+        Returns the number of top-ranked documents of each query that this measure depends on, or ``None`` if it can
+        depend on the entire ranking (e.g., AP, NumRet, or measures filtered with ``judged_only``).
+        """
+        if not self.CUTOFF_BOUNDS_DEPTH or self['cutoff'] is _NOT_PROVIDED:
+            return None
+        if 'judged_only' in self.SUPPORTED_PARAMS and self['judged_only']:
+            return None
+        return self['cutoff']
+
     def iter_calc(self, qrels, run) -> Iterator[Metric]:
         self.validate_params()
         return ir_measures.iter_calc([self], qrels, run)
@@ -124,6 +136,11 @@ class MeanAgg(Agg):
         self.sum += value
         self.count += 1
 
+    def remove(self, value):
+        # undoes add(value), so incremental evaluation can patch the aggregate when a query's value changes
+        self.sum -= value
+        self.count -= 1
+
     def result(self):
         if self.count == 0:
             return self.default
@@ -137,6 +154,9 @@ class SumAgg(Agg):
     def add(self, value):
         self.sum += value
 
+    def remove(self, value):
+        self.sum -= value
+
     def result(self):
         return self.sum
 
@@ -9,6 +9,7 @@ class _ERR(measures.Measure):
     """
     __name__ = 'ERR'
     NAME = __name__
+    CUTOFF_BOUNDS_DEPTH = True
     PRETTY_NAME = 'Expected Reciprocal Rank'
     SHORT_DESC = 'An extension of Reciprocal Rank that accounts for both graded relevance and a more realistic user model.'
     SUPPORTED_PARAMS = {
@@ -8,6 +8,7 @@ class _Judged(measures.Measure):
     """
     __name__ = 'Judged'
     NAME = __name__
+    CUTOFF_BOUNDS_DEPTH = True
     PRETTY_NAME = 'Judgment Rate at k'
     SHORT_DESC = 'The percentage of results in the top k that have a relevance judgment.'
     SUPPORTED_PARAMS = {
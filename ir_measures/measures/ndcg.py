@@ -12,6 +12,7 @@ class _nDCG(measures.Measure):
     """
     __name__ = 'nDCG'
     NAME = __name__
+    CUTOFF_BOUNDS_DEPTH = True
     PRETTY_NAME = 'Normalised Discounted Cumulative Gain'
     SHORT_DESC = 'A measure of the total gain a user encounters in a result list, discounted by rank and normalised against an ideal ranking.'
     SUPPORTED_PARAMS = {
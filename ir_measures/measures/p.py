@@ -12,6 +12,7 @@ class _P(measures.Measure):
     """
     __name__ = 'P'
     NAME = __name__
+    CUTOFF_BOUNDS_DEPTH = True
     PRETTY_NAME = 'Precision at k'
     SHORT_DESC = 'The percentage of documents in the top k results that are relevant.'
     SUPPORTED_PARAMS = {
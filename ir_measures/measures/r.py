@@ -10,6 +10,7 @@ class _R(measures.Measure):
     """
     __name__ = 'R'
     NAME = __name__
+    CUTOFF_BOUNDS_DEPTH = True
     PRETTY_NAME = 'Recall at k'
     SHORT_DESC = 'The percentage of relevant documents retrieved in the top k results.'
     SUPPORTED_PARAMS = {
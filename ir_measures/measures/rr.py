@@ -12,6 +12,7 @@ class _RR(measures.Measure):
     """
     __name__ = 'RR'
     NAME = __name__
+    CUTOFF_BOUNDS_DEPTH = True
     PRETTY_NAME = '(Mean) Reciprocal Rank'
     SHORT_DESC = 'The reciprocal of the rank of the first relevant document.'
     SUPPORTED_PARAMS = {
@@ -10,6 +10,7 @@ class _Success(measures.Measure):
     """
     __name__ = 'Success'
     NAME = __name__
+    CUTOFF_BOUNDS_DEPTH = True
     PRETTY_NAME = 'Success at k'
     SHORT_DESC = 'An indicator if any relevant document is retrieved in the top k results.'
     SUPPORTED_PARAMS = {
@@ -1,22 +1,60 @@
-from ir_measures.providers.base import Provider, Evaluator, registry, register
-from ir_measures.providers.accuracy_provider import AccuracyProvider
+import importlib
+from ir_measures.providers.base import Provider, Evaluator, IncrementalEvaluation, LazyProvider, registry, register
 from ir_measures.providers.fallback_provider import FallbackProvider
-from ir_measures.providers.compat_provider import CompatProvider
-from ir_measures.providers.cwl_eval import CwlEvalProvider, CwlMetric
-from ir_measures.providers.pyndeval_provider import PyNdEvalProvider
-from ir_measures.providers.pytrec_eval_provider import PytrecEvalProvider
-from ir_measures.providers.judged_provider import JudgedProvider
-from ir_measures.providers.gdeval_provider import GdevalProvider
-from ir_measures.providers.trectools_provider import TrectoolsProvider
-from ir_measures.providers.msmarco_provider import MsMarcoProvider
-from ir_measures.providers.ranx_provider import RanxProvider
-from ir_measures.providers.runtime_provider import RuntimeProvider, define, define_byquery
+from ir_measures.providers.runtime_provider import RuntimeProvider, define, define_byquery, define_batched
+
+# Built-in providers are registered declaratively: a provider's module (and any third-party library it uses) is only
+# imported once a measure is routed to it. Each entry is name -> (module, names of the measures it supports). The
+# measure names must match the provider's SUPPORTED_MEASURES (this is checked in tests/test_providers.py).
+BUILTIN_PROVIDERS = {
+	'accuracy': ('ir_measures.providers.accuracy_provider', ['Accuracy']),
+	'compat': ('ir_measures.providers.compat_provider', ['Compat']),
+	'cwl_eval': ('ir_measures.providers.cwl_eval', ['AP', 'BPM', 'INSQ', 'INST', 'NERR10', 'NERR11', 'NERR8', 'NERR9', 'P', 'RBP', 'RR', 'SDCG']),
+	'pyndeval': ('ir_measures.providers.pyndeval_provider', ['AP_IA', 'ERR_IA', 'NRBP', 'P_IA', 'StRecall', 'alpha_DCG', 'alpha_nDCG', 'nERR_IA', 'nNRBP']),
+	'pytrec_eval': ('ir_measures.providers.pytrec_eval_provider', ['AP', 'Bpref', 'IPrec', 'NumQ', 'NumRel', 'NumRet', 'P', 'R', 'RR', 'Rprec', 'SetAP', 'SetF', 'SetP', 'SetR', 'Success', 'infAP', 'nDCG']),
+	'judged': ('ir_measures.providers.judged_provider', ['Judged']),
+	'gdeval': ('ir_measures.providers.gdeval_provider', ['ERR', 'nDCG']),
+	'trectools': ('ir_measures.providers.trectools_provider', ['AP', 'Bpref', 'P', 'RBP', 'RR', 'Rprec', 'nDCG']),
+	'msmarco': ('ir_measures.providers.msmarco_provider', ['RR']),
+	'native': ('ir_measures.providers.native_provider', ['AP', 'NumQ', 'NumRel', 'NumRet', 'P', 'R', 'RR', 'Rprec', 'SetAP', 'SetF', 'SetP', 'SetR', 'Success', 'nDCG']),
+	'ranx': ('ir_measures.providers.ranx_provider', ['AP', 'NumRet', 'P', 'R', 'RR', 'Rprec', 'SetP', 'SetR', 'Success', 'nDCG']),
+}
+for _name, (_module, _measure_names) in BUILTIN_PROVIDERS.items():
+	if _name not in registry:
+		register(LazyProvider(_name, _module, _measure_names))
+
+# classes (etc.) that are loaded from their modules on first access
+_LAZY_ATTRS = {
+	'AccuracyProvider': 'ir_measures.providers.accuracy_provider',
+	'CachedProvider': 'ir_measures.providers.cached_provider',
+	'ResultCache': 'ir_measures.providers.cached_provider',
+	'fingerprint_run': 'ir_measures.providers.cached_provider',
+	'fingerprint_qrels': 'ir_measures.providers.cached_provider',
+	'fingerprint_provider': 'ir_measures.providers.cached_provider',
+	'CompatProvider': 'ir_measures.providers.compat_provider',
+	'CwlEvalProvider': 'ir_measures.providers.cwl_eval',
+	'CwlMetric': 'ir_measures.providers.cwl_eval',
+	'PyNdEvalProvider': 'ir_measures.providers.pyndeval_provider',
+	'PytrecEvalProvider': 'ir_measures.providers.pytrec_eval_provider',
+	'JudgedProvider': 'ir_measures.providers.judged_provider',
+	'GdevalProvider': 'ir_measures.providers.gdeval_provider',
+	'TrectoolsProvider': 'ir_measures.providers.trectools_provider',
+	'MsMarcoProvider': 'ir_measures.providers.msmarco_provider',
+	'NativeProvider': 'ir_measures.providers.native_provider',
+	'DenseEvaluator': 'ir_measures.providers.native_provider',
+	'RanxProvider': 'ir_measures.providers.ranx_provider',
+}
+
+def __getattr__(name):
+	if name in _LAZY_ATTRS:
+		return getattr(importlib.import_module(_LAZY_ATTRS[name]), name)
+	raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 __all__ = [
 	'registry', 'register',
-	'Provider', 'Evaluator',
-	'AccuracyProvider', 'FallbackProvider', 'CompatProvider', 'CwlEvalProvider', 'CwlMetric', 'PyNdEvalProvider',
+	'Provider', 'Evaluator', 'IncrementalEvaluation', 'LazyProvider',
+	'AccuracyProvider', 'FallbackProvider', 'CachedProvider', 'ResultCache', 'fingerprint_run', 'fingerprint_qrels', 'fingerprint_provider', 'CompatProvider', 'CwlEvalProvider', 'CwlMetric', 'PyNdEvalProvider',
 	'PytrecEvalProvider', 'JudgedProvider', 'GdevalProvider', 'TrectoolsProvider', 'MsMarcoProvider',
-	'RanxProvider', 'RuntimeProvider',
-	'define', 'define_byquery',
+	'NativeProvider', 'DenseEvaluator', 'RanxProvider', 'RuntimeProvider',
+	'define', 'define_byquery', 'define_batched',
 ]
@@ -11,8 +11,11 @@ class AccuracyEvaluator(providers.Evaluator):
         self.qrels = qrels
         self.invocations = invocations
 
-    def iter_calc(self, run) -> Iterator['Metric']:
-        """Compute the metrics for the run, discarding topics with no relevant documents"""
+    def iter_calc(self, run, n_jobs=1) -> Iterator['Metric']:
+        """Compute the metrics for the run, discarding topics with no relevant documents (always runs serially)"""
+        return self._iter_calc(run)
+
+    def _iter_calc(self, run):
         run = ir_measures.util.RunConverter(run).as_sorteddict()
 
         for measure, cutoff, rel in self.invocations:
@@ -41,6 +44,7 @@ class AccuracyEvaluator(providers.Evaluator):
 class AccuracyProvider(providers.Provider):
     """Accuracy provider"""
     NAME = "accuracy"
+    INPUT_FORMAT = 'dict_of_dict'
     SUPPORTED_MEASURES = [
         _Accuracy(cutoff=Any(), rel=Any()),
     ]
@@ -1,9 +1,84 @@
+import os
 import warnings
+import importlib
 import contextlib
 import itertools
-from typing import Iterator, Iterable, Dict, Union, List
-from ir_measures.util import Metric, TYPE_QREL, TYPE_RUN, CalcResults
-from ir_measures.measures.base import Measure, _NOT_PROVIDED
+from typing import Iterator, Iterable, Dict, Union, List, Mapping, Optional, Hashable, Set, Sequence, Tuple
+import ir_measures
+from ir_measures.util import Metric, ScoredDoc, TYPE_QREL, TYPE_RUN, CalcResults, ColumnarQrels, ColumnarResults, ColumnarRun, RunConverter, is_columnar_file, read_run, read_trec_run
+from ir_measures.measures.base import Measure, MeanAgg, SumAgg, _NOT_PROVIDED
+
+
+# The state of the process pool that this (worker) process belongs to, e.g., the evaluator, measures, and the
+# runs/shards to evaluate. It is set in each worker by the pool's initializer (see _process_pool), never in the parent,
+# so pools started by different threads at once do not interfere.
+_POOL_STATE = None
+
+
+def _pool_context():
+    # Worker processes are forked, so that they inherit the pool's state (and with it the prepared qrels) rather than
+    # receiving a pickled copy. Forking is only used on Linux: elsewhere (e.g., on macOS) it is unsafe with some system
+    # libraries, so None is returned and the work is done serially.
+    import sys
+    import multiprocessing
+    if sys.platform.startswith('linux'):
+        return multiprocessing.get_context('fork')
+    return None
+
+
+def _process_pool(n_workers, state):
+    # A pool of n_workers forked processes whose _POOL_STATE is state. The state is passed as the initializer's
+    # arguments, which the forked workers inherit without pickling (measures from ir_measures.define, for instance, are
+    # not necessarily picklable).
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(n_workers, mp_context=_pool_context(), initializer=_init_pool_worker, initargs=(state,))
+
+
+def _init_pool_worker(state):
+    global _POOL_STATE
+    _POOL_STATE = state
+
+
+def _n_jobs(n_jobs: Optional[int]) -> int:
+    if n_jobs is None or n_jobs < 1:
+        return os.cpu_count() or 1
+    return n_jobs
+
+
+def _pool_calc(idx):
+    # Measures are not necessarily picklable (e.g., those from ir_measures.define), so results are sent back to the
+    # parent process keyed by the measure's position in the measure list.
+    evaluator, measures, runs, per_query = _POOL_STATE
+    run = read_run(runs[idx])
+    if not per_query:
+        aggregated = evaluator.calc_aggregate(run)
+        return [aggregated[m] for m in measures], None
+    measure_idxs = {m: i for i, m in enumerate(measures)}
+    result = evaluator.calc(run)
+    return [result.aggregated[m] for m in measures], [(m.query_id, measure_idxs[m.measure], m.value) for m in result.per_query]
+
+
+def _pool_shard(idx):
+    # Evaluates the queries assigned to shard idx. Metrics for queries outside the shard (e.g., defaults filled in by
+    # sub-evaluators) are dropped; the parent fills in queries missing from the run entirely.
+    evaluator, measures, run, query_shards = _POOL_STATE
+    np = ir_measures.lazylibs.numpy()
+    mask = query_shards[run.query_codes] == idx
+    shard = ColumnarRun(run.query_ids, run.doc_ids, run.query_codes[mask], run.doc_codes[mask], run.scores[mask])
+    shard_qids = set(run.query_ids[np.flatnonzero(query_shards == idx)].tolist())
+    measure_idxs = {m: i for i, m in enumerate(measures)}
+    return [(m.query_id, measure_idxs[m.measure], m.value) for m in evaluator.iter_calc(shard) if m.query_id in shard_qids]
+
+
+def _metric_columns(metrics: Iterable[Metric]) -> Iterator[Tuple[Measure, List[str], List[float]]]:
+    # groups metrics into (measure, query_ids, values) columns
+    columns: Dict[Measure, Tuple[List[str], List[float]]] = {}
+    for metric in metrics:
+        query_ids, values = columns.setdefault(metric.measure, ([], []))
+        query_ids.append(metric.query_id)
+        values.append(metric.value)
+    for measure, (query_ids, values) in columns.items():
+        yield measure, query_ids, values
 
 
 class Evaluator:
@@ -15,12 +90,18 @@ class Evaluator:
         self.measures = measures
         self.qrel_qids = qrel_qids
 
-    def iter_calc(self, run: TYPE_RUN) -> Iterator[Metric]:
+    def iter_calc(self, run: TYPE_RUN, n_jobs: Optional[int] = 1) -> Iterator[Metric]:
         """
         Yields per-topic metrics this run.
+
+        With ``n_jobs`` other than 1, the run is split by query into ``n_jobs`` shards that are evaluated in parallel
+        worker processes (``None`` or ``-1`` uses all CPUs). The per-query values are identical to those of the serial
+        path; metrics are yielded shard-by-shard, in the order that queries first appear in the run.
         """
         expected_measure_qids = set(itertools.product(self.measures, self.qrel_qids))
-        for metric in self._iter_calc(run):
+        n_jobs = _n_jobs(n_jobs)
+        metrics = self._iter_calc(run) if n_jobs == 1 or _pool_context() is None else self._iter_calc_sharded(run, n_jobs)
+        for metric in metrics:
             expected_measure_qids.discard((metric.measure, metric.query_id))
             yield metric
         for measure, query_id in sorted(expected_measure_qids, key=lambda x: (str(x[0]), x[1])):
@@ -29,27 +110,281 @@ class Evaluator:
     def _iter_calc(self, run: TYPE_RUN) -> Iterator[Metric]:
         raise NotImplementedError()
 
-    def calc_aggregate(self, run: TYPE_RUN) -> Dict[Measure, Union[float, int]]:
+    def _iter_columns(self, run: TYPE_RUN) -> Iterator[Tuple[Measure, Sequence[str], Sequence[float]]]:
+        # Yields (measure, query_ids, values) for calc(run, columnar=True). Evaluators that compute arrays of values
+        # can override this to avoid building a Metric object for each value.
+        return _metric_columns(self._iter_calc(run))
+
+    def iter_calc_stream(self, run: Union[str, Iterable[ScoredDoc]], batch_size: int = 10_000) -> Iterator[Metric]:
+        """
+        Yields per-topic metrics for a run that is grouped by ``query_id`` (as TREC run files usually are), without
+        holding the whole run in memory.
+
+        The run (or the path to a run file) is read lazily and evaluated in batches of whole queries: once a batch
+        reaches ``batch_size`` rows, it is evaluated and then dropped. Peak memory therefore scales with
+        ``batch_size`` plus the size of the largest query, rather than with the size of the run. Use ``batch_size=1``
+        to evaluate one query at a time.
+
+        Raises a ``ValueError`` if a ``query_id`` appears again after the run moved on to another query.
+        """
+        if isinstance(run, str):
+            run = ColumnarRun.load(run) if is_columnar_file(run) else read_trec_run(run)
+        qrel_qids = set(self.qrel_qids)
+        seen_qids = set()
+        batch: List[ScoredDoc] = []
+        for query_id, docs in itertools.groupby(RunConverter(run).as_namedtuple_iter(), key=lambda doc: doc.query_id):
+            if query_id in seen_qids:
+                raise ValueError(f'run is not grouped by query_id: query {query_id!r} appears again after other queries. '
+                                 'Sort the run by query_id or use iter_calc instead.')
+            seen_qids.add(query_id)
+            batch.extend(docs)
+            if len(batch) >= batch_size:
+                yield from self._iter_calc_batch(batch, qrel_qids)
+                batch = []
+        if batch:
+            yield from self._iter_calc_batch(batch, qrel_qids)
+        for measure, query_id in sorted(itertools.product(self.measures, qrel_qids - seen_qids), key=lambda x: (str(x[0]), x[1])):
+            yield Metric(query_id=query_id, measure=measure, value=measure.DEFAULT)
+
+    def _iter_calc_batch(self, batch: List[ScoredDoc], qrel_qids: Set[str]) -> Iterator[Metric]:
+        # evaluates a batch of complete queries from iter_calc_stream, filling in missing values for its queries only
+        batch_qids = {doc.query_id for doc in batch}
+        expected_measure_qids = set(itertools.product(self.measures, batch_qids & qrel_qids))
+        for metric in self._iter_calc(batch):
+            if metric.query_id in batch_qids:
+                expected_measure_qids.discard((metric.measure, metric.query_id))
+                yield metric
+        for measure, query_id in sorted(expected_measure_qids, key=lambda x: (str(x[0]), x[1])):
+            yield Metric(query_id=query_id, measure=measure, value=measure.DEFAULT)
+
+    def _iter_calc_sharded(self, run: TYPE_RUN, n_jobs: int) -> Iterator[Metric]:
+        np = ir_measures.lazylibs.numpy()
+        run = RunConverter(run).as_columnar()
+        # Assign contiguous ranges of queries (in order of first appearance) to shards of roughly equal numbers of rows
+        query_codes, first_rows = np.unique(run.query_codes, return_index=True)
+        query_codes = query_codes[np.argsort(first_rows)]
+        n_shards = min(n_jobs, len(query_codes))
+        if n_shards <= 1:
+            yield from self._iter_calc(run)
+            return
+        query_rows = np.bincount(run.query_codes, minlength=len(run.query_ids))[query_codes]
+        rows_before = np.cumsum(query_rows) - query_rows
+        query_shards = np.full(len(run.query_ids), -1, dtype=np.int64)
+        query_shards[query_codes] = rows_before * n_shards // len(run)
+        measures = list(self.measures)
+        with _process_pool(n_shards, (self, measures, run, query_shards)) as pool:
+            outputs = list(pool.map(_pool_shard, range(n_shards)))
+        for output in outputs:
+            for query_id, measure_idx, value in output:
+                yield Metric(query_id=query_id, measure=measures[measure_idx], value=value)
+
+    def calc_aggregate(self, run: TYPE_RUN, n_jobs: Optional[int] = 1) -> Dict[Measure, Union[float, int]]:
         """
         Returns aggregated measure values for this run.
+
+        See :meth:`iter_calc` for details about ``n_jobs``.
         """
         aggregators = {m: m.aggregator() for m in self.measures}
-        for metric in self.iter_calc(run):
+        for metric in self.iter_calc(run, n_jobs=n_jobs):
             aggregators[metric.measure].add(metric.value)
         return {m: agg.result() for m, agg in aggregators.items()}
 
-    def calc(self, run: TYPE_RUN) -> CalcResults:
+    def calc(self, run: TYPE_RUN, n_jobs: Optional[int] = 1, columnar: bool = False) -> CalcResults:
         """
         Returns aggregated and per-query results for this run.
+
+        With ``columnar=True``, the per-query results are a :class:`~ir_measures.ColumnarResults` (a matrix of
+        values, with ``to_pandas()`` and ``to_numpy()``) rather than a list of :class:`~ir_measures.Metric`, which is
+        much smaller and faster to build when there are many queries and measures.
+
+        See :meth:`iter_calc` for details about ``n_jobs``.
         """
+        if columnar:
+            return self._calc_columnar(run, n_jobs)
         aggregators = {m: m.aggregator() for m in self.measures}
         metrics = []
-        for metric in self.iter_calc(run):
+        for metric in self.iter_calc(run, n_jobs=n_jobs):
             aggregators[metric.measure].add(metric.value)
             metrics.append(metric)
         agg = {m: agg.result() for m, agg in aggregators.items()}
         return CalcResults(agg, metrics)
 
+    def _calc_columnar(self, run, n_jobs):
+        if _n_jobs(n_jobs) == 1:
+            columns = self._iter_columns(run)
+        else:
+            columns = _metric_columns(self.iter_calc(run, n_jobs=n_jobs))
+        results = ColumnarResults.from_columns(self.measures, columns, self.qrel_qids)
+        aggregated = {}
+        for measure, present in zip(results.measures, results.present.T):
+            values = results[measure][present]
+            aggregator = measure.aggregator()
+            if type(aggregator) is MeanAgg:
+                aggregated[measure] = float(values.sum() / len(values)) if len(values) else aggregator.default
+            elif type(aggregator) is SumAgg:
+                aggregated[measure] = values.sum().item()
+            else:
+                for value in values.tolist():
+                    aggregator.add(value)
+                aggregated[measure] = aggregator.result()
+        return CalcResults(aggregated, results)
+
+    def update_qrels(self, qrels: TYPE_QREL) -> Set[str]:
+        """
+        Adds new judgments to the qrels of this evaluator, in place, and returns the IDs of the affected queries. A
+        judgment of a (query, document) pair that is already judged replaces the existing one.
+
+        This is much cheaper than building a new evaluator when judgments arrive in batches (e.g., during active
+        judging): only the structures of the affected queries are updated where the provider supports it, and cached
+        results (see :class:`~ir_measures.providers.CachedProvider`) of the other queries remain valid. Evaluators from
+        ``ir_measures.evaluator()`` that use several providers also rebuild the evaluators of providers that do not
+        support this, as long as the qrels were not given as an iterator.
+        """
+        raise NotImplementedError(f'{type(self).__name__} does not support updating its qrels; build a new evaluator instead')
+
+    def incremental(self, results: Union[CalcResults, Iterable[Metric]]) -> 'IncrementalEvaluation':
+        """
+        Returns an :class:`~ir_measures.providers.IncrementalEvaluation` that starts from the results of a previous
+        :meth:`calc` (or its per-query metrics) and re-evaluates only the queries that change::
+
+            incremental = evaluator.incremental(evaluator.calc(run))
+            incremental.update(reranked_subset, removed=['q7'])
+            incremental.aggregated
+        """
+        return IncrementalEvaluation(self, results)
+
+    def calc_many(self, runs: Union[Mapping[Hashable, TYPE_RUN], Iterable[TYPE_RUN]], n_jobs: Optional[int] = 1) -> Dict[Hashable, CalcResults]:
+        """
+        Returns aggregated and per-query results for each of several runs, keyed by run name.
+
+        ``runs`` is either a mapping of run name to run, or a sequence of runs (in which case results are keyed by
+        position). Runs can also be given as paths to run files, which are read in the worker process.
+
+        With ``n_jobs`` other than 1, the runs are spread across a pool of ``n_jobs`` worker processes (``None`` or
+        ``-1`` uses all CPUs). Workers are forked from this process, so the qrels are prepared only once, when this
+        evaluator was built. On platforms other than Linux, the runs are evaluated serially.
+        """
+        return self._calc_many(runs, n_jobs, per_query=True)
+
+    def calc_aggregate_many(self, runs: Union[Mapping[Hashable, TYPE_RUN], Iterable[TYPE_RUN]], n_jobs: Optional[int] = 1) -> Dict[Hashable, Dict[Measure, Union[float, int]]]:
+        """
+        Returns aggregated measure values for each of several runs, keyed by run name.
+
+        Accepts the same arguments as :meth:`calc_many`.
+        """
+        return self._calc_many(runs, n_jobs, per_query=False)
+
+    def _calc_many(self, runs, n_jobs, per_query):
+        if isinstance(runs, Mapping):
+            names, run_list = list(runs.keys()), list(runs.values())
+        else:
+            run_list = list(runs)
+            names = list(range(len(run_list)))
+        n_jobs = min(_n_jobs(n_jobs), len(run_list))
+        if n_jobs <= 1 or _pool_context() is None:
+            if per_query:
+                return {name: self.calc(read_run(run)) for name, run in zip(names, run_list)}
+            return {name: self.calc_aggregate(read_run(run)) for name, run in zip(names, run_list)}
+        measures = list(self.measures)
+        with _process_pool(n_jobs, (self, measures, run_list, per_query)) as pool:
+            outputs = list(pool.map(_pool_calc, range(len(run_list))))
+        results = {}
+        for name, (aggregated, metrics) in zip(names, outputs):
+            aggregated = dict(zip(measures, aggregated))
+            if per_query:
+                results[name] = CalcResults(aggregated, [Metric(query_id=qid, measure=measures[m], value=value) for qid, m, value in metrics])
+            else:
+                results[name] = aggregated
+        return results
+
+
+def _updates_qrels(evaluator: Evaluator) -> bool:
+    # whether an evaluator can update its qrels in place
+    return type(evaluator).update_qrels is not Evaluator.update_qrels
+
+
+def _qrels_query_ids(qrels: ColumnarQrels) -> Set[str]:
+    np = ir_measures.lazylibs.numpy()
+    return set(qrels.query_ids[np.unique(qrels.query_codes)].tolist())
+
+
+class IncrementalEvaluation:
+    """
+    The per-query and aggregated results of a run that is changed a few queries at a time, from
+    :meth:`Evaluator.incremental() <ir_measures.providers.Evaluator.incremental>`.
+
+    :meth:`update` evaluates only the queries that changed. Aggregators that support ``remove()`` (those of
+    :class:`~ir_measures.measures.base.MeanAgg` and :class:`~ir_measures.measures.base.SumAgg`, i.e., nearly all
+    measures) are patched with the difference; others are rebuilt from the stored per-query values. Patched means can
+    differ from a full re-evaluation by floating point rounding.
+    """
+    def __init__(self, evaluator: Evaluator, results: Union[CalcResults, Iterable[Metric]]):
+        self.evaluator = evaluator
+        self.measures = list(evaluator.measures)
+        self.qrel_qids = set(evaluator.qrel_qids)
+        if isinstance(results, CalcResults):
+            results = results.per_query
+        self._values: Dict[str, Dict[Measure, Union[float, int]]] = {} # query_id -> measure -> value
+        for metric in results:
+            self._values.setdefault(metric.query_id, {})[metric.measure] = metric.value
+        self._aggregators = {m: m.aggregator() for m in self.measures}
+        for values in self._values.values():
+            for measure, value in values.items():
+                if measure in self._aggregators:
+                    self._aggregators[measure].add(value)
+
+    @property
+    def aggregated(self) -> Dict[Measure, Union[float, int]]:
+        return {m: agg.result() for m, agg in self._aggregators.items()}
+
+    @property
+    def per_query(self) -> List[Metric]:
+        return [Metric(query_id, measure, value) for query_id, values in self._values.items() for measure, value in values.items()]
+
+    @property
+    def results(self) -> CalcResults:
+        return CalcResults(self.aggregated, self.per_query)
+
+    def update(self, run: TYPE_RUN = (), removed: Iterable[str] = ()) -> Dict[Measure, Union[float, int]]:
+        """
+        Replaces the rankings of the queries in ``run`` (which must contain every document of each of its queries;
+        queries not seen before are added) and removes the rankings of the queries in ``removed``. Removed queries
+        that are in the qrels get the default value of each measure, like queries missing from a run. Returns the
+        updated aggregated results.
+        """
+        np = ir_measures.lazylibs.numpy()
+        run = RunConverter(run).as_columnar()
+        changed = set(run.query_ids[np.unique(run.query_codes)].tolist())
+        removed = set(removed)
+        if changed & removed:
+            raise ValueError(f'queries cannot be both updated and removed: {sorted(changed & removed)}')
+        new_values: Dict[str, Dict[Measure, Union[float, int]]] = {}
+        if changed:
+            for metric in self.evaluator._iter_calc_batch(run, self.qrel_qids):
+                new_values.setdefault(metric.query_id, {})[metric.measure] = metric.value
+        for query_id in removed & self.qrel_qids:
+            new_values[query_id] = {m: m.DEFAULT for m in self.measures}
+        rebuild = set()
+        for query_id in changed | removed:
+            old = self._values.pop(query_id, {})
+            new = new_values.get(query_id, {})
+            for measure, aggregator in self._aggregators.items():
+                if measure in old:
+                    if hasattr(aggregator, 'remove'):
+                        aggregator.remove(old[measure])
+                    else:
+                        rebuild.add(measure)
+                if measure in new:
+                    aggregator.add(new[measure])
+            if new:
+                self._values[query_id] = new
+        for measure in rebuild:
+            aggregator = self._aggregators[measure] = measure.aggregator()
+            for values in self._values.values():
+                if measure in values:
+                    aggregator.add(values[measure])
+        return self.aggregated
+
 
 class Provider:
     """
@@ -61,6 +396,24 @@ class Provider:
     NAME: str
     SUPPORTED_MEASURES: List[Measure] = []
 
+    # Rough, relative cost estimates (in approximately microseconds), used by
+    # :class:`~ir_measures.providers.FallbackProvider` to decide which provider should calculate each measure. See
+    # :meth:`estimate_cost`.
+    INPUT_FORMAT: str = 'namedtuple_iter' # the format the provider converts the run and qrels to
+    COST_SETUP: float = 100. # fixed cost of an evaluation
+    COST_PER_PASS: float = 0. # fixed cost of each pass over the data (e.g., starting a process)
+    COST_PER_ROW: float = 1. # cost of each input row, in each pass
+
+    # The names of other providers that give the same values (up to floating-point rounding) for every measure that both
+    # support, so :class:`~ir_measures.providers.FallbackProvider` may use either of them (whichever is cheaper)
+    EQUIVALENT_TO: Tuple[str, ...] = ()
+
+    # Whether a document that appears more than once for a query counts only once, by its last row (as when the run is
+    # read into a dict-of-dict). Only then may :class:`~ir_measures.providers.FallbackProvider` give the provider a run
+    # that is de-duplicated and cut to the depth its measures look at (see
+    # :meth:`ColumnarRun.top_k() <ir_measures.util.ColumnarRun.top_k>`).
+    DEDUPLICATES_RUN: bool = False
+
     def __init__(self):
         self._is_available = None
 
@@ -107,11 +460,12 @@ class Provider:
         """
         return self.evaluator(measures, qrels).calc_aggregate(run)
 
-    def calc(self, measures: Iterable[Measure], qrels: TYPE_QREL, run:TYPE_RUN) -> CalcResults:
+    def calc(self, measures: Iterable[Measure], qrels: TYPE_QREL, run:TYPE_RUN, columnar: bool = False) -> CalcResults:
         """
-        Returns aggregated and per-query results for these measures, qrels, and run.
+        Returns aggregated and per-query results for these measures, qrels, and run. See
+        :meth:`Evaluator.calc() <ir_measures.providers.Evaluator.calc>` for ``columnar``.
         """
-        return self.evaluator(measures, qrels).calc(run)
+        return self.evaluator(measures, qrels).calc(run, columnar=columnar)
 
     def supports(self, measure) -> bool:
         measure.validate_params()
@@ -126,6 +480,20 @@ class Provider:
                     return True
         return False
 
+    def estimate_cost(self, measures: Iterable[Measure], num_rows: int) -> float:
+        """
+        Returns a rough estimate of the cost of calculating these measures over inputs of about ``num_rows`` rows,
+        not counting the cost of converting the inputs to :attr:`INPUT_FORMAT`.
+
+        By default, this is ``COST_SETUP + passes * (COST_PER_PASS + COST_PER_ROW * num_rows)``, where ``passes`` is
+        given by :meth:`_num_passes`.
+        """
+        return self.COST_SETUP + self._num_passes(measures) * (self.COST_PER_PASS + self.COST_PER_ROW * num_rows)
+
+    def _num_passes(self, measures: Iterable[Measure]) -> int:
+        # the number of passes over the data needed for these measures; by default, one per measure
+        return len(list(measures))
+
     def is_available(self) -> bool:
         if self._is_available is not None:
             return self._is_available
@@ -209,6 +577,94 @@ class Choices:
 
 NOT_PROVIDED: Any = _NOT_PROVIDED
 
+class LazyProvider(Provider):
+    """
+    Stands in for a registered provider whose module has not been imported yet.
+
+    The module (which registers the real provider when imported) is only loaded once the provider is needed. If
+    ``measure_names`` is given, :meth:`supports` can rule out other measures without loading the module at all.
+    """
+    def __init__(self, name: str, module: str, measure_names: Optional[Iterable[str]] = None):
+        super().__init__()
+        self.NAME = name
+        self.module = module
+        self.measure_names = frozenset(measure_names) if measure_names is not None else None
+        self._provider: Optional[Provider] = None
+
+    def load(self) -> Provider:
+        """Imports the provider's module and returns the provider it registered."""
+        if self._provider is None:
+            importlib.import_module(self.module)
+            provider = registry.get(self.NAME)
+            if provider is None or provider is self:
+                raise RuntimeError(f'{self.module} did not register a provider named {self.NAME}')
+            self._provider = provider
+        return self._provider
+
+    @property
+    def SUPPORTED_MEASURES(self): # type: ignore
+        return self.load().SUPPORTED_MEASURES
+
+    def supports(self, measure) -> bool:
+        if self.measure_names is not None and measure.NAME not in self.measure_names:
+            return False
+        return self.load().supports(measure)
+
+    @property
+    def INPUT_FORMAT(self): # type: ignore
+        return self.load().INPUT_FORMAT
+
+    @property
+    def EQUIVALENT_TO(self): # type: ignore
+        return self.load().EQUIVALENT_TO
+
+    @property
+    def DEDUPLICATES_RUN(self): # type: ignore
+        return self.load().DEDUPLICATES_RUN
+
+    def estimate_cost(self, measures: Iterable[Measure], num_rows: int) -> float:
+        return self.load().estimate_cost(measures, num_rows)
+
+    def is_available(self) -> bool:
+        return self.load().is_available()
+
+    def initialize(self):
+        return self.load().initialize()
+
+    def install_instructions(self):
+        return self.load().install_instructions()
+
+    def evaluator(self, measures: Iterable[Measure], qrels: TYPE_QREL) -> Evaluator:
+        return self.load().evaluator(measures, qrels)
+
+    def _evaluator(self, measures: Iterable[Measure], qrels: TYPE_QREL):
+        return self.load()._evaluator(measures, qrels)
+
+    def iter_calc(self, measures: Iterable[Measure], qrels : TYPE_QREL, run: TYPE_RUN) -> Iterator[Metric]:
+        return self.load().iter_calc(measures, qrels, run)
+
+    def calc_aggregate(self, measures: Iterable[Measure], qrels: TYPE_QREL, run: TYPE_RUN) -> Dict[Measure, Union[float, int]]:
+        return self.load().calc_aggregate(measures, qrels, run)
+
+    def calc(self, measures: Iterable[Measure], qrels: TYPE_QREL, run:TYPE_RUN, columnar: bool = False) -> CalcResults:
+        return self.load().calc(measures, qrels, run, columnar=columnar)
+
+    def run_inputs(self, measures: Iterable[Measure]) -> List[str]:
+        return self.load().run_inputs(measures)
+
+    def qrel_inputs(self, measures: Iterable[Measure]) -> List[str]:
+        return self.load().qrel_inputs(measures)
+
+    def __getattr__(self, key):
+        # only called for attributes not found normally, e.g., provider-specific ones
+        if key.startswith('__') or key in ('_provider', 'module', 'NAME'):
+            raise AttributeError(key)
+        return getattr(self.load(), key)
+
+    def __repr__(self):
+        return f'LazyProvider({self.NAME!r}, {self.module!r})'
+
+
 registry: Dict[str,Provider] = {}
 
 def register(provider):
@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import inspect
+import hashlib
+from typing import Iterable, List, Optional, Union
+import ir_measures
+from ir_measures import providers, Metric
+from ir_measures.util import ColumnarRun, QrelsConverter, RunConverter, TYPE_QREL, TYPE_RUN
+from ir_measures.measures.base import Measure
+
+
+def _fingerprint(kind, id_columns, value_columns):
+    # A content hash that does not depend on the order of the rows or on how the IDs happened to be interned. Rows are
+    # sorted by their IDs (stably, so the relative order of duplicate entries is kept).
+    np = ir_measures.lazylibs.numpy()
+    h = hashlib.sha256(kind.encode())
+    row_keys = []
+    for table, codes in id_columns:
+        table = ir_measures.util._object_array([str(i) for i in table])
+        order = np.argsort(table, kind='stable')
+        rank = np.empty(len(table), dtype=np.int64)
+        rank[order] = np.arange(len(table))
+        h.update('\x00'.join(table[order].tolist()).encode())
+        h.update(b'\x01')
+        row_keys.append(rank[codes] if len(codes) else np.empty(0, dtype=np.int64))
+    rows = np.lexsort(row_keys[::-1]) if row_keys and len(row_keys[0]) else np.empty(0, dtype=np.int64)
+    for column in row_keys + [np.asarray(v) for v in value_columns]:
+        h.update(np.ascontiguousarray(column[rows]).tobytes())
+    return h.hexdigest()
+
+
+def fingerprint_run(run: TYPE_RUN) -> str:
+    """Returns a content hash of ``run`` that does not depend on its format or the order of its rows."""
+    np = ir_measures.lazylibs.numpy()
+    run = RunConverter(run).as_columnar()
+    return _fingerprint('run', [(run.query_ids, run.query_codes), (run.doc_ids, run.doc_codes)], [run.scores.astype(np.float64)])
+
+
+def fingerprint_qrels(qrels: TYPE_QREL) -> str:
+    """Returns a content hash of ``qrels`` that does not depend on its format or the order of its rows."""
+    np = ir_measures.lazylibs.numpy()
+    qrels = QrelsConverter(qrels).as_columnar()
+    id_columns = [(qrels.query_ids, qrels.query_codes), (qrels.doc_ids, qrels.doc_codes)]
+    if qrels.iterations is not None:
+        id_columns.append((qrels.iterations, qrels.iteration_codes))
+    return _fingerprint('qrels', id_columns, [qrels.relevance.astype(np.int64)])
+
+
+def fingerprint_provider(provider: providers.Provider) -> str:
+    """
+    Returns a string that identifies ``provider`` and the configuration that can change its values, such as its
+    ``engine``: its name, and the constructor arguments that are not left at their defaults (the providers of a
+    :class:`~ir_measures.providers.FallbackProvider` are included in order). Registered providers are not loaded.
+    """
+    if isinstance(provider, providers.LazyProvider):
+        if provider._provider is None:
+            return provider.NAME # the registered instance, which is built with the default configuration
+        provider = provider._provider
+    params = []
+    for name, param in inspect.signature(type(provider).__init__).parameters.items():
+        if name == 'self' or not hasattr(provider, name):
+            continue
+        value = getattr(provider, name)
+        if isinstance(value, providers.Provider):
+            params.append(f'{name}={fingerprint_provider(value)}')
+        elif isinstance(value, (list, tuple)) and all(isinstance(v, providers.Provider) for v in value):
+            params.append(f'{name}=[{",".join(fingerprint_provider(v) for v in value)}]')
+        elif isinstance(value, (str, int, float, bool)) and value != param.default:
+            params.append(f'{name}={value!r}')
+    name = getattr(provider, 'NAME', type(provider).__name__)
+    return f'{name}({", ".join(params)})' if params else name
+
+
+def _cacheable(measure) -> bool:
+    # measures defined at runtime are only identified by their name, so those without an explicit one (e.g., lambdas,
+    # which are all named '<lambda>') could be confused with each other
+    return not hasattr(measure, 'runtime_impl') or measure.NAMED
+
+
+class ResultCache:
+    """
+    A persistent store of per-query measure values, kept in an SQLite database at ``path``.
+
+    Entries are keyed by the provider that computed them (see :func:`fingerprint_provider`), the content hashes of the
+    run and qrels (see :func:`fingerprint_run` and :func:`fingerprint_qrels`), and the measure's string
+    representation. When the stored values exceed ``max_size``
+    bytes, the least recently used entries are evicted. Note that measures built with
+    :func:`~ir_measures.define` are identified only by their name, so entries should be invalidated if their
+    implementation changes. Such measures are not cached unless they are given a name explicitly.
+    """
+    def __init__(self, path: str, max_size: Optional[int] = 2**30):
+        self.path = path
+        self.max_size = max_size
+        self._conn = None
+        self._conn_pid = None
+
+    @property
+    def conn(self):
+        # sqlite connections cannot be shared across forked processes, so open a new one if needed
+        if self._conn is None or self._conn_pid != os.getpid():
+            import sqlite3
+            self._conn = sqlite3.connect(self.path, isolation_level=None)
+            self._conn_pid = os.getpid()
+            columns = [row[1] for row in self._conn.execute('PRAGMA table_info(results)')]
+            if columns and 'provider' not in columns:
+                # written before entries were keyed by provider, so it is not known which provider computed them
+                self._conn.execute('DROP TABLE results')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS results (provider TEXT, run TEXT, qrels TEXT, measure TEXT, value BLOB, size INTEGER, last_used REAL, PRIMARY KEY (provider, run, qrels, measure))')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+        return self._conn
+
+    def get(self, provider_fingerprint: str, run_fingerprint: str, qrels_fingerprint: str, measures: Iterable[Measure]):
+        """Returns a dict of measure -> list of (query_id, value) for the measures found in the cache."""
+        measures_by_repr = {repr(m): m for m in measures}
+        result = {}
+        with self.conn:
+            for measure_str, value in self.conn.execute(f'SELECT measure, value FROM results WHERE provider=? AND run=? AND qrels=? AND measure IN ({",".join("?" * len(measures_by_repr))})', [provider_fingerprint, run_fingerprint, qrels_fingerprint, *measures_by_repr]):
+                result[measures_by_repr[measure_str]] = [tuple(r) for r in json.loads(value)]
+            if result:
+                self.conn.execute(f'UPDATE results SET last_used=? WHERE provider=? AND run=? AND qrels=? AND measure IN ({",".join("?" * len(result))})', [time.time(), provider_fingerprint, run_fingerprint, qrels_fingerprint, *(repr(m) for m in result)])
+        return result
+
+    def put(self, provider_fingerprint: str, run_fingerprint: str, qrels_fingerprint: str, values):
+        """Stores values, a dict of measure -> list of (query_id, value), and evicts old entries if needed."""
+        now = time.time()
+        with self.conn:
+            for measure, per_query in values.items():
+                value = json.dumps(per_query).encode()
+                self.conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)', (provider_fingerprint, run_fingerprint, qrels_fingerprint, repr(measure), value, len(value), now))
+        self._evict()
+
+    def _evict(self):
+        if self.max_size is None:
+            return
+        with self.conn:
+            total, = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()
+            if total <= self.max_size:
+                return
+            to_delete = []
+            for rowid, size in self.conn.execute('SELECT rowid, size FROM results ORDER BY last_used'):
+                if total <= self.max_size:
+                    break
+                to_delete.append((rowid,))
+                total -= size
+            self.conn.executemany('DELETE FROM results WHERE rowid=?', to_delete)
+
+    def invalidate(self, run: Optional[TYPE_RUN] = None, qrels: Optional[TYPE_QREL] = None, measures: Optional[Iterable[Measure]] = None, provider: Optional[providers.Provider] = None):
+        """
+        Removes the entries that match all of the given run, qrels, measures, and provider. For instance,
+        ``cache.invalidate(qrels=qrels)`` removes everything computed with these qrels. With no arguments, the entire
+        cache is cleared.
+        """
+        conditions, args = [], []
+        if provider is not None:
+            conditions.append('provider=?')
+            args.append(fingerprint_provider(provider))
+        if run is not None:
+            conditions.append('run=?')
+            args.append(fingerprint_run(run))
+        if qrels is not None:
+            conditions.append('qrels=?')
+            args.append(fingerprint_qrels(qrels))
+        if measures is not None:
+            measure_strs = [repr(m) for m in measures]
+            conditions.append(f'measure IN ({",".join("?" * len(measure_strs))})')
+            args.extend(measure_strs)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        with self.conn:
+            self.conn.execute(f'DELETE FROM results{where}', args)
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        self.invalidate()
+
+    def size(self) -> int:
+        """Returns the total size (in bytes) of the stored values."""
+        return self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+
+class CachedProvider(providers.Provider):
+    """
+    Wraps another provider (e.g., ``ir_measures.DefaultPipeline``) so that per-query results are stored in a
+    :class:`ResultCache`. Only the measures that are not already cached for a given run and qrels are computed::
+
+        cached = ir_measures.providers.CachedProvider(ir_measures.DefaultPipeline, 'results.sqlite')
+        cached.calc_aggregate([nDCG@10, P@5], qrels, run)
+    """
+    NAME = 'cached'
+
+    def __init__(self, provider: providers.Provider, cache: Union[str, ResultCache], max_size: Optional[int] = 2**30):
+        super().__init__()
+        self.provider = provider
+        self.cache = cache if isinstance(cache, ResultCache) else ResultCache(cache, max_size=max_size)
+
+    @property
+    def SUPPORTED_MEASURES(self):
+        return self.provider.SUPPORTED_MEASURES
+
+    def supports(self, measure) -> bool:
+        return self.provider.supports(measure)
+
+    def is_available(self) -> bool:
+        return self.provider.is_available()
+
+    def install_instructions(self):
+        return self.provider.install_instructions()
+
+    def _evaluator(self, measures, qrels):
+        measures = list(measures)
+        for measure in measures:
+            if not self.provider.supports(measure):
+                raise ValueError(f'unsupported measure {measure}')
+        return CachedEvaluator(self.provider, measures, QrelsConverter(qrels).as_columnar(), self.cache)
+
+    def run_inputs(self, measures: Iterable[Measure]) -> List[str]:
+        return self.provider.run_inputs(measures)
+
+    def qrel_inputs(self, measures: Iterable[Measure]) -> List[str]:
+        return self.provider.qrel_inputs(measures)
+
+
+class CachedEvaluator(providers.Evaluator):
+    def __init__(self, provider, measures, qrels, cache):
+        super().__init__(measures, set(qrels.query_ids.tolist()))
+        self.provider = provider
+        self.provider_fingerprint = fingerprint_provider(provider)
+        self.qrels = qrels
+        self.qrels_fingerprint = fingerprint_qrels(qrels)
+        self.cache = cache
+        self._evaluators = {}
+        # (fingerprint, affected query_ids) of the qrels before each update_qrels, most recent first: values cached
+        # for those qrels are still valid for the queries that were not affected since
+        self._previous_qrels = []
+
+    def update_qrels(self, qrels):
+        qrels = QrelsConverter(qrels).as_columnar()
+        query_ids = providers.base._qrels_query_ids(qrels)
+        self._previous_qrels = [(self.qrels_fingerprint, set(query_ids))] + [(f, affected | query_ids) for f, affected in self._previous_qrels]
+        self.qrels = self.qrels.update(qrels)
+        self.qrels_fingerprint = fingerprint_qrels(self.qrels)
+        self.qrel_qids = set(self.qrels.query_ids.tolist())
+        for key, evaluator in list(self._evaluators.items()):
+            if providers.base._updates_qrels(evaluator):
+                evaluator.update_qrels(qrels)
+            else:
+                del self._evaluators[key] # rebuilt with the updated qrels when next needed
+        return query_ids
+
+    def iter_calc(self, run: TYPE_RUN, n_jobs: Optional[int] = 1):
+        run = RunConverter(run).as_columnar()
+        run_fingerprint = fingerprint_run(run)
+        cacheable = [m for m in self.measures if _cacheable(m)]
+        values = self.cache.get(self.provider_fingerprint, run_fingerprint, self.qrels_fingerprint, cacheable) if cacheable else {}
+        missing = [m for m in self.measures if m not in values]
+        if missing:
+            computed = self._from_previous_qrels(run, run_fingerprint, [m for m in missing if _cacheable(m)], n_jobs)
+            missing = [m for m in missing if m not in computed]
+            if missing:
+                computed.update({m: [] for m in missing})
+                for metric in self._evaluator(missing).iter_calc(run, n_jobs=n_jobs):
+                    computed[metric.measure].append((metric.query_id, metric.value))
+            self.cache.put(self.provider_fingerprint, run_fingerprint, self.qrels_fingerprint, {m: v for m, v in computed.items() if _cacheable(m)})
+            values.update(computed)
+        for measure in self.measures:
+            for query_id, value in values[measure]:
+                yield Metric(query_id=query_id, measure=measure, value=value)
+
+    def _from_previous_qrels(self, run, run_fingerprint, measures, n_jobs):
+        # re-uses values cached for these measures before update_qrels, re-computing only the affected queries
+        np = ir_measures.lazylibs.numpy()
+        result = {}
+        for previous_fingerprint, affected in self._previous_qrels:
+            remaining = [m for m in measures if m not in result]
+            if not remaining:
+                break
+            previous = self.cache.get(self.provider_fingerprint, run_fingerprint, previous_fingerprint, remaining)
+            if not previous:
+                continue
+            for measure, per_query in previous.items():
+                result[measure] = [(query_id, value) for query_id, value in per_query if query_id not in affected]
+            mask = np.isin(run.query_ids, list(affected))[run.query_codes] if len(run) else np.zeros(0, dtype=bool)
+            subset = ColumnarRun(run.query_ids, run.doc_ids, run.query_codes[mask], run.doc_codes[mask], run.scores[mask])
+            for metric in self._evaluator(list(previous)).iter_calc(subset, n_jobs=n_jobs):
+                if metric.query_id in affected:
+                    result[metric.measure].append((metric.query_id, metric.value))
+        return result
+
+    def _iter_calc(self, run):
+        return self.iter_calc(run)
+
+    def _evaluator(self, measures):
+        key = frozenset(measures)
+        if key not in self._evaluators:
+            self._evaluators[key] = self.provider.evaluator(measures, self.qrels)
+        return self._evaluators[key]
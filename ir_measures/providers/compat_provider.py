@@ -10,6 +10,9 @@ class CompatProvider(providers.Provider):
     .. cite.dblp:: journals/tois/ClarkeVS21
     """
     NAME = 'compat'
+    INPUT_FORMAT = 'dict_of_dict'
+    DEDUPLICATES_RUN = True
+    COST_PER_ROW = 2.
     SUPPORTED_MEASURES = [
         measures._Compat(p=Any(), normalize=Any())
     ]
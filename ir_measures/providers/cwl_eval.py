@@ -1,16 +1,10 @@
 import logging
+import math
 from typing import NamedTuple, Union
 import ir_measures
 from ir_measures import providers, measures
 from ir_measures.providers.base import Any, Choices, NOT_PROVIDED
 
-try:
-    from cwl.cwl_eval import TrecQrelHandler
-except ImportError:
-    # Shim so that the provider can be defined
-    class TrecQrelHandler: # type: ignore
-        pass
-
 logger = logging.getLogger('ir_measures.cwl_eval')
 logger.setLevel('WARNING')
 
@@ -31,10 +25,18 @@ class CwlEvalProvider(providers.Provider):
 
     https://github.com/ireval/cwl
 
+    By default (``engine='native'``), the measures are calculated with NumPy, from a (queries x ranks) matrix of
+    gains for each relevance setting, without the ``cwl`` package. The C/W/L vectors (continuation, weight, and
+    stopping probabilities) of every query are built as in cwl_eval, over the same 1000 ranks, so the expected
+    utility, cost, and items of each :class:`CwlMetric` match those of cwl_eval. ``engine='cwl'`` uses the
+    ``cwl`` package itself, one query at a time.
 
     .. cite.dblp:: conf/sigir/AzzopardiTM19
     """
     NAME = 'cwl_eval'
+    ENGINES = ('native', 'cwl')
+    INPUT_FORMAT = 'columnar'
+    COST_PER_ROW = 0.1
     SUPPORTED_MEASURES = [
         measures._P(cutoff=Any(), rel=Any(), judged_only=Choices(False)),
         measures._RR(cutoff=Choices(NOT_PROVIDED), rel=Any(), judged_only=Choices(False)),
@@ -50,6 +52,15 @@ class CwlEvalProvider(providers.Provider):
         measures._INSQ(T=Any(), min_rel=Any(), max_rel=Any(required=True)),
     ]
 
+    def __init__(self, engine: str = 'native'):
+        super().__init__()
+        if engine not in self.ENGINES:
+            raise ValueError(f'unknown engine {engine!r}; expected one of: {", ".join(self.ENGINES)}')
+        self.engine = engine
+        if engine == 'cwl':
+            self.INPUT_FORMAT = 'namedtuple_iter'
+            self.COST_PER_ROW = 5.
+
     def _evaluator(self, measures, qrels):
         invocations = {}
         for measure in measures:
@@ -60,9 +71,17 @@ class CwlEvalProvider(providers.Provider):
             if inv_key not in invocations:
                 invocations[inv_key] = []
             invocations[inv_key].append(measure)
+        if self.engine == 'native':
+            return CwlNativeEvaluator(measures, qrels, invocations)
         return CwlEvaluator(measures, qrels, invocations)
 
     def initialize(self):
+        if self.engine == 'native':
+            try:
+                ir_measures.lazylibs.numpy()
+            except ImportError as ex:
+                raise RuntimeError('numpy not available', ex)
+            return
         try:
             import cwl # noqa: F401 just checking if available
         except ImportError as ex:
@@ -72,57 +91,78 @@ class CwlEvalProvider(providers.Provider):
         cwl_logger.disabled = True
 
     def install_instructions(self):
+        if self.engine == 'native':
+            return 'pip install numpy'
         return 'pip install ir-measures[cwl_eval]'
 
 
-class IrmQrelHandler(TrecQrelHandler):
-    def __init__(self, bin_rel_cutoff, min_rel, max_rel):
-        super().__init__(None) # file name = None
-        self.bin_rel_cutoff = bin_rel_cutoff
-        self.min_rel = min_rel
-        self.max_rel = max_rel
-        if self.bin_rel_cutoff is None:
-            assert self.min_rel is not None and self.max_rel is not None, "must provide either bin_rel_cutoff xor (BOTH min_rel and max_rel)"
-            assert self.min_rel < self.max_rel, "min_rel must be less than max_rel"
-        else:
-            assert self.min_rel is None and self.max_rel is None, "must provide either bin_rel_cutoff xor (BOTH min_rel and max_rel)"
-        self._min_observed_rel = float('inf')
-        self._max_observed_rel = float('-inf')
+_IRM_QREL_HANDLER = None
 
-    def read_file(self, qrels):
-        pass # disable reading from file, we build these below
+def _irm_qrel_handler(bin_rel_cutoff, min_rel, max_rel):
+    # The handler subclasses cwl's TrecQrelHandler, so it is only defined once cwl is needed (importing cwl is slow)
+    global _IRM_QREL_HANDLER
+    if _IRM_QREL_HANDLER is None:
+        from cwl.cwl_eval import TrecQrelHandler
+
+        class IrmQrelHandler(TrecQrelHandler):
+            def __init__(self, bin_rel_cutoff, min_rel, max_rel):
+                super().__init__(None) # file name = None
+                self.bin_rel_cutoff = bin_rel_cutoff
+                self.min_rel = min_rel
+                self.max_rel = max_rel
+                if self.bin_rel_cutoff is None:
+                    assert self.min_rel is not None and self.max_rel is not None, "must provide either bin_rel_cutoff xor (BOTH min_rel and max_rel)"
+                    assert self.min_rel < self.max_rel, "min_rel must be less than max_rel"
+                else:
+                    assert self.min_rel is None and self.max_rel is None, "must provide either bin_rel_cutoff xor (BOTH min_rel and max_rel)"
+                self._min_observed_rel = float('inf')
+                self._max_observed_rel = float('-inf')
+
+            def read_file(self, qrels):
+                pass # disable reading from file, we build these below
+
+            def put_value(self, query_id, doc_id, relevance):
+                if self.bin_rel_cutoff is not None:
+                    relevance = 1 if relevance >= self.bin_rel_cutoff else 0
+                else:
+                    self._min_observed_rel = min(self._min_observed_rel, relevance)
+                    self._max_observed_rel = max(self._max_observed_rel, relevance)
+                    # clip value to range [min_rel, max_rel]
+                    relevance = min(max(relevance, self.min_rel), self.max_rel)
+                    # scale to be between [0, 1], based on the min_rel, max_rel range
+                    relevance = (relevance - self.min_rel) / (self.max_rel - self.min_rel)
+                super().put_value(query_id, doc_id, relevance)
+
+            def verify_gains(self):
+                if self.bin_rel_cutoff is None:
+                    _verify_gains(self.min_rel, self.max_rel, self._min_observed_rel, self._max_observed_rel)
+
+        _IRM_QREL_HANDLER = IrmQrelHandler
+    return _IRM_QREL_HANDLER(bin_rel_cutoff, min_rel, max_rel)
 
-    def put_value(self, query_id, doc_id, relevance):
-        if self.bin_rel_cutoff is not None:
-            relevance = 1 if relevance >= self.bin_rel_cutoff else 0
-        else:
-            self._min_observed_rel = min(self._min_observed_rel, relevance)
-            self._max_observed_rel = max(self._max_observed_rel, relevance)
-            # clip value to range [min_rel, max_rel]
-            relevance = min(max(relevance, self.min_rel), self.max_rel)
-            # scale to be between [0, 1], based on the min_rel, max_rel range
-            relevance = (relevance - self.min_rel) / (self.max_rel - self.min_rel)
-        super().put_value(query_id, doc_id, relevance)
-
-    def verify_gains(self):
-        if self.bin_rel_cutoff is None:
-            if self._min_observed_rel < self.min_rel:
-                is_typical = self.min_rel == 0 and self._min_observed_rel < 0
-                typical_message = ' This is typical and the desired behaviour in most TREC collections (where negative relevance scores are treated equally).' if is_typical else ''
-                logger.warning(f'min_rel={self.min_rel} but at least one relevance score of {self._min_observed_rel} was observed. Scores less than {self.min_rel} were treated as {self.min_rel}.{typical_message}')
-            if self._min_observed_rel > self.min_rel:
-                logger.warning(f'min_rel={self.min_rel} but the lowest relevance score observed was {self._min_observed_rel}.')
-            if self._max_observed_rel > self.max_rel:
-                logger.warning(f'max_rel={self.max_rel} but at least one relevance score of {self._max_observed_rel} was observed. Scores greater than {self.max_rel} were treated as {self.max_rel}.')
-            if self._max_observed_rel < self.max_rel:
-                logger.warning(f'max_rel={self.max_rel} but at the highest relevance score observed was {self._max_observed_rel}. This is sometimes expected, e.g., if annotated on a scale up to {self._max_observed_rel} but no such documents were found.')
+
+def _verify_gains(min_rel, max_rel, min_observed_rel, max_observed_rel):
+    # warns when the observed relevance scores do not match the [min_rel, max_rel] range of a measure
+    if min_observed_rel < min_rel:
+        is_typical = min_rel == 0 and min_observed_rel < 0
+        typical_message = ' This is typical and the desired behaviour in most TREC collections (where negative relevance scores are treated equally).' if is_typical else ''
+        logger.warning(f'min_rel={min_rel} but at least one relevance score of {min_observed_rel} was observed. Scores less than {min_rel} were treated as {min_rel}.{typical_message}')
+    if min_observed_rel > min_rel:
+        logger.warning(f'min_rel={min_rel} but the lowest relevance score observed was {min_observed_rel}.')
+    if max_observed_rel > max_rel:
+        logger.warning(f'max_rel={max_rel} but at least one relevance score of {max_observed_rel} was observed. Scores greater than {max_rel} were treated as {max_rel}.')
+    if max_observed_rel < max_rel:
+        logger.warning(f'max_rel={max_rel} but at the highest relevance score observed was {max_observed_rel}. This is sometimes expected, e.g., if annotated on a scale up to {max_observed_rel} but no such documents were found.')
+
+
+MAX_N = 1000 # the depth of every ranking (cwl_eval's default max_n)
 
 
 class CwlEvaluator(providers.Evaluator):
     def __init__(self, measures, qrels, invocations, verify_gains=True):
         self.qrhs = {}
         for inv_key in invocations.keys():
-            self.qrhs[inv_key] = IrmQrelHandler(*inv_key)
+            self.qrhs[inv_key] = _irm_qrel_handler(*inv_key)
         qids = set()
         for qrel in ir_measures.util.QrelsConverter(qrels).as_namedtuple_iter():
             qids.add(qrel.query_id)
@@ -133,35 +173,46 @@ class CwlEvaluator(providers.Evaluator):
             for qrh in self.qrhs.values():
                 qrh.verify_gains()
         self.invocations = invocations
+        # compiled once rather than for every query: the gains of each invocation (as plain dicts), the total number
+        # of relevant items and total gain of each query, and the cwl metric object of each measure
+        self.gains = {}
+        self.totals = {}
+        for inv_key, qrh in self.qrhs.items():
+            self.gains[inv_key] = {qid: dict(docs) for qid, docs in qrh.data.items()}
+            self.totals[inv_key] = {qid: (qrh.get_total_rels(qid), qrh.get_total_gains(qid)) for qid in qrh.data}
+        self.metrics = {inv_key: [(measure, self._compile_measure(measure)) for measure in meas] for inv_key, meas in invocations.items()}
         super().__init__(measures, qids)
 
     def _iter_calc(self, run):
-        from cwl.cwl_eval import RankingMaker
         # adapted from cwl_eval's main() method
-        ranking_makers = None
         curr_qid = None
+        doc_ids = []
         for item in ir_measures.util.RunConverter(run).as_sorted_namedtuple_iter():
             if item.query_id not in self.qrel_qids:
                 continue # skip queries not found in qrels; handled by base
             if item.query_id != curr_qid:
                 if curr_qid is not None:
-                    yield from self.flush(curr_qid, ranking_makers)
+                    yield from self.flush(curr_qid, doc_ids)
                 curr_qid = item.query_id
-                ranking_makers = {}
-                for inv_key in self.invocations.keys():
-                    ranking_makers[inv_key] = RankingMaker(curr_qid, self.qrhs[inv_key], min_gain=0., max_gain=1., cost_dict=None, max_cost=1.0, min_cost=1.0, max_n=1000) # max_n=1000 from cwl_eval default
-            for maker in ranking_makers.values():
-                maker.add(item.doc_id, "_")
+                doc_ids = []
+            doc_ids.append(item.doc_id)
 
         if curr_qid is not None:
-            yield from self.flush(curr_qid, ranking_makers)
-
-    def flush(self, qid, ranking_makers):
-        rankings = {inv_key: maker.get_ranking() for inv_key, maker in ranking_makers.items()}
-        for inv_key, meas in self.invocations.items():
-            for measure in meas:
-                cwl_measure = self._irm_convert_to_measure(measure)
-                value = cwl_measure.measure(rankings[inv_key])
+            yield from self.flush(curr_qid, doc_ids)
+
+    def flush(self, qid, doc_ids):
+        # builds the ranking of each invocation directly (as cwl's RankingMaker would), and scores it with the
+        # compiled metric objects; measure() overwrites all of their results, so they can be re-used across queries
+        from cwl.ruler.ranking import Ranking
+        nan = float('nan')
+        costs = [nan] * len(doc_ids) # no cost_dict: every item has max_cost
+        for inv_key, metrics in self.metrics.items():
+            gains = self.gains[inv_key].get(qid, {})
+            # unjudged items have a NaN gain, which the ranking treats as min_gain
+            ranking = Ranking(qid, [gains.get(doc_id, nan) for doc_id in doc_ids], costs, max_gain=1., min_gain=0., max_cost=1., min_cost=1., max_n=MAX_N)
+            ranking.total_qrel_rels, ranking.total_qrel_gain = self.totals[inv_key].get(qid, (0., 0.))
+            for measure, cwl_measure in metrics:
+                value = cwl_measure.measure(ranking)
                 yield CwlMetric(query_id=qid, measure=measure,
                     value=value,
                     expected_total_utility=cwl_measure.expected_total_utility,
@@ -169,6 +220,24 @@ class CwlEvaluator(providers.Evaluator):
                     expected_total_cost=cwl_measure.expected_total_cost,
                     expected_items=cwl_measure.expected_items)
 
+    def _compile_measure(self, measure):
+        # A cwl metric object computes its C vector twice for each ranking (for the W and L vectors). It is instead
+        # computed once for each ranking, or only once in total for the measures where it does not depend on gains.
+        cwl_measure = self._irm_convert_to_measure(measure)
+        c_vector = cwl_measure.c_vector
+        if measure.NAME in ('P', 'RBP', 'SDCG', 'INSQ'):
+            from cwl.ruler.ranking import Ranking
+            cvec = c_vector(Ranking(None, [], [], max_n=MAX_N))
+            cwl_measure.c_vector = lambda ranking, worse_case=True: cvec
+        else:
+            last = [None, None, None] # (ranking, worse_case, C vector)
+            def cached_c_vector(ranking, worse_case=True):
+                if last[0] is not ranking or last[1] != worse_case:
+                    last[:] = ranking, worse_case, c_vector(ranking, worse_case)
+                return last[2]
+            cwl_measure.c_vector = cached_c_vector
+        return cwl_measure
+
     def _irm_convert_to_measure(self, measure):
         from cwl.ruler.cwl_ruler import PrecisionCWLMetric, RRCWLMetric, APCWLMetric, RBPCWLMetric, BPMCWLMetric, NDCGCWLMetric, NERReq8CWLMetric, NERReq9CWLMetric, NERReq10CWLMetric, NERReq11CWLMetric, INSTCWLMetric, INSQCWLMetric
         if measure.NAME == 'P':
@@ -198,4 +267,150 @@ class CwlEvaluator(providers.Evaluator):
         raise KeyError(f'measure {measure} not supported')
 
 
+class CwlNativeEvaluator(providers.Evaluator):
+    """
+    Calculates the C/W/L measures with NumPy. The gain of each judgment is computed once for each invocation key
+    (``rel``, ``min_rel``, ``max_rel``); each run is then scored ``BLOCK_SIZE`` queries at a time, with every measure
+    computed from the same (queries x ``MAX_N``) matrix of gains.
+    """
+    BLOCK_SIZE = 1024
+
+    def __init__(self, measures, qrels, invocations, verify_gains=True):
+        np = ir_measures.lazylibs.numpy()
+        qrels = ir_measures.util.QrelsConverter(qrels).as_columnar()
+        super().__init__(measures, set(qrels.query_ids[np.unique(qrels.query_codes)].tolist()))
+        self.invocations = invocations
+        self.query_ids = qrels.query_ids
+        self.query_lookup = {qid: i for i, qid in enumerate(qrels.query_ids.tolist())}
+        self.doc_lookup = {did: i for i, did in enumerate(qrels.doc_ids.tolist())}
+        self.num_docs = max(len(qrels.doc_ids), 1)
+        # clip all negative scores to 0, following trec_eval convention
+        relevance = np.maximum(qrels.relevance, 0)
+        keys = qrels.query_codes.astype(np.int64) * self.num_docs + qrels.doc_codes
+        order = np.argsort(keys, kind='stable')
+        # when a (query, doc) pair appears multiple times, the last one wins (like cwl's qrel handler)
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = keys[order][1:] != keys[order][:-1]
+        self.keys = keys[order][last]
+        self.gains = {inv_key: _cwl_gains(relevance[order][last], *inv_key) for inv_key in invocations}
+        if verify_gains:
+            min_observed = relevance.min() if len(relevance) else float('inf')
+            max_observed = relevance.max() if len(relevance) else float('-inf')
+            for bin_rel_cutoff, min_rel, max_rel in invocations:
+                if bin_rel_cutoff is None:
+                    _verify_gains(min_rel, max_rel, min_observed, max_observed)
+
+    def _iter_calc(self, run):
+        np = ir_measures.lazylibs.numpy()
+        run = ir_measures.util.RunConverter(run).as_columnar()
+        query_map = np.array([self.query_lookup.get(qid, -1) for qid in run.query_ids.tolist()], dtype=np.int64)
+        query_codes = query_map[run.query_codes] if len(query_map) else np.zeros(0, dtype=np.int64)
+        rows = np.flatnonzero(query_codes >= 0)
+        query_codes, doc_codes, scores = query_codes[rows], run.doc_codes[rows], run.scores[rows].astype(np.float64)
+
+        # sort by query, then score (descending); ties keep the order of the run, like cwl_eval
+        order = np.lexsort((-scores, query_codes))
+        query_codes, doc_codes = query_codes[order], doc_codes[order]
+
+        # find the judgment of each returned document (-1 for unjudged documents, which have no gain)
+        doc_map = np.array([self.doc_lookup.get(did, -1) for did in run.doc_ids.tolist()], dtype=np.int64)
+        qrel_doc_codes = doc_map[doc_codes] if len(doc_map) else np.zeros(0, dtype=np.int64)
+        keys = query_codes * self.num_docs + qrel_doc_codes
+        idx = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        judged = (qrel_doc_codes >= 0) & (self.keys[idx] == keys) if len(self.keys) else np.zeros(len(keys), dtype=bool)
+
+        segment_codes, segments, counts = np.unique(query_codes, return_inverse=True, return_counts=True)
+        ranks = np.arange(len(query_codes)) - np.repeat(np.cumsum(counts) - counts, counts)
+        keep = ranks < MAX_N
+        segments, ranks, idx, judged = segments[keep], ranks[keep], idx[keep], judged[keep]
+        query_ids = self.query_ids[segment_codes].tolist()
+        for start in range(0, len(segment_codes), self.BLOCK_SIZE):
+            stop = min(start + self.BLOCK_SIZE, len(segment_codes))
+            lo, hi = np.searchsorted(segments, [start, stop])
+            results = []
+            for inv_key, meas in self.invocations.items():
+                gains = np.zeros((stop - start, MAX_N))
+                gains[segments[lo:hi] - start, ranks[lo:hi]] = np.where(judged[lo:hi], self.gains[inv_key][idx[lo:hi]], 0.)
+                for measure in meas:
+                    results.append((measure, [values.tolist() for values in _cwl_measure(measure, gains)]))
+            for i, query_id in enumerate(query_ids[start:stop]):
+                for measure, (eu, etu, ec, etc, ei) in results:
+                    yield CwlMetric(query_id=query_id, measure=measure,
+                        value=eu[i],
+                        expected_total_utility=etu[i],
+                        expected_cost=ec[i],
+                        expected_total_cost=etc[i],
+                        expected_items=ei[i])
+
+
+def _cwl_gains(relevance, bin_rel_cutoff, min_rel, max_rel):
+    # the gain of each judgment, as assigned by cwl_eval's qrel handler
+    np = ir_measures.lazylibs.numpy()
+    if bin_rel_cutoff is not None:
+        return (relevance >= bin_rel_cutoff).astype(np.float64)
+    assert min_rel < max_rel, "min_rel must be less than max_rel"
+    # clip value to range [min_rel, max_rel], then scale to be between [0, 1]
+    return (np.clip(relevance, min_rel, max_rel) - min_rel) / (max_rel - min_rel)
+
+
+def _cwl_measure(measure, gains):
+    # (expected utility, expected total utility, expected cost, expected total cost, expected items) of each query
+    # (row of gains), following CWLMetric._do_score, where every item has a cost of 1
+    np = ir_measures.lazylibs.numpy()
+    cvec = _c_vector(measure, gains)
+    # the probability of examining each rank (before normalization), which is also the cumulative product of the
+    # shifted C vector used for the L vector
+    cvec_prod = np.ones(gains.shape)
+    cvec_prod[:, 1:] = np.cumprod(cvec[:, :-1], axis=1)
+    w1 = 1. / cvec_prod.sum(axis=1)
+    wvec = cvec_prod * w1[:, None]
+    lvec = cvec_prod * (1. - cvec)
+    costs = np.arange(1., gains.shape[1] + 1)
+    expected_utility = (wvec * gains).sum(axis=1)
+    expected_total_utility = (lvec * np.cumsum(gains, axis=1)).sum(axis=1)
+    expected_cost = wvec.sum(axis=1)
+    expected_total_cost = (lvec * costs).sum(axis=1)
+    return expected_utility, expected_total_utility, expected_cost, expected_total_cost, 1. / w1
+
+
+def _c_vector(measure, gains):
+    # the C vector (the probability of continuing from each rank to the next) of each query, as in cwl.ruler
+    np = ir_measures.lazylibs.numpy()
+    rank = np.arange(1., gains.shape[1] + 1)
+    if measure.NAME == 'P':
+        cvec = (rank < measure['cutoff']).astype(np.float64)
+    elif measure.NAME == 'RR':
+        cvec = (np.cumsum(gains > 0, axis=1) == 0).astype(np.float64)
+    elif measure.NAME == 'AP':
+        # the sum of gain / rank from each rank to the end of the ranking
+        rii = np.cumsum((gains / rank)[:, ::-1], axis=1)[:, ::-1]
+        cvec = np.zeros(gains.shape)
+        np.divide(rii[:, 1:], rii[:, :-1], out=cvec[:, :-1], where=rii[:, 1:] > 0.)
+    elif measure.NAME == 'RBP':
+        cvec = np.full(gains.shape[1], measure['p'])
+    elif measure.NAME == 'BPM':
+        cvec = ((np.cumsum(gains, axis=1) < measure['T']) & (rank < measure['cutoff'])).astype(np.float64)
+    elif measure.NAME == 'SDCG':
+        cvec = np.array([math.log(i + 1, 2.) / math.log(i + 2, 2.) if i < measure['cutoff'] else 0. for i in range(1, gains.shape[1] + 1)])
+    elif measure.NAME == 'NERR8':
+        cvec = np.where(rank < measure['cutoff'], 1 - gains, 0.)
+    elif measure.NAME == 'NERR9':
+        cvec = np.where(rank < measure['cutoff'], (1.0 * rank / (rank + 1.0)) * (1.0 - gains), 0.)
+    elif measure.NAME == 'NERR10':
+        cvec = measure['p'] * (1 - gains)
+    elif measure.NAME == 'NERR11':
+        T = measure['T']
+        cvec = (((rank + (2.0 * T) - 1.0) / (rank + (2.0 * T))) ** 2.0) * (1.0 - gains)
+    elif measure.NAME == 'INST':
+        T = measure['T']
+        Ti = T - np.cumsum(gains, axis=1)
+        cvec = ((rank + T + Ti - 1.0) / (rank + T + Ti)) ** 2.0
+    elif measure.NAME == 'INSQ':
+        T = measure['T']
+        cvec = ((rank + (2.0 * T) - 1.0) / (rank + (2.0 * T))) ** 2.0
+    else:
+        raise KeyError(f'measure {measure} not supported')
+    return np.broadcast_to(cvec, gains.shape)
+
+
 providers.register(CwlEvalProvider())
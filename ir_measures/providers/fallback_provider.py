@@ -1,36 +1,170 @@
-from typing import Iterable, List
+import itertools
+from typing import Iterable, List, NamedTuple, Optional
 from ir_measures import providers
-from ir_measures.util import QrelsConverter, RunConverter
+from ir_measures.util import QrelsConverter, RunConverter, SharedRun, TYPE_QREL
 from ir_measures.measures.base import Measure
 
 
+# Rough cost (per row) of converting the run or qrels from one format to another; see Provider.INPUT_FORMAT
+CONVERSION_COSTS = {
+    ('namedtuple_iter', 'dict_of_dict'): 0.4,
+    ('namedtuple_iter', 'pd_dataframe'): 1.0,
+    ('namedtuple_iter', 'columnar'): 0.6,
+    ('dict_of_dict', 'namedtuple_iter'): 0.3,
+    ('dict_of_dict', 'pd_dataframe'): 1.3,
+    ('dict_of_dict', 'columnar'): 0.9,
+    ('pd_dataframe', 'namedtuple_iter'): 1.0,
+    ('pd_dataframe', 'dict_of_dict'): 1.4,
+    ('pd_dataframe', 'columnar'): 0.2,
+    ('columnar', 'namedtuple_iter'): 0.5,
+    ('columnar', 'dict_of_dict'): 0.9,
+    ('columnar', 'pd_dataframe'): 0.2,
+}
+
+# The input size assumed when it is not known in advance (e.g., the qrels are a generator)
+DEFAULT_NUM_ROWS = 10_000
+
+
+def _max_depth(measures) -> Optional[int]:
+    # the ranking depth needed by all the measures, or None if any of them need entire rankings
+    depths = [measure.max_depth() for measure in measures]
+    if not depths or None in depths:
+        return None
+    return max(max(depths), 1)
+
+
+def _num_rows(qrels) -> Optional[int]:
+    # the number of rows in the qrels, if it can be found without consuming them
+    if isinstance(qrels, dict):
+        return sum(len(docs) for docs in qrels.values())
+    if hasattr(qrels, '__len__'):
+        return len(qrels)
+    return None
+
+
+class PlanStep(NamedTuple):
+    """One provider in the plan made by :meth:`FallbackProvider.plan`, with its estimated costs."""
+    provider: providers.Provider
+    measures: List[Measure]
+    eval_cost: float
+    conversion_cost: float
+
+    @property
+    def cost(self) -> float:
+        return self.eval_cost + self.conversion_cost
+
+
 class FallbackProvider(providers.Provider):
-    def __init__(self, providers):
+    """
+    Calculates measures using a sequence of providers.
+
+    The value of each measure is defined by the first available provider that supports it. With ``cost_based=True``
+    (the default), a measure may instead be calculated by a provider that gives the same values (see
+    :attr:`~ir_measures.providers.Provider.EQUIVALENT_TO`), such that the estimated total cost (see
+    :meth:`~ir_measures.providers.Provider.estimate_cost`, plus the cost of converting the inputs to each provider's
+    format) is minimal. Among plans with the same cost, ones with fewer and earlier providers are preferred. So the
+    results never depend on which other measures are requested. With ``cost_based=False``, each measure goes to the
+    first available provider that supports it. Use :meth:`explain` to see the plan for a set of measures.
+    """
+    def __init__(self, providers, cost_based: bool = True):
         super().__init__()
         self.providers = providers
+        self.cost_based = cost_based
 
     def _evaluator(self, measures, qrels):
-        measures = set(measures)
-        orig_measures = list(measures)
-        provider_measure_pairs = []
-        provides_that_would_support = []
+        orig_measures = list(dict.fromkeys(measures)) # de-duplicated, keeping the order (e.g., of ColumnarResults columns)
+        num_rows = _num_rows(qrels)
+        orig_qrels = qrels
+        qrels = QrelsConverter(qrels)
+        steps = self._plan(orig_measures, qrels.predict_type()[0], num_rows)
+        evaluators = []
+        qrels_teed = qrels.tee(len(steps))
+        for step, step_qrels in zip(steps, qrels_teed):
+            evaluators.append(step.provider.evaluator(step.measures, step_qrels.qrels))
+        # the run can only be cut short for the providers that count each document once; the others get all of it
+        max_depth = _max_depth([m for step in steps if step.provider.DEDUPLICATES_RUN for m in step.measures])
+        if len(evaluators) == 1 and max_depth is None:
+            return evaluators[0] # skip the overhead of FallbackEvaluator if there's only one
+        # qrels that can be read again (i.e., not an iterator) are referenced, so that evaluators that cannot update
+        # their qrels in place can be rebuilt by update_qrels; no copy is made
+        rereadable = iter(orig_qrels) is not orig_qrels
+        return FallbackEvaluator(orig_measures, evaluators, max_depth, steps, orig_qrels if rereadable else None)
+
+    def plan(self, measures: Iterable[Measure], qrels: Optional[TYPE_QREL] = None) -> List[PlanStep]:
+        """
+        Returns the providers that would be used to calculate these measures, and the measures assigned to each.
+
+        If ``qrels`` are given, their size and format are used to estimate the costs. Otherwise, inputs of
+        ``DEFAULT_NUM_ROWS`` rows of namedtuples are assumed.
+        """
+        input_format = 'namedtuple_iter'
+        num_rows = None
+        if qrels is not None:
+            num_rows = _num_rows(qrels)
+            input_format = QrelsConverter(qrels).predict_type()[0]
+        return self._plan(list(dict.fromkeys(measures)), input_format, num_rows)
+
+    def explain(self, measures: Iterable[Measure], qrels: Optional[TYPE_QREL] = None) -> str:
+        """Returns a human-readable description of :meth:`plan`."""
+        measures = list(dict.fromkeys(measures))
+        steps = self.plan(measures, qrels)
+        num_rows = _num_rows(qrels) if qrels is not None else None
+        size = f'{num_rows} rows' if num_rows is not None else f'an assumed {DEFAULT_NUM_ROWS} rows'
+        mode = 'lowest estimated cost' if self.cost_based else 'first available provider'
+        lines = [f'Plan for {len(measures)} measure(s) over {size} ({mode}); estimated cost {sum(s.cost for s in steps):.0f}:']
+        used = set()
+        for step in steps:
+            used.add(step.provider.NAME)
+            measure_strs = ', '.join(str(m) for m in step.measures)
+            lines.append(f' - {step.provider.NAME}: {measure_strs} (cost {step.cost:.0f} = evaluation {step.eval_cost:.0f} + converting to {step.provider.INPUT_FORMAT} {step.conversion_cost:.0f})')
         for provider in self.providers:
-            provider_measures = set()
-            for measure in measures:
-                if provider.supports(measure):
-                    provider_measures.add(measure)
-            if provider_measures:
-                if not provider.is_available():
-                    provides_that_would_support.append(provider)
-                else:
-                    measures = measures - provider_measures
-                    provider_measure_pairs.append((provider, provider_measures))
-                    if not measures:
+            if provider.NAME in used:
+                continue
+            # (availability is not checked here, since that may import the provider's libraries)
+            supported = [str(m) for m in measures if provider.supports(m)]
+            if supported:
+                lines.append(f' - {provider.NAME} (not used) could calculate: {", ".join(supported)}')
+        return '\n'.join(lines)
+
+    def _plan(self, measures, input_format, num_rows):
+        if num_rows is None:
+            num_rows = DEFAULT_NUM_ROWS
+        # Plan as if every equivalent provider were available, and only check the availability of the ones the plan
+        # uses (which may import heavy libraries); if any are missing, plan again without them.
+        unavailable = set()
+        while True:
+            steps = self._cheapest_plan(self._options(measures, unavailable), measures, input_format, num_rows)
+            missing = {step.provider.NAME for step in steps if not step.provider.is_available()}
+            if not missing:
+                return steps
+            unavailable.update(missing)
+
+    def _options(self, measures, unavailable):
+        # The providers that may calculate each measure: the first available provider that supports it (which defines
+        # the measure's value), and, if cost_based, the providers that give the same values as that one.
+        options = {}
+        remaining = []
+        provides_that_would_support = []
+        for measure in measures:
+            reference = None
+            for provider in self.providers:
+                if provider.NAME not in unavailable and provider.supports(measure):
+                    if provider.is_available():
+                        reference = provider
                         break
-        if measures:
+                    if provider not in provides_that_would_support:
+                        provides_that_would_support.append(provider)
+            if reference is None:
+                remaining.append(measure)
+                continue
+            options[measure] = [reference]
+            if self.cost_based:
+                options[measure] += [p for p in self.providers if p is not reference and p.NAME in reference.EQUIVALENT_TO
+                                     and p.NAME not in unavailable and p.supports(measure)]
+        if remaining:
             provider_message = ''
             if provides_that_would_support:
-                if len(measures) == 1:
+                if len(remaining) == 1:
                     provider_message = ' The following providers would support this measure:'
                 else:
                     provider_message = ' The following providers would support at least one of these measures:'
@@ -40,18 +174,53 @@ class FallbackProvider(providers.Provider):
                         provider_message += f'\n - {p.NAME} ({inst})'
                     else:
                         provider_message += f'\n - {p.NAME}'
-            raise ValueError(f'Unsupported measures {measures}.{provider_message}')
+            raise ValueError(f'Unsupported measures {set(remaining)}.{provider_message}')
+        return options
 
-        evaluators = []
-        qrels_teed = QrelsConverter(qrels).tee(len(provider_measure_pairs))
-        for (provider, provider_measures), qrels in zip(provider_measure_pairs, qrels_teed):
-            evaluators.append(provider.evaluator(provider_measures, qrels.qrels))
-        if len(evaluators) == 1:
-            return evaluators[0] # skip the overhead of FallbackEvaluator if there's only one
-        return FallbackEvaluator(orig_measures, evaluators)
+    def _cheapest_plan(self, options, measures, input_format, num_rows):
+        # the providers (in pipeline order) with the measures each may calculate
+        candidates = []
+        for provider in self.providers:
+            provider_measures = [m for m in measures if any(p is provider for p in options[m])]
+            if provider_measures:
+                candidates.append((provider, provider_measures))
+
+        def steps_for(subset, skip_unused=False):
+            # measures go to the first provider in the subset that may calculate them (like a shorter fallback pipeline)
+            steps = []
+            assigned = set()
+            for provider, provider_measures in subset:
+                provider_measures = [m for m in provider_measures if m not in assigned]
+                if not provider_measures:
+                    if skip_unused:
+                        continue
+                    return None # this provider is not needed, so a smaller subset is at least as good
+                assigned.update(provider_measures)
+                conversion_cost = 2 * num_rows * CONVERSION_COSTS.get((input_format, provider.INPUT_FORMAT), 0.) # run and qrels
+                steps.append(PlanStep(provider, provider_measures, provider.estimate_cost(provider_measures, num_rows), conversion_cost))
+            if len(assigned) != len(measures):
+                return None
+            return steps
+
+        if not self.cost_based:
+            return steps_for(candidates, skip_unused=True)
+
+        # Providers that are the only option for a measure are always needed; try every combination of the others.
+        required = [i for i, (provider, provider_measures) in enumerate(candidates) if any(len(options[m]) == 1 for m in provider_measures)]
+        optional = [i for i in range(len(candidates)) if i not in required]
+        best, best_cost = None, None
+        for count in range(len(optional) + 1):
+            for chosen in itertools.combinations(optional, count):
+                steps = steps_for([candidates[i] for i in sorted(required + list(chosen))])
+                if steps is None:
+                    continue
+                cost = sum(step.cost for step in steps)
+                if best is None or cost < best_cost:
+                    best, best_cost = steps, cost
+        return best or []
 
     def supports(self, measure):
-        return any(p.is_available() and p.supports(measure) for p in self.providers)
+        return any(p.supports(measure) and p.is_available() for p in self.providers)
 
     def run_inputs(self, measures: Iterable[Measure]) -> List[str]:
         """Returns the inputs required by the provided measures in the run.
@@ -65,10 +234,9 @@ class FallbackProvider(providers.Provider):
         inputs = set()
         measures = list(measures)
         for provider in self.providers:
-            if provider.is_available():
-                provider_measures = {m for m in measures if provider.supports(m)}
-                if provider_measures:
-                    inputs.update(provider.run_inputs(provider_measures))
+            provider_measures = {m for m in measures if provider.supports(m)}
+            if provider_measures and provider.is_available():
+                inputs.update(provider.run_inputs(provider_measures))
                 measures = [m for m in measures if m not in provider_measures]
         return list(inputs)
 
@@ -84,20 +252,57 @@ class FallbackProvider(providers.Provider):
         inputs = set()
         measures = list(measures)
         for provider in self.providers:
-            if provider.is_available():
-                provider_measures = {m for m in measures if provider.supports(m)}
-                if provider_measures:
-                    inputs.update(provider.qrel_inputs(provider_measures))
+            provider_measures = {m for m in measures if provider.supports(m)}
+            if provider_measures and provider.is_available():
+                inputs.update(provider.qrel_inputs(provider_measures))
                 measures = [m for m in measures if m not in provider_measures]
         return list(inputs)
 
 
 class FallbackEvaluator(providers.Evaluator):
-    def __init__(self, measures, evaluators):
+    def __init__(self, measures, evaluators, max_depth=None, steps=None, qrels=None):
         super().__init__(measures, evaluators[0].qrel_qids)
         self.evaluators = evaluators
+        self.max_depth = max_depth
+        self.steps = steps
+        # whether each evaluator is given the run cut to max_depth
+        self.prune = [step.provider.DEDUPLICATES_RUN for step in steps] if steps is not None else [False] * len(evaluators)
+        self.qrels = qrels # the qrels the evaluators were built from, if they can be read again (otherwise None)
+
+    def update_qrels(self, qrels):
+        qrels = QrelsConverter(qrels).as_columnar() # converted once, rather than by each evaluator
+        rebuild = [i for i, evaluator in enumerate(self.evaluators) if not providers.base._updates_qrels(evaluator)]
+        if rebuild:
+            if self.qrels is None:
+                raise NotImplementedError('the qrels of this evaluator cannot be updated, since they were given as an '
+                                          'iterator; build it from a list, dict, or DataFrame of qrels instead')
+            # the evaluators that cannot be updated are rebuilt from the merged qrels, which are then kept for later
+            # updates
+            self.qrels = QrelsConverter(self.qrels).as_columnar().update(qrels)
+        for i, evaluator in enumerate(self.evaluators):
+            if i in rebuild:
+                self.evaluators[i] = self.steps[i].provider.evaluator(self.steps[i].measures, self.qrels)
+            else:
+                evaluator.update_qrels(qrels)
+        self.qrel_qids = self.evaluators[0].qrel_qids
+        return providers.base._qrels_query_ids(qrels)
 
     def _iter_calc(self, run):
-        runs_teed = RunConverter(run).tee(len(self.evaluators))
-        for evaluator, run in zip(self.evaluators, runs_teed):
-            yield from evaluator.iter_calc(run.run)
+        for evaluator, evaluator_run in zip(self.evaluators, self._shared_runs(run)):
+            yield from evaluator._iter_calc(evaluator_run)
+
+    def _iter_columns(self, run):
+        for evaluator, evaluator_run in zip(self.evaluators, self._shared_runs(run)):
+            yield from evaluator._iter_columns(evaluator_run)
+
+    def _shared_runs(self, run):
+        # the evaluators share the run, so that each conversion of it (e.g., to a dict-of-dict) is only built once
+        # (missing values are filled in once, by iter_calc, rather than by each evaluator)
+        run = SharedRun(run)
+        if self.max_depth is None or not any(self.prune):
+            return [run] * len(self.evaluators)
+        # none of the measures of the evaluators that count each document once look past max_depth, so the rest of
+        # each ranking can be dropped before the run is converted (and sorted) for them. Others (e.g., gdeval) score
+        # every row, including repeated documents, so they get the whole run.
+        pruned = SharedRun(RunConverter(run).as_columnar().top_k(self.max_depth))
+        return [pruned if prune else run for prune in self.prune]
@@ -1,6 +1,10 @@
+import math
+import os
 import pkgutil
+import re
 import subprocess
 import tempfile
+import threading
 import ir_measures
 from ir_measures import providers, measures, Metric
 from ir_measures.providers.base import Any, Choices, NOT_PROVIDED
@@ -8,14 +12,43 @@ from ir_measures.providers.base import Any, Choices, NOT_PROVIDED
 
 class GdevalProvider(providers.Provider):
     """
-    gdeval
+    gdeval, the evaluation script of the TREC Web track, for ERR and nDCG (with ``exp-log2`` gains).
+
+    By default (``engine='native'``), the measures are calculated in-process with NumPy, following gdeval.pl
+    exactly: ties in score are broken by descending ``doc_id``, duplicate documents are all kept, queries without
+    relevant documents are skipped, and values are rounded to 5 decimal places. All cutoffs are calculated in a single
+    pass. ``engine='perl'`` runs the original script instead (once per cutoff), e.g., to verify the results.
+
+    With ``engine='perl_worker'``, each evaluator keeps a perl process running the same calculations (see
+    ``bin/gdeval_worker.pl``): the qrels are sent to it once, and each run is scored at all cutoffs over a pipe,
+    without starting a new process or writing temporary files. The process stops when the evaluator is closed (or
+    garbage collected).
     """
     NAME = 'gdeval'
+    ENGINES = ('native', 'perl', 'perl_worker')
+    INPUT_FORMAT = 'columnar'
+    COST_PER_PASS = 20.
+    COST_PER_ROW = 0.05
     SUPPORTED_MEASURES = [
         measures._nDCG(cutoff=Any(required=True), dcg=Choices('exp-log2'), gains=Choices(NOT_PROVIDED), judged_only=Choices(False)),
         measures._ERR(cutoff=Any(required=True)),
     ]
 
+    def __init__(self, engine: str = 'native'):
+        super().__init__()
+        if engine not in self.ENGINES:
+            raise ValueError(f'unknown engine {engine!r}; expected one of: {", ".join(self.ENGINES)}')
+        self.engine = engine
+        if engine == 'perl':
+            self.INPUT_FORMAT = 'namedtuple_iter'
+            self.COST_PER_PASS = 30000. # each cutoff starts a perl process
+            self.COST_PER_ROW = 3.
+        elif engine == 'perl_worker':
+            self.INPUT_FORMAT = 'namedtuple_iter'
+            self.COST_SETUP = 30000. # the perl process is started once per evaluator
+            self.COST_PER_PASS = 0.
+            self.COST_PER_ROW = 3.
+
     def _evaluator(self, measures, qrels):
         MEASURES = ('nDCG', 'ERR')
         cutoffs = {}
@@ -30,21 +63,39 @@ class GdevalProvider(providers.Provider):
         invocations = []
         for cutoff, (NDCG, ERR) in cutoffs.items():
             invocations.append((cutoff, NDCG, ERR))
+        if self.engine == 'native':
+            qrels = ir_measures.util.QrelsConverter(qrels).as_columnar()
+            return GdevalNativeEvaluator(measures, qrels, invocations)
         qrels = list(ir_measures.util.QrelsConverter(qrels).as_namedtuple_iter())
+        if self.engine == 'perl_worker':
+            return GdevalWorkerEvaluator(measures, qrels, invocations)
         return GdevalEvaluator(measures, qrels, invocations)
 
+    def _num_passes(self, measures):
+        if self.engine in ('native', 'perl_worker'):
+            return 1
+        return len({measure['cutoff'] for measure in measures})
+
     def initialize(self):
-        import shutil
-        if not shutil.which("perl"):
-            raise RuntimeError('perl not available')
+        if self.engine == 'native':
+            try:
+                ir_measures.lazylibs.numpy()
+            except ImportError as ex:
+                raise RuntimeError('numpy not available', ex)
+        else:
+            import shutil
+            if not shutil.which("perl"):
+                raise RuntimeError('perl not available')
 
     def install_instructions(self):
+        if self.engine == 'native':
+            return 'pip install numpy'
         return 'Install perl, see <https://www.perl.org>'
 
 
 class GdevalEvaluator(providers.Evaluator):
     def __init__(self, measures, qrels, invocations):
-        super().__init__(measures, set(q.query_id for q in qrels))
+        super().__init__(measures, {q.query_id for q in qrels})
         self.qrels = qrels
         self.invocations = invocations
 
@@ -71,4 +122,220 @@ class GdevalEvaluator(providers.Evaluator):
                         yield Metric(query_id=qid, measure=ERR_measure, value=float(err))
 
 
+class GdevalWorkerEvaluator(providers.Evaluator):
+    """
+    Scores runs with a long-lived perl process (``bin/gdeval_worker.pl``) that holds the qrels. The process is
+    started on first use (and again in a forked child process), and stopped by :meth:`close`.
+    """
+    def __init__(self, measures, qrels, invocations):
+        super().__init__(measures, {q.query_id for q in qrels})
+        self.qrels = qrels
+        self.invocations = {cutoff: (NDCG, ERR) for cutoff, NDCG, ERR in invocations}
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+    def _iter_calc(self, run):
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._worker = self._start_worker()
+                self._worker_pid = os.getpid()
+            lines = self._request(self._worker, self._run_lines(run))
+        for line in lines:
+            arr = line.split(',')
+            assert len(arr) == 4
+            qid, cutoff, ndcg, err = arr
+            nDCG_measure, ERR_measure = self.invocations[int(cutoff)]
+            if nDCG_measure is not None:
+                yield Metric(query_id=qid, measure=nDCG_measure, value=float(ndcg))
+            if ERR_measure is not None:
+                yield Metric(query_id=qid, measure=ERR_measure, value=float(err))
+
+    def _start_worker(self):
+        # perl compiles the whole script before it starts reading the qrels, so the script file is only needed until
+        # the worker is ready
+        with tempfile.NamedTemporaryFile() as perlf:
+            perlf.write(pkgutil.get_data('ir_measures', 'bin/gdeval_worker.pl'))
+            perlf.flush()
+            cmd = ['perl', perlf.name] + [str(cutoff) for cutoff in self.invocations]
+            worker = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, encoding='utf8')
+            qrels = ('{query_id} 0 {doc_id} {relevance}\n'.format(**qrel._asdict()) for qrel in self.qrels)
+            self._request(worker, qrels, end='ready')
+        return worker
+
+    def _run_lines(self, run):
+        ranks = {}
+        for scoreddoc in ir_measures.util.RunConverter(run).as_namedtuple_iter():
+            rank = ranks.get(scoreddoc.query_id, 0)
+            ranks[scoreddoc.query_id] = rank + 1
+            yield '{query_id} Q0 {doc_id} {rank} {score} run\n'.format(**scoreddoc._asdict(), rank=rank)
+
+    def _request(self, worker, lines, end=''):
+        # sends lines followed by an empty line, and returns the lines of the reply (up to the end line)
+        try:
+            worker.stdin.writelines(lines)
+            worker.stdin.write('\n')
+            worker.stdin.flush()
+        except BrokenPipeError:
+            pass # the worker failed; reported below
+        reply = []
+        for line in worker.stdout:
+            line = line.rstrip('\n')
+            if line == end:
+                return reply
+            reply.append(line)
+        self._worker = None
+        raise subprocess.CalledProcessError(worker.wait(), worker.args)
+
+    def close(self):
+        """Stops the perl process."""
+        worker, self._worker = getattr(self, '_worker', None), None # (may be called on a partly constructed object)
+        if worker is not None and self._worker_pid == os.getpid():
+            worker.stdin.close()
+            worker.wait()
+            worker.stdout.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except OSError:
+            # e.g., BrokenPipeError when flushing stdin to a worker that has already exited, or ProcessLookupError
+            # if it has already been reaped
+            pass
+
+
+MAX_JUDGMENT = 4 # the maximum relevance level allowed by gdeval.pl
+
+
+class GdevalNativeEvaluator(providers.Evaluator):
+    """
+    Calculates gdeval's measures with NumPy. The judgments and the ideal DCG at each cutoff are prepared once, up
+    front; each run is then evaluated at every cutoff from the same matrix of gains (queries x ranks).
+
+    Sums and products are accumulated rank by rank (and with the same natural-log discount) as in gdeval.pl, so the
+    values match it exactly.
+    """
+    def __init__(self, measures, qrels, invocations):
+        np = ir_measures.lazylibs.numpy()
+        super().__init__(measures, set(qrels.query_ids[np.unique(qrels.query_codes)].tolist()))
+        self.invocations = invocations
+        self.cutoffs = np.array(sorted({cutoff for cutoff, _, _ in invocations}), dtype=np.int64)
+        if np.any(qrels.relevance > MAX_JUDGMENT):
+            raise ValueError(f'gdeval supports relevance levels up to {MAX_JUDGMENT}; found {qrels.relevance.max()}')
+
+        # queries are identified by their topic numbers, which are also used to order them
+        topics = [_gdeval_topic(qid) for qid in qrels.query_ids.tolist()]
+        self.topic_ids = sorted(set(topics), key=lambda topic: (int(topic), topic))
+        self.topic_lookup = {topic: i for i, topic in enumerate(self.topic_ids)}
+        self.doc_lookup = {did: i for i, did in enumerate(qrels.doc_ids.tolist())}
+        self.num_docs = max(len(qrels.doc_ids), 1)
+
+        # only positive judgments are kept; when a document is judged more than once, gdeval.pl looks up its lowest
+        # judgment, but all of them count towards the ideal DCG
+        keep = qrels.relevance > 0
+        topic_map = np.array([self.topic_lookup[topic] for topic in topics], dtype=np.int64)
+        topic_codes = topic_map[qrels.query_codes[keep]] if len(topic_map) else np.zeros(0, dtype=np.int64)
+        relevance = qrels.relevance[keep].astype(np.int64)
+        keys = topic_codes * self.num_docs + qrels.doc_codes[keep]
+        order = np.lexsort((relevance, keys))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = keys[order][1:] != keys[order][:-1]
+        self.keys, self.relevance = keys[order][first], relevance[order][first]
+
+        # ideal DCG of each topic (rows) at each cutoff (columns)
+        num_rel = np.bincount(topic_codes, minlength=len(self.topic_ids))
+        self.seen = num_rel > 0
+        order = np.lexsort((-relevance, topic_codes))
+        ideal_gains = _gain_matrix(topic_codes[order], relevance[order], len(self.topic_ids), self.cutoffs.max(initial=0))
+        ideal = np.cumsum(_dcg_terms(ideal_gains), axis=1)
+        self.ideal = _at_cutoffs(ideal, self.cutoffs)
+
+    def _iter_calc(self, run):
+        np = ir_measures.lazylibs.numpy()
+        run = ir_measures.util.RunConverter(run).as_columnar()
+        if len(self.cutoffs) == 0 or len(run.query_codes) == 0:
+            return
+        topic_map = np.array([self.topic_lookup.get(_gdeval_topic(qid), -1) for qid in run.query_ids.tolist()], dtype=np.int64)
+        # gdeval.pl skips the queries that have no relevant documents
+        known = topic_map >= 0
+        topic_map[known] = np.where(self.seen[topic_map[known]], topic_map[known], -1)
+        topic_codes = topic_map[run.query_codes]
+        rows = np.flatnonzero(topic_codes >= 0)
+        topic_codes, doc_codes, scores = topic_codes[rows], run.doc_codes[rows], run.scores[rows].astype(np.float64)
+
+        # sort by topic, then score (descending), then doc_id (descending); duplicate documents are kept
+        from ir_measures.providers.native_provider import _rank_order
+        order = _rank_order(topic_codes, scores, doc_codes, run.doc_ids)
+        topic_codes, doc_codes = topic_codes[order], doc_codes[order]
+
+        # look up the judgment of each returned document
+        doc_map = np.array([self.doc_lookup.get(did, -1) for did in run.doc_ids.tolist()], dtype=np.int64)
+        qrel_doc_codes = doc_map[doc_codes]
+        keys = topic_codes * self.num_docs + qrel_doc_codes
+        idx = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        judged = (qrel_doc_codes >= 0) & (self.keys[idx] == keys) if len(self.keys) else np.zeros(len(keys), dtype=bool)
+        relevance = np.where(judged, self.relevance[idx] if len(self.keys) else 0, 0)
+
+        segments, codes = np.unique(topic_codes, return_inverse=True)
+        gains = _gain_matrix(codes, relevance, len(segments), self.cutoffs.max())
+        ndcg = _at_cutoffs(np.cumsum(_dcg_terms(gains), axis=1), self.cutoffs) / self.ideal[segments]
+        err = _at_cutoffs(np.cumsum(_err_terms(gains), axis=1), self.cutoffs)
+
+        topic_ids = [self.topic_ids[code] for code in segments.tolist()]
+        for cutoff, nDCG_measure, ERR_measure in self.invocations:
+            col = int(np.searchsorted(self.cutoffs, cutoff))
+            for query_id, ndcg_value, err_value in zip(topic_ids, ndcg[:, col].tolist(), err[:, col].tolist()):
+                # gdeval.pl reports values with 5 decimal places
+                if nDCG_measure is not None:
+                    yield Metric(query_id=query_id, measure=nDCG_measure, value=float(f'{ndcg_value:.5f}'))
+                if ERR_measure is not None:
+                    yield Metric(query_id=query_id, measure=ERR_measure, value=float(f'{err_value:.5f}'))
+
+
+def _gdeval_topic(query_id):
+    # gdeval.pl strips everything up to the last "-" from query IDs, and requires the rest to be a number
+    topic = re.sub(r'^.*-', '', query_id)
+    if not re.fullmatch(r'[0-9]+', topic):
+        raise ValueError(f'gdeval requires numeric query IDs (optionally with a prefix ending in "-"); found {query_id!r}')
+    return topic
+
+
+def _gain_matrix(segment_codes, relevance, num_segments, depth):
+    # (segments x ranks) matrix of relevance levels, for rows grouped by segment in rank order, up to depth; shorter
+    # segments are padded with 0 (which adds nothing to DCG or ERR)
+    np = ir_measures.lazylibs.numpy()
+    counts = np.bincount(segment_codes, minlength=num_segments)
+    starts = np.cumsum(counts) - counts
+    ranks = np.arange(len(segment_codes)) - np.repeat(starts, counts)
+    depth = int(min(depth, counts.max(initial=0)))
+    keep = ranks < depth
+    result = np.zeros((num_segments, depth), dtype=np.int64)
+    result[segment_codes[keep], ranks[keep]] = relevance[keep]
+    return result
+
+
+def _dcg_terms(gains):
+    # (2^gain - 1) / ln(rank + 1), with the same discount as gdeval.pl (computed by the C library, like perl's log)
+    np = ir_measures.lazylibs.numpy()
+    discount = np.array([math.log(i + 2) for i in range(gains.shape[1])])
+    return (2. ** gains - 1) / discount
+
+
+def _err_terms(gains):
+    # the probability that the user stops at each rank, divided by the rank
+    np = ir_measures.lazylibs.numpy()
+    stop = (2. ** gains - 1) / 2 ** MAX_JUDGMENT
+    decay = np.cumprod(1 - stop, axis=1)
+    decay = np.concatenate([np.ones((gains.shape[0], 1)), decay[:, :-1]], axis=1)
+    return stop * decay / np.arange(1, gains.shape[1] + 1)
+
+
+def _at_cutoffs(cumulative, cutoffs):
+    # the values of a (segments x ranks) cumulative matrix at each cutoff (clipped to the available ranks)
+    np = ir_measures.lazylibs.numpy()
+    if cumulative.shape[1] == 0:
+        return np.zeros((cumulative.shape[0], len(cutoffs)))
+    return cumulative[:, np.minimum(cutoffs, cumulative.shape[1]) - 1]
+
+
 providers.register(GdevalProvider())
@@ -10,6 +10,8 @@ class JudgedProvider(providers.Provider):
     Adapted from OpenNIR's implementation: https://github.com/Georgetown-IR-Lab/OpenNIR/blob/master/onir/metrics/judged.py
     """
     NAME = 'judged'
+    INPUT_FORMAT = 'dict_of_dict'
+    DEDUPLICATES_RUN = True
     SUPPORTED_MEASURES = [
         measures._Judged(cutoff=Any())
     ]
@@ -1,7 +1,6 @@
 import ir_measures
 from ir_measures import providers, measures, Metric
 from ir_measures.providers.base import Any, Choices, NOT_PROVIDED
-from ir_measures.bin import msmarco_eval
 import sys
 
 class MsMarcoProvider(providers.Provider):
@@ -9,6 +8,8 @@ class MsMarcoProvider(providers.Provider):
     MS MARCO's implementation of RR
     """
     NAME = 'msmarco'
+    INPUT_FORMAT = 'dict_of_dict'
+    DEDUPLICATES_RUN = True
     SUPPORTED_MEASURES = [
         measures._RR(cutoff=Any(), rel=Any(), judged_only=Choices(False)),
     ]
@@ -37,6 +38,7 @@ class MsMarcoEvaluator(providers.Evaluator):
         self.invocations = invocations
 
     def _iter_calc(self, run):
+        from ir_measures.bin import msmarco_eval
         run = ir_measures.util.RunConverter(run).as_dict_of_dict()
         sorted_run = {q: list(sorted(run[q].items(), key=lambda x: (-x[1], x[0]))) for q in run}
         sorted_run = {q: [did for did, _ in v] for q, v in sorted_run.items()}
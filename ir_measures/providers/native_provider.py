@@ -0,0 +1,542 @@
+from typing import Dict, TYPE_CHECKING
+import ir_measures
+from ir_measures import providers, measures, Metric
+from ir_measures.util import CurveResults
+from ir_measures.measures.base import Measure, SumAgg
+from ir_measures.providers.base import Any, Choices, NOT_PROVIDED
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class NativeProvider(providers.Provider):
+    """
+    ir_measures' own implementation of the core trec_eval measures, computed with vectorized NumPy operations.
+
+    Runs and qrels are converted to :class:`~ir_measures.util.ColumnarRun` /
+    :class:`~ir_measures.util.ColumnarQrels` rather than nested dicts, and every cutoff of a measure family is
+    read off the same cumulative arrays. Results follow trec_eval's conventions (e.g., ties in score are broken
+    by descending ``doc_id``, and negative relevance levels provide no gain), so they match
+    :ref:`providers.pytrec_eval`.
+    """
+    NAME = 'native'
+    INPUT_FORMAT = 'columnar'
+    COST_SETUP = 50.
+    COST_PER_PASS = 20.
+    COST_PER_ROW = 0.02
+    EQUIVALENT_TO = ('pytrec_eval',)
+    DEDUPLICATES_RUN = True
+    SUPPORTED_MEASURES = [
+        measures._P(cutoff=Any(), rel=Any(), judged_only=Any()),
+        measures._RR(cutoff=Choices(NOT_PROVIDED), rel=Any(), judged_only=Any()),
+        measures._Rprec(rel=Any(), judged_only=Any()),
+        measures._AP(cutoff=Any(), rel=Any(), judged_only=Any()),
+        measures._nDCG(cutoff=Any(), dcg=Choices('log2'), gains=Any(), judged_only=Any()),
+        measures._R(cutoff=Any(), rel=Any(), judged_only=Any()),
+        measures._NumRet(rel=Any()),
+        measures._NumQ(),
+        measures._NumRel(rel=Any()),
+        measures._SetAP(rel=Any(), judged_only=Any()),
+        measures._SetF(rel=Any(), beta=Any(), judged_only=Any()),
+        measures._SetP(rel=Any(), relative=Any(), judged_only=Any()),
+        measures._SetR(rel=Any()),
+        measures._Success(rel=Any(), cutoff=Any(), judged_only=Any()),
+    ]
+
+    def _evaluator(self, measures, qrels):
+        for measure in measures:
+            if not self.supports(measure):
+                raise ValueError(f'unsupported measure {measure}')
+        qrels = ir_measures.util.QrelsConverter(qrels).as_columnar()
+        return NativeEvaluator(measures, NativeQrels(qrels))
+
+    def dense_evaluator(self, measures) -> 'DenseEvaluator':
+        """
+        Returns a :class:`DenseEvaluator` for these measures, which works directly on (queries x candidates) matrices
+        of scores and relevance labels.
+        """
+        self._check_available()
+        measures = list(measures)
+        for measure in measures:
+            if not self.supports(measure):
+                raise ValueError(f'unsupported measure {measure}')
+        return DenseEvaluator(measures)
+
+    def calc_curve(self, measures, qrels, run, cutoffs) -> CurveResults:
+        """
+        Calculates measures at every cutoff in ``cutoffs`` (an int ``K`` for ``1..K``, or a sequence of cutoffs) in
+        a single pass. See :func:`ir_measures.calc_curve`.
+        """
+        self._check_available()
+        measures = _curve_measures(measures)
+        for measure in measures:
+            # P (etc.) require a cutoff on their own, so check support with a stand-in
+            if not self.supports(measure@1):
+                raise ValueError(f'unsupported measure {measure}')
+        qrels = ir_measures.util.QrelsConverter(qrels).as_columnar()
+        return NativeEvaluator(measures, NativeQrels(qrels)).calc_curve(run, cutoffs)
+
+    def initialize(self):
+        try:
+            ir_measures.lazylibs.numpy()
+        except ImportError as ex:
+            raise RuntimeError('numpy not available', ex)
+
+    def install_instructions(self):
+        return 'pip install numpy'
+
+
+class NativeQrels:
+    """
+    Qrels indexed for joining with runs: a sorted (query, doc) key array with the relevance of each key, plus
+    per-query statistics that are computed on demand and cached.
+    """
+    def __init__(self, qrels):
+        np = ir_measures.lazylibs.numpy()
+        self.query_ids = qrels.query_ids
+        self.query_lookup = {qid: i for i, qid in enumerate(qrels.query_ids.tolist())}
+        self.doc_lookup = {did: i for i, did in enumerate(qrels.doc_ids.tolist())}
+        self.num_docs = len(qrels.doc_ids)
+        keys = qrels.query_codes.astype(np.int64) * self.num_docs + qrels.doc_codes
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        # when a (query, doc) pair appears multiple times, the last one wins (like building a dict-of-dict)
+        last = _last_of_runs(keys)
+        self.keys = keys[last]
+        self.query_codes = self.keys // max(self.num_docs, 1)
+        self.relevance = qrels.relevance[order][last].astype(np.int64)
+        self.qids = set(self.query_ids[np.unique(self.query_codes)].tolist())
+        self._num_rel = {}
+        self._ideal = {}
+
+    def update(self, qrels):
+        """
+        Adds the judgments of ``qrels`` (a :class:`~ir_measures.util.ColumnarQrels`) in place, replacing existing
+        judgments of the same (query, doc) pairs. Only the new IDs are interned; the per-query statistics are
+        recomputed on demand.
+        """
+        np = ir_measures.lazylibs.numpy()
+        old_num_docs = max(self.num_docs, 1)
+        query_map = np.fromiter((self.query_lookup.setdefault(qid, len(self.query_lookup)) for qid in qrels.query_ids.tolist()), dtype=np.int64, count=len(qrels.query_ids))
+        doc_map = np.fromiter((self.doc_lookup.setdefault(did, len(self.doc_lookup)) for did in qrels.doc_ids.tolist()), dtype=np.int64, count=len(qrels.doc_ids))
+        self.query_ids = ir_measures.util._object_array(list(self.query_lookup))
+        self.num_docs = len(self.doc_lookup)
+        # the keys depend on the number of docs, so the existing ones are re-keyed
+        old_keys = (self.keys // old_num_docs) * self.num_docs + self.keys % old_num_docs
+        keys = query_map[qrels.query_codes] * self.num_docs + doc_map[qrels.doc_codes]
+        order = np.argsort(keys, kind='stable')
+        last = _last_of_runs(keys[order])
+        keys, relevance = keys[order][last], qrels.relevance[order][last].astype(np.int64)
+        keep = ~np.isin(old_keys, keys)
+        keys = np.concatenate([old_keys[keep], keys])
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.relevance = np.concatenate([self.relevance[keep], relevance])[order]
+        self.query_codes = self.keys // max(self.num_docs, 1)
+        self.qids.update(qrels.query_ids[np.unique(qrels.query_codes)].tolist())
+        self._num_rel = {}
+        self._ideal = {}
+
+    def num_rel(self, rel):
+        # number of documents with relevance >= rel for each query
+        if rel not in self._num_rel:
+            np = ir_measures.lazylibs.numpy()
+            self._num_rel[rel] = np.bincount(self.query_codes[self.relevance >= rel], minlength=len(self.query_ids))
+        return self._num_rel[rel]
+
+    def ideal_dcg(self, gains):
+        # cumulative DCG of the ideal ranking of each query, as (offsets, cumulative values)
+        key = _gains_key(gains)
+        if key not in self._ideal:
+            np = ir_measures.lazylibs.numpy()
+            gain = _gain(self.relevance, gains)
+            order = np.lexsort((-gain, self.query_codes))
+            gain, query_codes = gain[order], self.query_codes[order]
+            keep = gain > 0
+            gain, query_codes = gain[keep], query_codes[keep]
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(query_codes, minlength=len(self.query_ids)))])
+            ranks = np.arange(len(gain)) - np.repeat(offsets[:-1], np.diff(offsets))
+            self._ideal[key] = offsets, _segment_cumsum(gain / np.log2(ranks + 2), offsets)
+        return self._ideal[key]
+
+    def rank(self, run):
+        """
+        Joins a :class:`~ir_measures.util.ColumnarRun` with these qrels and sorts it into rank order, returning
+        a :class:`NativeRanking`. Queries that do not appear in the qrels are dropped.
+        """
+        np = ir_measures.lazylibs.numpy()
+        query_map = np.array([self.query_lookup.get(qid, -1) for qid in run.query_ids.tolist()], dtype=np.int64)
+        doc_map = np.array([self.doc_lookup.get(did, -1) for did in run.doc_ids.tolist()], dtype=np.int64)
+        query_codes = query_map[run.query_codes] if len(query_map) else np.zeros(0, dtype=np.int64)
+        rows = np.flatnonzero(query_codes >= 0)
+        query_codes, doc_codes, scores = query_codes[rows], run.doc_codes[rows], run.scores[rows].astype(np.float64)
+
+        # drop duplicate documents for a query; the last one wins (like building a dict-of-dict)
+        keys = query_codes * len(run.doc_ids) + doc_codes
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        if len(keys) and (keys[1:] == keys[:-1]).any():
+            rows = np.sort(order[_last_of_runs(keys)])
+            query_codes, doc_codes, scores = query_codes[rows], doc_codes[rows], scores[rows]
+
+        order = _rank_order(query_codes, scores, doc_codes, run.doc_ids)
+        query_codes, doc_codes = query_codes[order], doc_codes[order]
+
+        # look up the relevance of each returned document
+        qrel_doc_codes = doc_map[doc_codes] if len(doc_map) else np.zeros(0, dtype=np.int64)
+        keys = query_codes * self.num_docs + qrel_doc_codes
+        idx = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        judged = (qrel_doc_codes >= 0) & (self.keys[idx] == keys) if len(self.keys) else np.zeros(len(keys), dtype=bool)
+        relevance = np.where(judged, self.relevance[idx] if len(self.keys) else 0, 0)
+
+        segment_codes, starts = np.unique(query_codes, return_index=True)
+        offsets = np.append(starts, len(query_codes))
+        return NativeRanking(segment_codes, offsets, relevance, judged)
+
+
+class DenseQrels(NativeQrels):
+    """
+    The relevance labels of a dense (queries x candidates) matrix, in the layout of :class:`NativeQrels` but without
+    any IDs: query ``i`` is row ``i``, and only the entries selected by ``mask`` are judged.
+    """
+    def __init__(self, labels, mask):
+        np = ir_measures.lazylibs.numpy()
+        self.query_ids = np.arange(labels.shape[0])
+        self.query_codes = np.nonzero(mask)[0]
+        self.relevance = labels[mask].astype(np.int64)
+        self.qids = set()
+        self._num_rel = {}
+        self._ideal = {}
+
+
+class NativeRanking:
+    """
+    A run in rank order, with the relevance of each document. Rows are grouped into one segment per query:
+    rows ``offsets[i]:offsets[i+1]`` belong to the query with code ``query_codes[i]``.
+    """
+    def __init__(self, query_codes, offsets, relevance, judged):
+        self.query_codes = query_codes
+        self.offsets = offsets
+        self.relevance = relevance
+        self.judged = judged
+        self._cache = {}
+
+    def cached(self, key, fn):
+        if key not in self._cache:
+            self._cache[key] = fn()
+        return self._cache[key]
+
+    @property
+    def lengths(self):
+        np = ir_measures.lazylibs.numpy()
+        return np.diff(self.offsets)
+
+    @property
+    def ranks(self):
+        # 0-based rank of each row within its query
+        np = ir_measures.lazylibs.numpy()
+        return self.cached('ranks', lambda: np.arange(len(self.relevance)) - np.repeat(self.offsets[:-1], self.lengths))
+
+    def judged_only(self):
+        # removes unjudged documents (and those with negative relevance, following trec_eval)
+        def _build():
+            np = ir_measures.lazylibs.numpy()
+            keep = self.judged & (self.relevance >= 0)
+            segments = np.repeat(np.arange(len(self.query_codes)), self.lengths)
+            counts = np.bincount(segments[keep], minlength=len(self.query_codes))
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            return NativeRanking(self.query_codes, offsets, self.relevance[keep], self.judged[keep])
+        return self.cached('judged_only', _build)
+
+    def at_depth(self, cumulative, depth=None):
+        # the value of a per-query cumulative array at the given depth (clipped to the number of rows); with a
+        # (1 x depths) row, returns a (queries x depths) array
+        np = ir_measures.lazylibs.numpy()
+        depth = _clip_depth(self.lengths, depth)
+        if len(cumulative) == 0:
+            return np.zeros(depth.shape)
+        idx = _as_column(self.offsets[:-1], depth) + depth - 1
+        return np.where(depth > 0, cumulative[np.maximum(idx, 0)], 0.)
+
+    def relevant(self, rel):
+        return self.cached(('relevant', rel), lambda: self.judged & (self.relevance >= rel))
+
+    def cum_relevant(self, rel):
+        return self.cached(('cum_relevant', rel), lambda: _segment_cumsum(self.relevant(rel), self.offsets))
+
+    def cum_precision(self, rel):
+        # cumulative sum of the precision at each relevant document (the numerator of AP)
+        def _build():
+            precision = self.cum_relevant(rel) / (self.ranks + 1)
+            return _segment_cumsum(precision * self.relevant(rel), self.offsets)
+        return self.cached(('cum_precision', rel), _build)
+
+    def cum_dcg(self, gains):
+        def _build():
+            np = ir_measures.lazylibs.numpy()
+            gain = _gain(self.relevance, gains)
+            gain = np.where(self.judged & (gain > 0), gain, 0.)
+            return _segment_cumsum(gain / np.log2(self.ranks + 2), self.offsets)
+        return self.cached(('cum_dcg', _gains_key(gains)), _build)
+
+
+class NativeEvaluator(providers.Evaluator):
+    def __init__(self, measures, qrels):
+        super().__init__(measures, qrels.qids)
+        self.qrels = qrels
+
+    def update_qrels(self, qrels):
+        qrels = ir_measures.util.QrelsConverter(qrels).as_columnar()
+        self.qrels.update(qrels)
+        return providers.base._qrels_query_ids(qrels)
+
+    def _iter_calc(self, run):
+        columns = list(self._iter_columns(run))
+        if columns:
+            query_ids = columns[0][1].tolist()
+            values = [(measure, measure_values.tolist()) for measure, _, measure_values in columns]
+            for i, query_id in enumerate(query_ids):
+                for measure, measure_values in values:
+                    yield Metric(query_id=query_id, measure=measure, value=measure_values[i])
+
+    def _iter_columns(self, run):
+        ranking = self.qrels.rank(ir_measures.util.RunConverter(run).as_columnar())
+        query_ids = self.qrels.query_ids[ranking.query_codes]
+        for measure in self.measures:
+            yield measure, query_ids, _calc_measure(measure, ranking, self.qrels)
+
+    def calc_curve(self, run, cutoffs) -> CurveResults:
+        """
+        Returns the values of this evaluator's measures (which must not have cutoffs) at each of ``cutoffs``, for
+        every query in the qrels. Queries missing from the run have a value of 0 at every cutoff.
+        """
+        np = ir_measures.lazylibs.numpy()
+        measures = _curve_measures(self.measures)
+        cutoffs = _curve_cutoffs(cutoffs)
+        ranking = self.qrels.rank(ir_measures.util.RunConverter(run).as_columnar())
+        # rows for all the queries in the qrels (in order of their codes), filled in for those in the run
+        query_codes = np.unique(self.qrels.query_codes)
+        rows = np.searchsorted(query_codes, ranking.query_codes)
+        per_query = {}
+        for measure in measures:
+            values = np.zeros((len(query_codes), len(cutoffs)))
+            values[rows] = _calc_measure(measure, ranking, self.qrels, cutoffs)
+            per_query[measure] = values
+        return CurveResults(cutoffs, self.qrels.query_ids[query_codes].tolist(), per_query, _curve_aggregate(per_query))
+
+
+class DenseEvaluator:
+    """
+    Evaluates rankings given as dense NumPy arrays, e.g., validation scores of a re-ranker over a fixed set of
+    candidates per query. No IDs are involved: row ``i`` of each matrix is a query, and its columns are candidates.
+
+    ``scores`` is a (queries x candidates) array of scores and ``labels`` an array of the same shape with the integer
+    relevance of each candidate; every candidate is considered judged. For ragged candidate lists, ``mask`` selects
+    the valid entries (``True``). Candidates are ranked by descending score, with ties kept in column order.
+
+    Obtain one with :func:`ir_measures.dense_evaluator`.
+    """
+    def __init__(self, measures):
+        self.measures = measures
+
+    def calc(self, scores, labels, mask=None) -> Dict[Measure, 'np.ndarray']:
+        """Returns the value of each measure for every query (row), as arrays of length ``queries``."""
+        ranking, qrels = _dense_ranking(scores, labels, mask)
+        return {measure: _calc_measure(measure, ranking, qrels) for measure in self.measures}
+
+    def calc_aggregate(self, scores, labels, mask=None) -> Dict[Measure, float]:
+        """Returns the aggregated value of each measure over all queries (rows)."""
+        result = {}
+        for measure, values in self.calc(scores, labels, mask).items():
+            if isinstance(measure.aggregator(), SumAgg):
+                result[measure] = float(values.sum())
+            else:
+                result[measure] = float(values.mean()) if len(values) else float('NaN')
+        return result
+
+
+def _dense_ranking(scores, labels, mask):
+    np = ir_measures.lazylibs.numpy()
+    scores = np.asarray(scores, dtype=np.float64)
+    labels = np.asarray(labels)
+    if scores.ndim != 2 or labels.shape != scores.shape:
+        raise ValueError(f'scores and labels must be 2-dimensional arrays of the same shape (queries x candidates); found {scores.shape} and {labels.shape}')
+    if mask is None:
+        mask = np.ones(scores.shape, dtype=bool)
+    else:
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != scores.shape:
+            raise ValueError(f'mask must have the same shape as scores; found {mask.shape} and {scores.shape}')
+    # sort each row by descending score (stable, so ties keep their column order); masked entries are dropped after
+    order = np.argsort(np.where(mask, -scores, np.inf), axis=1, kind='stable')
+    sorted_mask = np.take_along_axis(mask, order, axis=1)
+    relevance = np.take_along_axis(labels, order, axis=1)[sorted_mask].astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(mask.sum(axis=1))])
+    ranking = NativeRanking(np.arange(scores.shape[0]), offsets, relevance, np.ones(len(relevance), dtype=bool))
+    return ranking, DenseQrels(labels, mask)
+
+
+def _calc_measure(measure, ranking, qrels, cutoffs=None):
+    # With an array of cutoffs (for the measures in CURVE_MEASURES), returns a (queries x cutoffs) array instead
+    np = ir_measures.lazylibs.numpy()
+    if 'judged_only' in measure.SUPPORTED_PARAMS and measure['judged_only']:
+        ranking = ranking.judged_only()
+    cutoff = measure['cutoff'] if 'cutoff' in measure.SUPPORTED_PARAMS else NOT_PROVIDED
+    cutoff = None if cutoff is NOT_PROVIDED else cutoff
+    rel = measure['rel'] if 'rel' in measure.SUPPORTED_PARAMS else NOT_PROVIDED
+    num_rel = qrels.num_rel(1 if rel is NOT_PROVIDED else rel)[ranking.query_codes]
+    if cutoffs is not None:
+        # a row of cutoffs gives a column for each (a 1-dimensional depth is per query, e.g., for Rprec)
+        cutoff = cutoffs[None, :]
+        num_rel = num_rel[:, None]
+
+    if measure.NAME == 'P':
+        return ranking.at_depth(ranking.cum_relevant(rel), cutoff) / cutoff
+    if measure.NAME == 'R':
+        return _safe_div(ranking.at_depth(ranking.cum_relevant(rel), cutoff), num_rel)
+    if measure.NAME == 'Success':
+        return (ranking.at_depth(ranking.cum_relevant(rel), cutoff) > 0).astype(float)
+    if measure.NAME == 'RR':
+        relevant = np.flatnonzero(ranking.relevant(rel))
+        segments = np.searchsorted(ranking.offsets, relevant, side='right') - 1
+        segments, first = np.unique(segments, return_index=True)
+        result = np.zeros(len(ranking.query_codes))
+        result[segments] = 1. / (ranking.ranks[relevant[first]] + 1)
+        return result
+    if measure.NAME == 'AP':
+        return _safe_div(ranking.at_depth(ranking.cum_precision(rel), cutoff), num_rel)
+    if measure.NAME == 'Rprec':
+        return _safe_div(ranking.at_depth(ranking.cum_relevant(rel), num_rel), num_rel)
+    if measure.NAME == 'nDCG':
+        gains = None if measure['gains'] is NOT_PROVIDED else measure['gains']
+        dcg = ranking.at_depth(ranking.cum_dcg(gains), cutoff)
+        ideal_offsets, ideal_cum = qrels.ideal_dcg(gains)
+        ideal_depth = _clip_depth(np.diff(ideal_offsets)[ranking.query_codes], cutoff)
+        ideal_idx = np.maximum(_as_column(ideal_offsets[ranking.query_codes], ideal_depth) + ideal_depth - 1, 0)
+        ideal = np.where(ideal_depth > 0, ideal_cum[ideal_idx] if len(ideal_cum) else 0., 0.)
+        return _safe_div(dcg, ideal)
+    if measure.NAME == 'NumRet':
+        if rel is NOT_PROVIDED:
+            return ranking.lengths.astype(float)
+        return ranking.at_depth(ranking.cum_relevant(rel)).astype(float)
+    if measure.NAME == 'NumQ':
+        return np.ones(len(ranking.query_codes))
+    if measure.NAME == 'NumRel':
+        return num_rel.astype(float)
+
+    # set-based measures
+    num_ret = ranking.lengths
+    num_rel_ret = ranking.at_depth(ranking.cum_relevant(rel))
+    if measure.NAME == 'SetP':
+        if measure['relative']:
+            return _safe_div(num_rel_ret, np.minimum(num_ret, num_rel))
+        return _safe_div(num_rel_ret, num_ret)
+    if measure.NAME == 'SetR':
+        return _safe_div(num_rel_ret, num_rel)
+    if measure.NAME == 'SetAP':
+        return _safe_div(num_rel_ret, num_ret) * _safe_div(num_rel_ret, num_rel)
+    if measure.NAME == 'SetF':
+        precision, recall = _safe_div(num_rel_ret, num_ret), _safe_div(num_rel_ret, num_rel)
+        # trec_eval weights by beta (not beta squared); mirror it for consistency
+        beta = measure['beta']
+        return _safe_div((1 + beta) * precision * recall, beta * precision + recall)
+    raise ValueError(f'unsupported measure {measure}')
+
+
+# the measures (without cutoffs) supported by calc_curve
+CURVE_MEASURES = ('P', 'R', 'AP', 'nDCG', 'Success')
+
+
+def _curve_measures(measures):
+    measures = list(measures)
+    for measure in measures:
+        if measure.NAME not in CURVE_MEASURES:
+            raise ValueError(f'{measure} is not supported for curves; supported measures: {", ".join(CURVE_MEASURES)}')
+        if measure['cutoff'] is not NOT_PROVIDED:
+            raise ValueError(f'{measure} has a cutoff; give the measure without one (the cutoffs are given separately)')
+    return measures
+
+
+def _curve_cutoffs(cutoffs):
+    np = ir_measures.lazylibs.numpy()
+    if isinstance(cutoffs, int):
+        cutoffs = np.arange(1, cutoffs + 1)
+    cutoffs = np.asarray(cutoffs, dtype=np.int64)
+    if cutoffs.ndim != 1 or (cutoffs < 1).any():
+        raise ValueError('cutoffs must be a positive int or a sequence of positive ints')
+    return cutoffs
+
+
+def _curve_aggregate(per_query):
+    np = ir_measures.lazylibs.numpy()
+    return {measure: values.mean(axis=0) if len(values) else np.full(values.shape[1], float('NaN')) for measure, values in per_query.items()}
+
+
+def _clip_depth(lengths, depth):
+    # depth is None (all rows), a single depth, a depth for each query, or a (1 x depths) row (giving a column for each)
+    np = ir_measures.lazylibs.numpy()
+    if depth is None:
+        return lengths
+    if np.ndim(depth) == 2:
+        return np.minimum(lengths[:, None], depth)
+    return np.minimum(lengths, depth)
+
+
+def _as_column(values, like):
+    # values of each query, shaped to broadcast against like (which may have a column for each depth)
+    return values[:, None] if like.ndim == 2 else values
+
+
+def _last_of_runs(keys):
+    # mask of the last element of each run of equal (sorted) keys
+    np = ir_measures.lazylibs.numpy()
+    result = np.ones(len(keys), dtype=bool)
+    result[:-1] = keys[1:] != keys[:-1]
+    return result
+
+
+def _rank_order(query_codes, scores, doc_codes, doc_ids, descending_doc_ids=True):
+    # the order of rows by query, then score (descending), then doc_id (descending, following trec_eval, unless
+    # descending_doc_ids=False)
+    np = ir_measures.lazylibs.numpy()
+    order = np.lexsort((-scores, query_codes))
+    tied = (query_codes[order][1:] == query_codes[order][:-1]) & (scores[order][1:] == scores[order][:-1])
+    if tied.any():
+        # only the doc_ids involved in ties need to be compared as strings
+        tied_docs = np.unique(doc_codes[order][np.concatenate([tied, [False]]) | np.concatenate([[False], tied])])
+        doc_order = np.zeros(len(doc_ids), dtype=np.int64)
+        doc_order[tied_docs[np.argsort(np.array(doc_ids[tied_docs].tolist(), dtype=str))]] = np.arange(len(tied_docs))
+        doc_order = doc_order[doc_codes]
+        order = np.lexsort((-doc_order if descending_doc_ids else doc_order, -scores, query_codes))
+    return order
+
+
+def _segment_cumsum(values, offsets):
+    # cumulative sum of values that restarts at the beginning of each segment
+    np = ir_measures.lazylibs.numpy()
+    cumsum = np.cumsum(values, dtype=np.float64)
+    before = np.concatenate([[0.], cumsum])[offsets[:-1]]
+    return cumsum - np.repeat(before, np.diff(offsets))
+
+
+def _safe_div(numerator, denominator):
+    np = ir_measures.lazylibs.numpy()
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros(np.broadcast(numerator, denominator).shape), where=denominator != 0)
+
+
+def _gains_key(gains):
+    return None if gains is None else tuple(sorted(gains.items()))
+
+
+def _gain(relevance, gains):
+    np = ir_measures.lazylibs.numpy()
+    gain = relevance.astype(np.float64)
+    if gains is not None:
+        levels, inverse = np.unique(relevance, return_inverse=True)
+        gain = np.array([gains.get(r, r) for r in levels.tolist()], dtype=np.float64)[inverse]
+    return gain
+
+
+providers.register(NativeProvider())
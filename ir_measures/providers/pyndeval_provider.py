@@ -1,31 +1,54 @@
+import math
 import sys
 import ir_measures
 from ir_measures import providers, measures
 from ir_measures.providers.base import Any, Metric
 
 
+DEFAULT_ALPHA, DEFAULT_BETA = 0.5, 0.5 # used by ndeval for the measures that do not have alpha or beta parameters
+
+
 class PyNdEvalProvider(providers.Provider):
     """
-    pyndeval
+    pyndeval, for the intent-aware (diversity) measures of ndeval, the evaluation tool of the TREC Web track.
+
+    The subtopic of each judgment is given by the ``iteration`` column of the qrels. By default
+    (``engine='native'``), the measures are calculated in-process with NumPy, following ndeval exactly (including its
+    greedy ideal rankings and its "ideal ideal" normalisation of ERR-IA and alpha-DCG, which is not applied at rank 1);
+    ties in score are broken by ascending ``doc_id``, as in pyndeval. The judgments are indexed once for each
+    relevance level, and each ranking is scored once for all of its measures, alpha and beta values, and cutoffs
+    (which are not limited to 20 as in ndeval). ``engine='pyndeval'`` uses the pyndeval package instead.
     """
     NAME = 'pyndeval'
+    ENGINES = ('native', 'pyndeval')
+    INPUT_FORMAT = 'columnar'
+    COST_PER_ROW = 0.2
     SUPPORTED_MEASURES = [
-        measures._ERR_IA(cutoff=Any(), rel=Any(), judged_only=Any()),
-        measures._nERR_IA(cutoff=Any(), rel=Any(), judged_only=Any()),
-        measures._alpha_DCG(cutoff=Any(), alpha=Any(), rel=Any(), judged_only=Any()),
-        measures._alpha_nDCG(cutoff=Any(), alpha=Any(), rel=Any(), judged_only=Any()),
+        measures._ERR_IA(cutoff=Any(required=True), rel=Any(), judged_only=Any()),
+        measures._nERR_IA(cutoff=Any(required=True), rel=Any(), judged_only=Any()),
+        measures._alpha_DCG(cutoff=Any(required=True), alpha=Any(), rel=Any(), judged_only=Any()),
+        measures._alpha_nDCG(cutoff=Any(required=True), alpha=Any(), rel=Any(), judged_only=Any()),
         measures._NRBP(alpha=Any(), beta=Any(), rel=Any()),
         measures._nNRBP(alpha=Any(), beta=Any(), rel=Any()),
         measures._AP_IA(rel=Any(), judged_only=Any()),
-        measures._P_IA(cutoff=Any(), rel=Any(), judged_only=Any()),
-        measures._StRecall(cutoff=Any(), rel=Any()),
+        measures._P_IA(cutoff=Any(required=True), rel=Any(), judged_only=Any()),
+        measures._StRecall(cutoff=Any(required=True), rel=Any()),
     ]
 
-    def __init__(self):
+    def __init__(self, engine: str = 'native'):
         super().__init__()
+        if engine not in self.ENGINES:
+            raise ValueError(f'unknown engine {engine!r}; expected one of: {", ".join(self.ENGINES)}')
+        self.engine = engine
+        if engine == 'pyndeval':
+            self.INPUT_FORMAT = 'namedtuple_iter'
+            self.COST_PER_ROW = 1.
         self.pyndeval = None
 
     def _evaluator(self, measures, qrels):
+        if self.engine == 'native':
+            return PyNdEvalNativeEvaluator(measures, qrels)
+
         qrels = [self._map_qrel_namedtuple(q) for q in ir_measures.util.QrelsConverter(qrels).as_namedtuple_iter()]
 
         # Depending on the measures, we may need multiple invocations of pyndeval
@@ -33,14 +56,11 @@ class PyNdEvalProvider(providers.Provider):
         invokers = self._build_invokers(measures, qrels)
 
         if all(not inv.evaluator.has_multiple_subtopics('any') for inv in invokers):
-            sys.stderr.write('WARNING: All queries have only 1 subtopic! The results from this metric are probably not '
-                             'valid. Make sure that you are using diversity qrels, and that they are provided as a '
-                             'dataframe (with iteration column) or an iterable of GenericQrel (with iteration).\n')
+            _warn_single_subtopic()
 
         return PyNdEvalEvaluator(measures, qrels, invokers)
 
     def _build_invokers(self, measures, qrels):
-        DEFAULT_ALPHA, DEFAULT_BETA = 0.5, 0.5
         invocations = {}
         for measure in measures:
             if measure.NAME in ('NRBP', 'nNRBP'):
@@ -71,7 +91,18 @@ class PyNdEvalProvider(providers.Provider):
 
         return invokers
 
+    def _num_passes(self, measures):
+        if self.engine == 'native':
+            return 1
+        return super()._num_passes(measures)
+
     def initialize(self):
+        if self.engine == 'native':
+            try:
+                ir_measures.lazylibs.numpy()
+            except ImportError as ex:
+                raise RuntimeError('numpy not available', ex)
+            return
         try:
             import pyndeval
             self.pyndeval = pyndeval
@@ -90,9 +121,17 @@ class PyNdEvalProvider(providers.Provider):
             relevance=record.relevance)
 
     def install_instructions(self):
+        if self.engine == 'native':
+            return 'pip install numpy'
         return 'pip install ir-measures[pyndeval]'
 
 
+def _warn_single_subtopic():
+    sys.stderr.write('WARNING: All queries have only 1 subtopic! The results from this metric are probably not '
+                     'valid. Make sure that you are using diversity qrels, and that they are provided as a '
+                     'dataframe (with iteration column) or an iterable of GenericQrel (with iteration).\n')
+
+
 class PyNdEvalEvaluator(providers.Evaluator):
     def __init__(self, measures, qrels, invokers):
         query_ids = {q.query_id for q in qrels}
@@ -100,8 +139,8 @@ class PyNdEvalEvaluator(providers.Evaluator):
         self.invokers = invokers
 
     def _iter_calc(self, run):
-        # Convert run to dict_of_dict
-        run = ir_measures.util.RunConverter(run).as_sorted_namedtuple_iter()
+        # each invoker scores the whole run
+        run = list(ir_measures.util.RunConverter(run).as_sorted_namedtuple_iter())
         for invoker in self.invokers:
             yield from invoker.iter_calc(run)
 
@@ -113,17 +152,11 @@ class PyNdEvalInvoker:
         self.measure_map = measure_map
         self.qid_did_filter = None
         if judged_only:
-            self.qid_did_filter = set((qrel.query_id, qrel.doc_id) for qrel in qrels)
+            self.qid_did_filter = {(qrel.query_id, qrel.doc_id) for qrel in qrels}
 
     def iter_calc(self, run):
         if self.qid_did_filter is not None: # used when judged_only
-            filtered_run = {}
-            for qid in run:
-                filtered_run[qid] = {}
-                for did, score in run[qid].items():
-                    if (qid, did) in self.qid_did_filter:
-                        filtered_run[qid][did] = score
-            run = filtered_run
+            run = [scoreddoc for scoreddoc in run if (scoreddoc.query_id, scoreddoc.doc_id) in self.qid_did_filter]
         for record in self.evaluator.evaluate_iter(run):
             query_id = record['query_id']
             del record['query_id']
@@ -131,4 +164,324 @@ class PyNdEvalInvoker:
                 yield Metric(query_id=query_id, measure=self.measure_map[measure_str], value=value)
 
 
+class PyNdEvalNativeEvaluator(providers.Evaluator):
+    """
+    Calculates ndeval's measures with NumPy. For each relevance level, the judgments are indexed once as a (judged
+    documents x subtopics) matrix, and the gains of the ideal ranking of each query are found once for each alpha.
+    Each run is then ranked once for each relevance level (and ``judged_only`` setting), and all of the measures are
+    calculated from the same per-document gains.
+
+    Gains and sums are accumulated subtopic by subtopic and rank by rank, as in ndeval, so the values match it
+    exactly. As in ndeval, nNRBP is undefined (NaN) for queries without relevant documents.
+    """
+    def __init__(self, measures, qrels):
+        np = ir_measures.lazylibs.numpy()
+        qrels = ir_measures.util.QrelsConverter(qrels).as_columnar()
+        super().__init__(measures, set(qrels.query_ids[np.unique(qrels.query_codes)].tolist()))
+        self.query_ids = qrels.query_ids
+        self.query_lookup = {qid: i for i, qid in enumerate(qrels.query_ids.tolist())}
+        self.doc_lookup = {did: i for i, did in enumerate(qrels.doc_ids.tolist())}
+        self.num_docs = max(len(qrels.doc_ids), 1)
+        num_queries = len(qrels.query_ids)
+
+        # the judged (query, document) pairs, which are the rows of the relevance matrices
+        keys = qrels.query_codes.astype(np.int64) * self.num_docs + qrels.doc_codes
+        self.keys, pairs = np.unique(keys, return_inverse=True)
+        pair_queries = self.keys // self.num_docs
+
+        # the subtopics of each query are the columns, in the order in which they first appear in the qrels (which is
+        # also the order in which ndeval adds up their gains)
+        if qrels.iterations is not None:
+            subtopic_codes, num_subtopic_codes = qrels.iteration_codes.astype(np.int64), max(len(qrels.iterations), 1)
+        else:
+            subtopic_codes, num_subtopic_codes = np.zeros(len(keys), dtype=np.int64), 1
+        subtopic_keys, subtopics = np.unique(qrels.query_codes * num_subtopic_codes + subtopic_codes, return_inverse=True)
+        subtopic_queries = subtopic_keys // num_subtopic_codes
+        subtopic_counts = np.bincount(subtopic_queries, minlength=num_queries)
+        subtopics = (np.arange(len(subtopic_keys)) - (np.cumsum(subtopic_counts) - subtopic_counts)[subtopic_queries])[subtopics]
+        num_subtopics = int(subtopic_counts.max(initial=0))
+        if not np.any(subtopic_counts > 1):
+            _warn_single_subtopic()
+
+        self.groups = {} # (rel, judged_only) -> measures
+        ideal_betas = {} # (rel, alpha) -> the betas of nNRBP
+        cutoffs = set()
+        for measure in measures:
+            if measure.NAME in ('NRBP', 'nNRBP', 'StRecall'):
+                group = (measure['rel'], False)
+            elif measure.NAME in ('ERR_IA', 'nERR_IA', 'alpha_DCG', 'alpha_nDCG', 'AP_IA', 'P_IA'):
+                group = (measure['rel'], measure['judged_only'])
+            else:
+                raise ValueError(f'unsupported measure {measure}')
+            self.groups.setdefault(group, []).append(measure)
+            if measure.NAME != 'AP_IA' and 'NRBP' not in measure.NAME:
+                cutoffs.add(measure['cutoff'])
+            if measure.NAME in ('nERR_IA', 'alpha_nDCG', 'nNRBP'):
+                betas = ideal_betas.setdefault((measure['rel'], _alpha(measure)), set())
+                if measure.NAME == 'nNRBP':
+                    betas.add(measure['beta'])
+        self.cutoffs = np.array(sorted(cutoffs), dtype=np.int64)
+
+        self.relevant, self.num_relevant, self.actual = {}, {}, {}
+        for rel in {rel for rel, _ in self.groups}:
+            is_rel = qrels.relevance >= rel
+            relevant = np.zeros((len(self.keys), num_subtopics), dtype=bool)
+            relevant[pairs[is_rel], subtopics[is_rel]] = True
+            num_relevant = np.zeros((num_queries, num_subtopics), dtype=np.int64)
+            np.add.at(num_relevant, pair_queries, relevant)
+            self.relevant[rel] = relevant
+            self.num_relevant[rel] = num_relevant
+            # subtopics without relevant documents are ignored
+            self.actual[rel] = (num_relevant > 0).sum(axis=1)
+
+        # ERR-IA, alpha-DCG (at each cutoff), and NRBP (for each beta) of the ideal ranking of each query
+        self.ideal, candidates = {}, {}
+        if ideal_betas:
+            doc_ranks = np.empty(len(qrels.doc_ids), dtype=np.int64)
+            doc_ranks[np.argsort(np.array(qrels.doc_ids.tolist(), dtype=str), kind='stable')] = np.arange(len(qrels.doc_ids))
+            doc_ranks = doc_ranks[self.keys % self.num_docs]
+        for (rel, alpha), betas in ideal_betas.items():
+            if rel not in candidates:
+                candidates[rel] = _ideal_candidates(self.relevant[rel], pair_queries, doc_ranks, num_queries)
+            depth = None if betas else int(self.cutoffs.max(initial=0)) # NRBP needs the whole ideal ranking
+            gains = _ideal_gains(candidates[rel], alpha, depth)
+            segments = np.repeat(np.arange(num_queries), gains.shape[1])
+            positions = np.tile(np.arange(gains.shape[1]), num_queries)
+            gains = gains.ravel()
+            err, dcg = _err_dcg(segments, positions, gains, self.actual[rel], alpha, self.cutoffs, num_queries)
+            nrbp = {beta: _nrbp(segments, positions, gains, self.actual[rel], alpha, beta, num_queries) for beta in betas}
+            self.ideal[rel, alpha] = (err, dcg, nrbp)
+
+    def _iter_calc(self, run):
+        np = ir_measures.lazylibs.numpy()
+        run = ir_measures.util.RunConverter(run).as_columnar()
+        query_map = np.array([self.query_lookup.get(qid, -1) for qid in run.query_ids.tolist()], dtype=np.int64)
+        query_codes = query_map[run.query_codes] if len(query_map) else np.zeros(0, dtype=np.int64)
+        rows = np.flatnonzero(query_codes >= 0)
+        query_codes, doc_codes, scores = query_codes[rows], run.doc_codes[rows], run.scores[rows].astype(np.float64)
+
+        # sort by query, then score (descending), then doc_id (ascending, like pyndeval)
+        from ir_measures.providers.native_provider import _rank_order
+        order = _rank_order(query_codes, scores, doc_codes, run.doc_ids, descending_doc_ids=False)
+        query_codes, doc_codes = query_codes[order], doc_codes[order]
+
+        # find the judged pair of each returned document (-1 for unjudged documents)
+        doc_map = np.array([self.doc_lookup.get(did, -1) for did in run.doc_ids.tolist()], dtype=np.int64)
+        qrel_doc_codes = doc_map[doc_codes] if len(doc_map) else np.zeros(0, dtype=np.int64)
+        keys = query_codes * self.num_docs + qrel_doc_codes
+        idx = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        judged = (qrel_doc_codes >= 0) & (self.keys[idx] == keys) if len(self.keys) else np.zeros(len(keys), dtype=bool)
+        # like ndeval, a document that is returned more than once keeps its ranks, but only its first (highest ranked)
+        # occurrence has any gain
+        first = np.zeros(len(keys), dtype=bool)
+        first[np.unique(query_codes * max(len(run.doc_ids), 1) + doc_codes, return_index=True)[1]] = True
+        pairs = np.where(judged & first, idx, -1)
+
+        segment_codes, segments = np.unique(query_codes, return_inverse=True)
+        results = []
+        for (rel, judged_only), group_measures in self.groups.items():
+            keep = judged if judged_only else slice(None)
+            results.extend(self._calc_group(rel, group_measures, segments[keep], pairs[keep], segment_codes))
+        for i, query_id in enumerate(self.query_ids[segment_codes].tolist()):
+            for measure, values in results:
+                yield Metric(query_id=query_id, measure=measure, value=values[i])
+
+    def _calc_group(self, rel, measures, segments, pairs, segment_codes):
+        # [(measure, values)] for a ranking (rows grouped by segment, in rank order) at relevance level rel
+        np = ir_measures.lazylibs.numpy()
+        num_segments = len(segment_codes)
+        counts = np.bincount(segments, minlength=num_segments)
+        starts = np.cumsum(counts) - counts
+        positions = np.arange(len(segments)) - starts[segments]
+        relevant = self.relevant[rel][np.maximum(pairs, 0)] & (pairs >= 0)[:, None] if len(self.keys) else \
+            np.zeros((len(pairs), 0), dtype=bool)
+        # the number of documents ranked above each one that are relevant to each subtopic
+        above = np.cumsum(relevant, axis=0) - relevant
+        above -= above[starts[segments]]
+        actual = self.actual[rel][segment_codes]
+
+        gains, err_dcg = {}, {}
+        def calc_err_dcg(alpha):
+            if alpha not in err_dcg:
+                if alpha not in gains:
+                    gains[alpha] = _novelty_gains(relevant, above, alpha)
+                err_dcg[alpha] = _err_dcg(segments, positions, gains[alpha], actual, alpha, self.cutoffs, num_segments)
+            return err_dcg[alpha]
+
+        results = []
+        with np.errstate(invalid='ignore'):
+            for measure in measures:
+                if measure.NAME == 'AP_IA':
+                    values = _ap_ia(segments, positions, relevant, above, self.num_relevant[rel][segment_codes], actual, num_segments)
+                elif measure.NAME in ('NRBP', 'nNRBP'):
+                    alpha, beta = measure['alpha'], measure['beta']
+                    if alpha not in gains:
+                        gains[alpha] = _novelty_gains(relevant, above, alpha)
+                    values = _nrbp(segments, positions, gains[alpha], actual, alpha, beta, num_segments)
+                    if measure.NAME == 'nNRBP':
+                        values = values / self.ideal[rel, alpha][2][beta][segment_codes]
+                else:
+                    col = int(np.searchsorted(self.cutoffs, measure['cutoff']))
+                    if measure.NAME in ('P_IA', 'StRecall'):
+                        if measure.NAME == 'P_IA':
+                            found = relevant.sum(axis=1) # relevant (document, subtopic) pairs
+                            denominator = measure['cutoff'] * actual
+                        else:
+                            found = (relevant & (above == 0)).sum(axis=1) # newly covered subtopics
+                            denominator = actual
+                        found = _sum_at_cutoffs(segments, positions, found, self.cutoffs[col:col+1], num_segments)[:, 0]
+                        values = np.where(actual > 0, found / np.maximum(denominator, 1), 0.)
+                    else:
+                        alpha = _alpha(measure)
+                        err, dcg = calc_err_dcg(alpha)
+                        if measure.NAME == 'ERR_IA':
+                            values = err[:, col]
+                        elif measure.NAME == 'alpha_DCG':
+                            values = dcg[:, col]
+                        else:
+                            ideal_err, ideal_dcg, _ = self.ideal[rel, alpha]
+                            ideal = (ideal_err if measure.NAME == 'nERR_IA' else ideal_dcg)[segment_codes, col]
+                            values = err[:, col] if measure.NAME == 'nERR_IA' else dcg[:, col]
+                            # ndeval only normalises the values of queries with a non-zero alpha-DCG
+                            nonzero = dcg[:, col] != 0
+                            values = np.where(nonzero, values / np.where(nonzero, ideal, 1.), 0.)
+                results.append((measure, values.tolist()))
+        return results
+
+
+def _alpha(measure):
+    # the alpha used for a measure (ndeval's default for ERR-IA, which has no alpha parameter)
+    return measure['alpha'] if measure.NAME in ('alpha_DCG', 'alpha_nDCG', 'NRBP', 'nNRBP') else DEFAULT_ALPHA
+
+
+def _discounts(depth):
+    # ndeval's rank discount (log 2 / log (rank + 1)), computed by the C library like ndeval does
+    return [math.log(2.) / math.log(i + 2.) if i else 1. for i in range(depth)]
+
+
+def _novelty_gains(relevant, above, alpha):
+    # the gain of each document: for each subtopic it is relevant to, (1 - alpha)^n, where n is the number of documents
+    # ranked above it that are relevant to the same subtopic
+    np = ir_measures.lazylibs.numpy()
+    discounts = np.cumprod(np.concatenate([[1.], np.full(int(above.max(initial=0)), 1. - alpha)]))
+    gains = np.zeros(len(relevant))
+    for j in range(relevant.shape[1]):
+        gains = gains + np.where(relevant[:, j], discounts[above[:, j]], 0.)
+    return gains
+
+
+def _sum_at_cutoffs(segments, positions, values, cutoffs, num_segments):
+    # (segments x cutoffs) sums of the values of the rows above each cutoff, accumulated in rank order
+    np = ir_measures.lazylibs.numpy()
+    result = np.zeros((num_segments, len(cutoffs)))
+    for i, cutoff in enumerate(cutoffs.tolist()):
+        keep = positions < cutoff
+        result[:, i] = np.bincount(segments[keep], weights=values[keep], minlength=num_segments)
+    return result
+
+
+def _err_dcg(segments, positions, gains, actual, alpha, cutoffs, num_segments):
+    # ERR-IA and alpha-DCG at each cutoff, both normalised by those of an "ideal ideal" ranking, in which each document
+    # is relevant to every subtopic; like ndeval, the values at rank 1 are not normalised
+    np = ir_measures.lazylibs.numpy()
+    depth = int(cutoffs.max(initial=0))
+    keep = positions < depth
+    segments, positions, gains = segments[keep], positions[keep], gains[keep]
+    err = _sum_at_cutoffs(segments, positions, gains / (positions + 1), cutoffs, num_segments)
+    dcg = _sum_at_cutoffs(segments, positions, gains * np.array(_discounts(depth))[positions], cutoffs, num_segments)
+    ideal_err, ideal_dcg = _ideal_ideal(actual, alpha, cutoffs)
+    normalise = (cutoffs > 1)[None, :] & (actual > 0)[:, None]
+    err = np.where(normalise, err / np.where(normalise, ideal_err, 1.), err)
+    dcg = np.where(normalise, dcg / np.where(normalise, ideal_dcg, 1.), dcg)
+    return err, dcg
+
+
+def _ideal_ideal(actual, alpha, cutoffs):
+    # ndeval's "ideal ideal" ERR-IA and alpha-DCG at each cutoff, for queries with the given numbers of subtopics
+    np = ir_measures.lazylibs.numpy()
+    values, inverse = np.unique(actual, return_inverse=True)
+    err, dcg = np.zeros((len(values), len(cutoffs))), np.zeros((len(values), len(cutoffs)))
+    gain, err_sum, dcg_sum = values.astype(np.float64), np.zeros(len(values)), np.zeros(len(values))
+    for i, discount in enumerate(_discounts(int(cutoffs.max(initial=0)))):
+        err_sum = err_sum + gain / (i + 1)
+        dcg_sum = dcg_sum + gain * discount
+        gain = gain * (1. - alpha)
+        col = cutoffs == i + 1
+        err[:, col], dcg[:, col] = err_sum[:, None], dcg_sum[:, None]
+    return err[inverse], dcg[inverse]
+
+
+def _nrbp(segments, positions, gains, actual, alpha, beta, num_segments):
+    # NRBP over the whole ranking
+    np = ir_measures.lazylibs.numpy()
+    decay = np.cumprod(np.concatenate([[1.], np.full(int(positions.max(initial=0)), beta)]))
+    total = np.bincount(segments, weights=gains * decay[positions], minlength=num_segments)
+    return np.where(actual > 0, total * ((1 - (1 - alpha) * beta) / np.maximum(actual, 1)), 0.)
+
+
+def _ap_ia(segments, positions, relevant, above, num_relevant, actual, num_segments):
+    # MAP-IA: the mean (over the subtopics that have relevant documents) of the AP of each subtopic
+    np = ir_measures.lazylibs.numpy()
+    total = np.zeros(num_segments)
+    for j in range(relevant.shape[1]):
+        rows = relevant[:, j]
+        precision = np.bincount(segments[rows], weights=(above[rows, j] + 1) / (positions[rows] + 1), minlength=num_segments)
+        total = total + np.where(num_relevant[:, j] > 0, precision / np.maximum(num_relevant[:, j], 1), 0.)
+    return np.where(actual > 0, total / np.maximum(actual, 1), 0.)
+
+
+def _ideal_candidates(relevant, pair_queries, doc_ranks, num_queries):
+    # The candidates for the ideal ranking of each query. Documents that are relevant to the same subtopics always have
+    # the same gain, so they are grouped together: returns the (queries x groups x subtopics) relevance of each group,
+    # the (queries x groups) number of documents in each group and the position of its first document in doc_ranks,
+    # doc_ranks (the doc_id rank of each group's documents, greatest first), and the greatest number of candidates
+    np = ir_measures.lazylibs.numpy()
+    candidates = np.flatnonzero(relevant.any(axis=1)) # the other documents have no gain
+    patterns, pattern_codes = np.unique(relevant[candidates], axis=0, return_inverse=True)
+    num_patterns = max(len(patterns), 1)
+    group_keys = pair_queries[candidates] * num_patterns + pattern_codes.reshape(-1)
+    order = np.lexsort((-doc_ranks[candidates], group_keys))
+    group_keys, starts, sizes = np.unique(group_keys[order], return_index=True, return_counts=True)
+    group_queries = group_keys // num_patterns
+    counts = np.bincount(group_queries, minlength=num_queries)
+    columns = np.arange(len(group_keys)) - np.repeat(np.cumsum(counts) - counts, counts)
+    width = int(counts.max(initial=0))
+    docs = np.zeros((num_queries, width, relevant.shape[1]), dtype=bool)
+    docs[group_queries, columns] = patterns[group_keys % num_patterns]
+    remaining = np.zeros((num_queries, width), dtype=np.int64)
+    remaining[group_queries, columns] = sizes
+    taken = np.zeros((num_queries, width), dtype=np.int64)
+    taken[group_queries, columns] = starts
+    num_candidates = int(np.bincount(pair_queries[candidates], minlength=num_queries).max(initial=0))
+    return docs, remaining, taken, doc_ranks[candidates[order]], num_candidates
+
+
+def _ideal_gains(candidates, alpha, depth):
+    # (queries x ranks) gains of ndeval's ideal ranking of each query, up to depth (None for the whole ranking). The
+    # ranking is built greedily, as in ndeval: each rank takes the document with the greatest gain (ties go to the
+    # greatest doc_id), and the gains of its subtopics are then discounted by (1 - alpha).
+    np = ir_measures.lazylibs.numpy()
+    docs, remaining, taken, doc_ranks, num_candidates = candidates
+    remaining, taken = remaining.copy(), taken.copy()
+    doc_ranks = np.append(doc_ranks, -1)
+    depth = num_candidates if depth is None else min(depth, num_candidates)
+    num_queries, width, num_subtopics = docs.shape
+    subtopic_gains = np.ones((num_queries, num_subtopics))
+    result = np.zeros((num_queries, depth))
+    rows = np.arange(num_queries)
+    for rank in range(depth):
+        scores = np.zeros((num_queries, width))
+        for j in range(num_subtopics):
+            scores = scores + np.where(docs[:, :, j], subtopic_gains[:, j, None], 0.)
+        scores[remaining == 0] = -1.
+        ties = (scores == scores.max(axis=1)[:, None]) & (remaining > 0)
+        best = np.where(ties, doc_ranks[taken], -1).argmax(axis=1)
+        found = remaining[rows, best] > 0
+        result[:, rank] = np.where(found, scores[rows, best], 0.)
+        subtopic_gains = np.where(found[:, None] & docs[rows, best], subtopic_gains * (1. - alpha), subtopic_gains)
+        remaining[rows, best] -= found
+        taken[rows, best] += found
+    return result
+
+
 providers.register(PyNdEvalProvider())
@@ -23,6 +23,12 @@ class PytrecEvalProvider(providers.Provider):
     .. cite.dblp:: conf/sigir/GyselR18
     """
     NAME = 'pytrec_eval'
+    INPUT_FORMAT = 'dict_of_dict'
+    COST_SETUP = 50.
+    COST_PER_PASS = 50.
+    COST_PER_ROW = 0.6
+    EQUIVALENT_TO = ('native',)
+    DEDUPLICATES_RUN = True
     SUPPORTED_MEASURES = [
         measures._P(cutoff=Any(), rel=Any(), judged_only=Any()),
         measures._RR(cutoff=Choices(NOT_PROVIDED), rel=Any(), judged_only=Any()),
@@ -57,7 +63,23 @@ class PytrecEvalProvider(providers.Provider):
         invokers = self._build_invokers(measures, qrels)
         return PytrecEvalEvaluator(measures, invokers, qrels)
 
+    def _num_passes(self, measures):
+        return len(self._invocations(measures))
+
+    def estimate_cost(self, measures, num_rows):
+        result = super().estimate_cost(measures, num_rows)
+        # invocations with custom gains also need their own copy of the qrels
+        result += sum(0.5 * num_rows for (_, _, gains, _) in self._invocations(measures) if gains is not None)
+        return result
+
     def _build_invokers(self, measures, qrels):
+        invokers = []
+        for (rel_level, it, gains, judged_only), measure_map in self._invocations(measures).items():
+            invokers.append(PytrecEvalInvoker(self.pytrec_eval, qrels, measure_map, rel_level, judged_only, gains))
+
+        return invokers
+
+    def _invocations(self, measures):
         invocations = {}
         setf_count = 0
         for measure in measures:
@@ -82,11 +104,12 @@ class PytrecEvalProvider(providers.Provider):
                 measure_str = 'infAP'
             elif measure.NAME == 'nDCG':
                 if measure['gains'] is NOT_PROVIDED:
-                    # Doesn't matter where this goes... Put it in an existing invocation, or just (1,) if none yet exist
+                    # Doesn't matter where this goes (as long as it doesn't use custom gains)... Put it in an existing
+                    # invocation, or just (1,) if none yet exist
                     if invocations:
                         invocation_key = next(iter(invocations))
-                        if invocation_key[3] != measure['judged_only']:
-                            invocation_key = (invocation_key[0], invocation_key[1], invocation_key[2], measure['judged_only'])
+                        if invocation_key[2] is not None or invocation_key[3] != measure['judged_only']:
+                            invocation_key = (invocation_key[0], invocation_key[1], None, measure['judged_only'])
                     else:
                         invocation_key = (1, 0, None, measure['judged_only'])
                 else:
@@ -164,15 +187,7 @@ class PytrecEvalProvider(providers.Provider):
                 invocations[invocation_key] = {}
             invocations[invocation_key][match_str] = (measure, measure_str)
 
-        invokers = []
-        for (rel_level, it, gains, judged_only), measure_map in invocations.items():
-            these_qrels = qrels
-            if gains is not None:
-                # Map the gains
-                these_qrels = {qid: {did: gains.get(score, score) for did, score in vals.items()} for qid, vals in these_qrels.items()}
-            invokers.append(PytrecEvalInvoker(self.pytrec_eval, these_qrels, measure_map, rel_level, judged_only))
-
-        return invokers
+        return invocations
 
     def initialize(self):
         try:
@@ -191,6 +206,18 @@ class PytrecEvalEvaluator(providers.Evaluator):
     def __init__(self, measures, invokers, qrels):
         super().__init__(measures, set(qrels.keys()))
         self.invokers = invokers
+        self.qrels = qrels
+
+    def update_qrels(self, qrels):
+        qrels = ir_measures.util.QrelsConverter(qrels).as_dict_of_dict()
+        # copy-on-write: the qrels may be the caller's dict, so only the outer dict and affected queries are copied
+        self.qrels = dict(self.qrels)
+        for query_id, docs in qrels.items():
+            self.qrels[query_id] = {**self.qrels.get(query_id, {}), **docs}
+        self.qrel_qids.update(qrels.keys())
+        for invoker in self.invokers:
+            invoker.update_qrels(self.qrels, qrels.keys())
+        return set(qrels.keys())
 
     def _iter_calc(self, run):
         # Convert qrels to dict_of_dict (input format used by pytrec_eval)
@@ -200,9 +227,34 @@ class PytrecEvalEvaluator(providers.Evaluator):
 
 
 class PytrecEvalInvoker:
-    def __init__(self, pte, qrels, measure_map, rel_level, judged_only):
-        self.evaluator = pte.RelevanceEvaluator(qrels, [m for _, m in measure_map.values()], relevance_level=rel_level, judged_docs_only_flag=1 if judged_only else 0)
+    def __init__(self, pte, qrels, measure_map, rel_level, judged_only, gains=None):
+        self.pte = pte
         self.measure_map = measure_map
+        self.rel_level = rel_level
+        self.judged_only = judged_only
+        self.gains = gains
+        if gains is not None:
+            # Map the gains
+            qrels = {qid: self._map_gains(docs) for qid, docs in qrels.items()}
+        self.qrels = qrels
+        self.evaluator = self._build_evaluator()
+
+    def _map_gains(self, docs):
+        return {did: self.gains.get(score, score) for did, score in docs.items()}
+
+    def _build_evaluator(self):
+        return self.pte.RelevanceEvaluator(self.qrels, [m for _, m in self.measure_map.values()], relevance_level=self.rel_level, judged_docs_only_flag=1 if self.judged_only else 0)
+
+    def update_qrels(self, qrels, query_ids):
+        # pytrec_eval's RelevanceEvaluator cannot be changed after it is built, so it is rebuilt from the updated
+        # qrels; only the gain-mapped copies of the affected queries are re-mapped
+        if self.gains is None:
+            self.qrels = qrels
+        else:
+            self.qrels = dict(self.qrels)
+            for query_id in query_ids:
+                self.qrels[query_id] = self._map_gains(qrels[query_id])
+        self.evaluator = self._build_evaluator()
 
     def iter_calc(self, run):
         result = self.evaluator.evaluate(run)
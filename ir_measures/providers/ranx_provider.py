@@ -13,6 +13,10 @@ class RanxProvider(providers.Provider):
     .. cite.dblp:: conf/ecir/Bassani22
     """
     NAME = 'ranx'
+    INPUT_FORMAT = 'pd_dataframe'
+    COST_SETUP = 1000.
+    COST_PER_PASS = 100.
+    COST_PER_ROW = 0.5
     SUPPORTED_MEASURES = [
         measures._P(cutoff=Any(), rel=Any(), judged_only=Choices(False)),
         measures._SetP(rel=Any(), judged_only=Choices(False)),
@@ -1,18 +1,22 @@
-from typing import Callable, Optional, Iterable, List, Tuple, TYPE_CHECKING
+import math
+import itertools
+from typing import Callable, NamedTuple, Optional, Iterable, List, Tuple, TYPE_CHECKING
 import ir_measures
 from ir_measures import providers, measures, Metric
 from ir_measures.measures.base import Measure
 
 if TYPE_CHECKING:
+    import numpy as np
     import pandas as pd
 
 
 class RuntimeProvider(providers.Provider):
     """
-    Supports measures that are defined at runtime via `ir_measures.define()` and
-    `ir_measures.define_byquery()`.
+    Supports measures that are defined at runtime via `ir_measures.define()`,
+    `ir_measures.define_byquery()`, and `ir_measures.define_batched()`.
     """
     NAME = 'runtime'
+    INPUT_FORMAT = 'pd_dataframe'
 
     def supports(self, measure):
         measure.validate_params()
@@ -21,15 +25,7 @@ class RuntimeProvider(providers.Provider):
         return False
 
     def _evaluator(self, measures, qrels):
-        # Convert qrels to dict_of_dict (input format used by pytrec_eval)
-        qrels = ir_measures.util.QrelsConverter(qrels, strict=False).as_pd_dataframe()
-        if "query_id" not in qrels.columns:
-            raise ValueError("Required column query_id not found in qrels. Found columns was " + str(qrels.columns.to_list()))
-        sort_columns=['query_id']
-        if 'doc_id' in qrels.columns:
-            sort_columns.append('doc_id')
-        qrels = qrels.sort_values(by=sort_columns)
-        return RuntimeEvaluator(measures, qrels)
+        return RuntimeEvaluator(measures, _prepare_qrels(qrels))
 
     def run_inputs(self, measures: Iterable[Measure]) -> List[str]:
         """Returns the inputs required by the provided measures in the run.
@@ -68,10 +64,36 @@ class RuntimeProvider(providers.Provider):
         return list(inputs)
 
 
+def _prepare_qrels(qrels):
+    # Convert qrels to a DataFrame, sorted by query (and doc)
+    qrels = ir_measures.util.QrelsConverter(qrels, strict=False).as_pd_dataframe()
+    if "query_id" not in qrels.columns:
+        raise ValueError("Required column query_id not found in qrels. Found columns was " + str(qrels.columns.to_list()))
+    sort_columns=['query_id']
+    if 'doc_id' in qrels.columns:
+        sort_columns.append('doc_id')
+    return qrels.sort_values(by=sort_columns)
+
+
 class RuntimeEvaluator(providers.Evaluator):
     def __init__(self, measures, qrels):
         super().__init__(measures, set(qrels['query_id'].unique()))
         self.qrels = qrels
+        self.qrels_by_query = QrelsByQuery(qrels) # shared by the define_byquery measures
+
+    def update_qrels(self, qrels):
+        pd = ir_measures.lazylibs.pandas()
+        qrels = _prepare_qrels(qrels)
+        query_ids = set(qrels['query_id'].unique())
+        if 'doc_id' in qrels.columns and 'doc_id' in self.qrels.columns:
+            merged = pd.concat([self.qrels, qrels]).drop_duplicates(['query_id', 'doc_id'], keep='last')
+        else:
+            # without doc_ids, the new rows of a query replace all of its existing ones
+            merged = pd.concat([self.qrels[~self.qrels['query_id'].isin(query_ids)], qrels])
+        self.qrels = _prepare_qrels(merged)
+        self.qrels_by_query = QrelsByQuery(self.qrels)
+        self.qrel_qids.update(query_ids)
+        return query_ids
 
     def _iter_calc(self, run):
         run = ir_measures.util.RunConverter(run, strict=False).as_pd_dataframe()
@@ -84,7 +106,128 @@ class RuntimeEvaluator(providers.Evaluator):
             sort_orders.append(False)
         run = run.sort_values(by=sort_columns, ascending=sort_orders)
         for measure in self.measures:
-            yield from measure.runtime_impl(self.qrels, run)
+            yield from measure.runtime_impl(self.qrels, run, qrels_by_query=self.qrels_by_query)
+
+
+class QrelsByQuery:
+    """
+    Qrels (a DataFrame) grouped by ``query_id`` once, so that the judgments of each query can be sliced out in
+    constant time, either as a DataFrame or as a dict of NumPy arrays.
+    """
+    def __init__(self, qrels: 'pd.DataFrame'):
+        if not qrels['query_id'].is_monotonic_increasing:
+            qrels = qrels.sort_values(by='query_id', kind='stable')
+        self.qrels = qrels.reset_index(drop=True)
+        self.slices = {query_id: slice(start, stop) for query_id, start, stop in _query_slices(self.qrels['query_id'])}
+        self._arrays = None
+
+    def frame(self, query_id) -> 'pd.DataFrame':
+        return self.qrels.iloc[self.slices.get(query_id, slice(0, 0))]
+
+    def arrays(self, query_id):
+        if self._arrays is None:
+            self._arrays = {column: self.qrels[column].to_numpy() for column in self.qrels.columns}
+        rows = self.slices.get(query_id, slice(0, 0))
+        return {column: values[rows] for column, values in self._arrays.items()}
+
+
+def _query_slices(query_ids: 'pd.Series') -> List[Tuple[str, int, int]]:
+    # (query_id, start, stop) for each group of rows with the same query_id (which must be contiguous)
+    values = query_ids.to_numpy()
+    offsets = _query_offsets(values)
+    return list(zip(values[offsets[:-1]].tolist(), offsets[:-1].tolist(), offsets[1:].tolist()))
+
+
+def _query_offsets(values: 'np.ndarray') -> 'np.ndarray':
+    # the start of each group of rows with the same query_id (which must be contiguous), followed by the row count
+    np = ir_measures.lazylibs.numpy()
+    if len(values) == 0:
+        return np.zeros(1, dtype=np.int64)
+    starts = np.flatnonzero(np.concatenate([[True], values[1:] != values[:-1]]))
+    return np.append(starts, len(values))
+
+
+def _query_ranks(run: 'pd.DataFrame') -> 'np.ndarray':
+    # the 0-based position of each row within its query
+    np = ir_measures.lazylibs.numpy()
+    if not run['query_id'].is_monotonic_increasing:
+        return run.groupby('query_id', sort=False).cumcount().to_numpy()
+    offsets = _query_offsets(run['query_id'].to_numpy())
+    return np.arange(len(run)) - np.repeat(offsets[:-1], np.diff(offsets))
+
+
+def _head(run: 'pd.DataFrame', cutoff: int) -> 'pd.DataFrame':
+    # the first cutoff rows of each query, like run.groupby('query_id').head(cutoff)
+    return run[_query_ranks(run) < cutoff].reset_index(drop=True)
+
+
+class RunBatch(NamedTuple):
+    """
+    A whole run as flat NumPy arrays, as given to the functions of :func:`~ir_measures.define_batched`. The rows of
+    the run are grouped by query and sorted by descending score within each query: rows ``offsets[i]:offsets[i+1]``
+    belong to ``query_ids[i]``. Likewise, the judgments of ``query_ids[i]`` are
+    ``qrels_relevance[qrels_offsets[i]:qrels_offsets[i+1]]``. Only the queries that appear in the run are included.
+    """
+    query_ids: 'np.ndarray' # (queries,) the query_id of each query
+    offsets: 'np.ndarray' # (queries + 1,) the first row of each query, followed by the number of rows
+    query_codes: 'np.ndarray' # (rows,) the index in query_ids of each row
+    score: 'np.ndarray' # (rows,)
+    rank: 'np.ndarray' # (rows,) the 0-based rank of each row within its query
+    relevance: 'np.ndarray' # (rows,) the relevance of each row (0 if unjudged)
+    judged: 'np.ndarray' # (rows,) whether each row appears in the qrels
+    qrels_offsets: 'np.ndarray' # (queries + 1,) the first judgment of each query, followed by the number of judgments
+    qrels_relevance: 'np.ndarray' # (judgments,) the relevance of each judgment of the queries
+
+
+class _BatchedImpl:
+    # adapts a define_batched function to the define interface, calling it once with the whole run as a RunBatch
+    def __init__(self, impl):
+        self.impl = impl
+
+    def __call__(self, qrels, run, qrels_by_query=None):
+        np = ir_measures.lazylibs.numpy()
+        if qrels_by_query is None:
+            qrels_by_query = QrelsByQuery(qrels)
+        if not run['query_id'].is_monotonic_increasing:
+            run = run.sort_values(by=['query_id', 'score'], ascending=[True, False], kind='stable')
+        run = run.reset_index(drop=True)
+        qrels = qrels_by_query.qrels
+
+        run_qids = run['query_id'].to_numpy()
+        offsets = _query_offsets(run_qids)
+        query_ids = run_qids[offsets[:-1]]
+        lengths = np.diff(offsets)
+        rank = np.arange(len(run)) - np.repeat(offsets[:-1], lengths)
+
+        # the relevance of each row; when a (query, doc) pair is judged multiple times, the last one wins
+        judgments = qrels[['query_id', 'doc_id', 'relevance']].drop_duplicates(['query_id', 'doc_id'], keep='last')
+        joined = run[['query_id', 'doc_id']].merge(judgments, how='left', on=['query_id', 'doc_id'])
+        judged = joined['relevance'].notna().to_numpy()
+        relevance = joined['relevance'].fillna(0).to_numpy().astype(np.int64)
+
+        # the judgments of each query in the run, in the same query order
+        qrels_qids = judgments['query_id'].to_numpy()
+        starts = np.searchsorted(qrels_qids, query_ids, side='left')
+        qrels_lengths = np.searchsorted(qrels_qids, query_ids, side='right') - starts
+        qrels_offsets = np.concatenate([[0], np.cumsum(qrels_lengths)]).astype(np.int64)
+        rows = np.arange(qrels_offsets[-1]) + np.repeat(starts - qrels_offsets[:-1], qrels_lengths)
+        qrels_relevance = judgments['relevance'].to_numpy()[rows].astype(np.int64)
+
+        batch = RunBatch(
+            query_ids=query_ids,
+            offsets=offsets,
+            query_codes=np.repeat(np.arange(len(query_ids)), lengths),
+            score=run['score'].to_numpy().astype(np.float64),
+            rank=rank,
+            relevance=relevance,
+            judged=judged,
+            qrels_offsets=qrels_offsets,
+            qrels_relevance=qrels_relevance,
+        )
+        values = np.asarray(self.impl(batch), dtype=np.float64)
+        if values.shape != (len(query_ids),):
+            raise ValueError(f'expected one value per query (shape {(len(query_ids),)}), but got an array of shape {values.shape}')
+        return zip(query_ids.tolist(), values.tolist())
 
 
 def define(
@@ -95,7 +238,9 @@ def define(
     run_inputs: Optional[List[str]] = None,
     qrel_inputs: Optional[List[str]] = None,
     pretty_name : Optional[str] = None,
-    short_desc : Optional[str] = None
+    short_desc : Optional[str] = None,
+    n_jobs: Optional[int] = 1,
+    executor: str = 'thread'
 ):
     """Defines a new custom measure from a user-specified function that is is provided all queries at once.
 
@@ -105,13 +250,22 @@ def define(
     query at a time.
 
     :param impl: A function that takes two pandas DataFrames (qrels and run) and returns an iterable of (qid, score) tuples.
-    :param name: The name of the measure (optional)
+    :param name: The name of the measure (optional). Measures are only cached by a
+        :class:`~ir_measures.providers.CachedProvider` if they are given a (unique) name.
     :param support_cutoff: Whether the measure supports a cutoff parameter, which reduces the results in run.
     :param run_inputs: Optional list of input columns required by in runs. If not provided, it defaults to ``[query_id, doc_id, score]``.
     :param qrel_inputs: Optional list of input columns required by in qrels. If not provided, it defaults to ``[query_id, doc_id, relevance]``.
     :param pretty_name: Optional str giving a pretty name for the measure.
     :param short_desc: Optional str giving a short description of the measure.  
+    :param n_jobs: The number of workers to call ``impl`` with in parallel (``None`` or ``-1`` uses all CPUs). The run
+        is split into chunks of whole queries (with the qrels of these queries), so ``impl`` must treat each query
+        independently. The results are returned in query order.
+    :param executor: ``'thread'`` (best when ``impl`` releases the GIL, e.g., in NumPy, PyTorch, or while waiting for
+        network requests) or ``'process'`` (for pure-Python functions; uses forked worker processes, and runs
+        serially on platforms other than Linux).
     """
+    if executor not in EXECUTORS:
+        raise ValueError(f'unknown executor {executor!r}; expected one of: {", ".join(EXECUTORS)}')
     _SUPPORTED_PARAMS = {}
     if support_cutoff:
         _SUPPORTED_PARAMS['cutoff'] = measures.ParamInfo(dtype=int, required=False, desc='ranking cutoff threshold')
@@ -119,6 +273,9 @@ def define(
         run_inputs = ['query_id', 'doc_id', 'score']
     if qrel_inputs is None:
         qrel_inputs = ['query_id', 'doc_id', 'relevance']
+    named = name is not None
+    if name is None and isinstance(impl, (_ByQueryImpl, _BatchedImpl)):
+        name = impl.impl.__name__ if hasattr(impl.impl, '__name__') else repr(impl.impl)
     class _RuntimeMeasure(measures.Measure):
         nonlocal _SUPPORTED_PARAMS
         nonlocal run_inputs
@@ -130,13 +287,24 @@ def define(
         QREL_INPUTS = qrel_inputs
         SHORT_DESC = short_desc
         PRETTY_NAME = pretty_name
+        # whether the name was given explicitly (rather than taken from impl, e.g., '<lambda>'), so that it identifies
+        # the measure, e.g., in a ResultCache
+        NAMED = named
 
-        def runtime_impl(self, qrels, run):
+        def runtime_impl(self, qrels, run, qrels_by_query=None):
             if 'cutoff' in self.params and self.params['cutoff'] is not None:
                 cutoff = self.params['cutoff']
                 # assumes results already sorted (as is done in RuntimeEvaluator)
-                run = run.groupby('query_id').head(cutoff).reset_index(drop=True)
-            for qid, score in impl(qrels, run):
+                run = _head(run, cutoff)
+            if isinstance(impl, _ByQueryImpl):
+                results = impl(qrels, run, qrels_by_query, n_jobs=n_jobs, executor=executor)
+            elif isinstance(impl, _BatchedImpl):
+                results = impl(qrels, run, qrels_by_query)
+            elif n_jobs == 1:
+                results = impl(qrels, run)
+            else:
+                results = _parallel_define(impl, qrels, run, qrels_by_query, n_jobs, executor)
+            for qid, score in results:
                 yield Metric(qid, self, score)
 
         def __repr__(self):
@@ -146,13 +314,87 @@ def define(
     return _RuntimeMeasure()
 
 
-def _byquery_impl(impl):
-    def _wrapped(qrels, run):
-        for qid, run_subdf in run.groupby("query_id"):
-            qrels_subdf = qrels[qrels['query_id'] == qid]
-            res = impl(qrels_subdf, run_subdf)
-            yield qid, res
-    return _wrapped
+class _ByQueryImpl:
+    # adapts a define_byquery function to the define interface, calling it with the rows of each query
+    def __init__(self, impl, numpy=False):
+        self.impl = impl
+        self.numpy = numpy
+
+    def __call__(self, qrels, run, qrels_by_query=None, n_jobs=1, executor='thread'):
+        if qrels_by_query is None:
+            qrels_by_query = QrelsByQuery(qrels)
+        if not run['query_id'].is_monotonic_increasing:
+            run = run.sort_values(by='query_id', kind='stable')
+        run = run.reset_index(drop=True)
+        if self.numpy:
+            run_arrays = {column: run[column].to_numpy() for column in run.columns}
+        # the inputs of each call are sliced out here (lazily, if serial), so workers only run impl
+        def _inputs():
+            for qid, start, stop in _query_slices(run['query_id']):
+                if self.numpy:
+                    yield qid, qrels_by_query.arrays(qid), {column: values[start:stop] for column, values in run_arrays.items()}
+                else:
+                    yield qid, qrels_by_query.frame(qid), run.iloc[start:stop]
+        inputs = _inputs() if n_jobs == 1 else list(_inputs())
+        return _map_chunks(self._call, inputs, n_jobs, executor)
+
+    def _call(self, inputs):
+        qid, qrels, run = inputs
+        return qid, self.impl(qrels, run)
+
+
+EXECUTORS = ('thread', 'process')
+
+
+def _map_chunks(fn, items, n_jobs=1, executor='thread'):
+    # Applies fn to each of items, spread in chunks across a pool of n_jobs threads or (forked) processes. The results
+    # are returned in the order of items.
+    n_jobs = providers.base._n_jobs(n_jobs)
+    if n_jobs == 1 or len(items) <= 1:
+        return map(fn, items)
+    chunk_size = math.ceil(len(items) / (n_jobs * 4)) # a few chunks per worker, to balance uneven calls
+    chunks = [items[i:i+chunk_size] for i in range(0, len(items), chunk_size)]
+    if executor == 'process':
+        if providers.base._pool_context() is None:
+            return map(fn, items)
+        # inherited by the forked workers, since fn (e.g., a lambda) may not be picklable
+        with providers.base._process_pool(min(n_jobs, len(chunks)), (fn, chunks)) as pool:
+            outputs = list(pool.map(_pool_chunk, range(len(chunks))))
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(min(n_jobs, len(chunks))) as pool:
+            outputs = list(pool.map(lambda chunk: [fn(item) for item in chunk], chunks))
+    return itertools.chain.from_iterable(outputs)
+
+
+def _pool_chunk(idx):
+    fn, chunks = providers.base._POOL_STATE
+    return [fn(item) for item in chunks[idx]]
+
+
+def _parallel_define(impl, qrels, run, qrels_by_query, n_jobs, executor):
+    # Splits the run (and qrels) into parts of whole queries, and calls impl on each part in parallel. The qrels of
+    # queries between those of the run are given to the part that follows them, so every qrels row is in one part.
+    np = ir_measures.lazylibs.numpy()
+    if qrels_by_query is None:
+        qrels_by_query = QrelsByQuery(qrels)
+    if not run['query_id'].is_monotonic_increasing:
+        run = run.sort_values(by='query_id', kind='stable')
+    run = run.reset_index(drop=True)
+    groups = _query_slices(run['query_id'])
+    if not groups:
+        return impl(qrels, run)
+    qrels = qrels_by_query.qrels
+    qrels_qids = qrels['query_id'].to_numpy()
+    parts = []
+    qrels_start = 0
+    for part in np.array_split(np.arange(len(groups)), min(len(groups), providers.base._n_jobs(n_jobs) * 4)):
+        first, last = groups[part[0]], groups[part[-1]]
+        qrels_stop = len(qrels) if part[-1] == len(groups) - 1 else int(np.searchsorted(qrels_qids, last[0], side='right'))
+        parts.append((qrels.iloc[qrels_start:qrels_stop], run.iloc[first[1]:last[2]]))
+        qrels_start = qrels_stop
+    outputs = _map_chunks(lambda part: list(impl(*part)), parts, n_jobs, executor)
+    return itertools.chain.from_iterable(outputs)
 
 
 def define_byquery(
@@ -163,29 +405,64 @@ def define_byquery(
     run_inputs: Optional[List[str]] = None,
     qrel_inputs: Optional[List[str]] = None,
     pretty_name : Optional[str] = None,
-    short_desc : Optional[str] = None
+    short_desc : Optional[str] = None,
+    numpy: bool = False,
+    n_jobs: Optional[int] = 1,
+    executor: str = 'thread'
 ):
     """Defines a new custom measure from a user-specified function that is called once per query.
 
     ``impl`` is a function that accepts (``qrels``, ``run``) and is called once per query, returning a float
-    value each time for the specific query.
+    value each time for the specific query. The rows of the run are sorted by descending score.
 
     :param impl: A function that takes two pandas DataFrames (qrels and run) and returns a float.
-    :param name: The name of the measure (optional)
+    :param name: The name of the measure (optional). Measures are only cached by a
+        :class:`~ir_measures.providers.CachedProvider` if they are given a (unique) name.
     :param support_cutoff: Whether the measure supports a cutoff parameter, which reduces the results in run.
     :param run_inputs: Optional list of input columns required by in runs. If not provided, it defaults to ``[query_id, doc_id, score]``.
     :param qrel_inputs: Optional list of input columns required by in qrels. If not provided, it defaults to ``[query_id, doc_id, relevance]``.
     :param pretty_name: Optional str giving a pretty name for the measure.
     :param short_desc: Optional str giving a short description of the measure.
+    :param numpy: If True, ``impl`` is given dicts that map each column name to a NumPy array (e.g., ``run['score']``)
+        rather than DataFrames, which avoids the overhead of pandas for each query.
+    :param n_jobs: The number of workers to call ``impl`` with in parallel (``None`` or ``-1`` uses all CPUs). Queries
+        are sent to the workers in chunks, and the results are returned in query order.
+    :param executor: ``'thread'`` (best when ``impl`` releases the GIL, e.g., in NumPy, PyTorch, or while waiting for
+        network requests) or ``'process'`` (for pure-Python functions; uses forked worker processes, and runs
+        serially on platforms other than Linux).
     """
-    if name is None:
-        if hasattr(impl, '__name__'):
-            name = impl.__name__
-        else:
-            name = repr(impl)
-    return define(_byquery_impl(impl), name, support_cutoff, 
+    return define(_ByQueryImpl(impl, numpy), name, support_cutoff, 
                   run_inputs=run_inputs, qrel_inputs=qrel_inputs, 
-                  pretty_name=pretty_name, short_desc=short_desc)
+                  pretty_name=pretty_name, short_desc=short_desc, n_jobs=n_jobs, executor=executor)
+
+
+def define_batched(
+    impl: Callable[[RunBatch], 'np.ndarray'],
+    name: Optional[str] = None,
+    support_cutoff: bool = True,
+    *,
+    pretty_name : Optional[str] = None,
+    short_desc : Optional[str] = None
+):
+    """Defines a new custom measure from a user-specified function that is vectorized over all queries.
+
+    ``impl`` is called once with a :class:`~ir_measures.providers.runtime_provider.RunBatch`, which holds the whole
+    run (and the relevance of each row) as flat NumPy arrays with per-query offsets, and returns an array with one
+    value for each of its ``query_ids``. This avoids both pandas and a Python loop over queries, e.g.::
+
+        def my_p10(batch):
+            relevant = (batch.relevance > 0).astype(float)
+            return np.add.reduceat(relevant, batch.offsets[:-1]) / 10 # every query in a batch has at least one row
+
+    :param impl: A function that takes a ``RunBatch`` and returns a float array of shape ``(len(batch.query_ids),)``.
+    :param name: The name of the measure (optional). Measures are only cached by a
+        :class:`~ir_measures.providers.CachedProvider` if they are given a (unique) name.
+    :param support_cutoff: Whether the measure supports a cutoff parameter, which reduces the results in run. The run
+        is cut before it is given to ``impl``.
+    :param pretty_name: Optional str giving a pretty name for the measure.
+    :param short_desc: Optional str giving a short description of the measure.
+    """
+    return define(_BatchedImpl(impl), name, support_cutoff, pretty_name=pretty_name, short_desc=short_desc)
 
 
 providers.register(RuntimeProvider())
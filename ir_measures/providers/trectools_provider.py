@@ -15,6 +15,9 @@ class TrectoolsProvider(providers.Provider):
     .. cite.dblp:: conf/sigir/PalottiSZ19
     """
     NAME = 'trectools'
+    COST_SETUP = 1000.
+    COST_PER_PASS = 1000.
+    COST_PER_ROW = 3.
     SUPPORTED_MEASURES = [
         measures._P(cutoff=Any(), rel=Choices(1), judged_only=Choices(False)),
         measures._RR(cutoff=Choices(NOT_PROVIDED), rel=Choices(1), judged_only=Choices(False)),
@@ -0,0 +1,199 @@
+"""
+Paired significance tests over the per-query results of several runs.
+
+Each function takes ``results``, a mapping of run name to the per-query results of that run (as returned by
+:meth:`Evaluator.calc() <ir_measures.providers.Evaluator.calc>` or
+:meth:`~ir_measures.providers.Evaluator.calc_many`: a :class:`~ir_measures.CalcResults`, its ``per_query``, or any
+iterable of :class:`~ir_measures.Metric`), and compares pairs of runs on each of the given measures::
+
+    results = evaluator.calc_many({'bm25': bm25_run, 'monot5': monot5_run, 'dense': dense_run})
+    ir_measures.stats.randomization_test(results, [nDCG@10, AP], baseline='bm25', correction='holm')
+
+Runs are paired on the queries that all of them have values for. By default, every pair of runs is compared; with
+``baseline``, each other run is compared to the baseline. All the pairs (and all the permutations or bootstrap
+samples) are processed together as NumPy matrix operations.
+"""
+import itertools
+from typing import Dict, Hashable, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union, TYPE_CHECKING
+import ir_measures
+from ir_measures.util import CalcResults, ColumnarResults, Metric
+from ir_measures.measures.base import Measure
+
+if TYPE_CHECKING:
+    import numpy
+
+
+class PairedTestResult(NamedTuple):
+    measure: Measure
+    run_a: Hashable
+    run_b: Hashable
+    mean_diff: float # mean over queries of run_a - run_b
+    statistic: float # the t statistic (t-test) or mean_diff (randomization test)
+    p_value: float # two-sided; adjusted for multiple comparisons if a correction was given
+
+
+class BootstrapResult(NamedTuple):
+    measure: Measure
+    run_a: Hashable
+    run_b: Hashable
+    mean_diff: float # mean over queries of run_a - run_b
+    ci_low: float
+    ci_high: float
+
+
+TYPE_RESULTS = Mapping[Hashable, Union[CalcResults, ColumnarResults, Iterable[Metric]]]
+
+CORRECTIONS = ('bonferroni', 'holm', 'fdr_bh')
+
+
+def ttest(results: TYPE_RESULTS, measures: Iterable[Measure], baseline: Optional[Hashable] = None, correction: Optional[str] = None) -> List[PairedTestResult]:
+    """
+    Paired (two-sided) Student's t-tests between runs. Requires scipy (for the t distribution).
+    """
+    np = ir_measures.lazylibs.numpy()
+    stdtr = ir_measures.lazylibs.scipy().special.stdtr
+    output = []
+    for measure, pairs, diffs in _paired_diffs(results, measures, baseline):
+        num_queries = diffs.shape[1]
+        mean = diffs.mean(axis=1)
+        stderr = diffs.std(axis=1, ddof=1) / np.sqrt(num_queries) if num_queries > 1 else np.zeros(len(pairs))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(stderr > 0, mean / stderr, np.where(mean == 0, 0., np.copysign(np.inf, mean)))
+        p_values = 2 * stdtr(max(num_queries - 1, 1), -np.abs(t))
+        p_values = np.where(np.isnan(p_values), 1., p_values)
+        output += _paired_results(measure, pairs, mean, t, correct(p_values, correction))
+    return output
+
+
+def randomization_test(results: TYPE_RESULTS, measures: Iterable[Measure], baseline: Optional[Hashable] = None, correction: Optional[str] = None, n_samples: int = 10_000, seed: Optional[int] = None, batch_size: int = 1_000) -> List[PairedTestResult]:
+    """
+    Paired (two-sided) Fisher randomization tests between runs, using ``n_samples`` random permutations.
+
+    Each permutation swaps the two runs' values for a random subset of the queries (i.e., flips the signs of their
+    differences). The same permutations are used for every pair, and are processed ``batch_size`` at a time. The
+    p-value is ``(k + 1) / (n_samples + 1)``, where ``k`` is the number of permutations with an absolute mean
+    difference at least as large as the observed one.
+    """
+    np = ir_measures.lazylibs.numpy()
+    rng = np.random.default_rng(seed)
+    output = []
+    for measure, pairs, diffs in _paired_diffs(results, measures, baseline):
+        mean = diffs.mean(axis=1)
+        # a small tolerance, so that permutations equal to the observed difference (up to floating point error) count
+        threshold = np.abs(mean) - 1e-12
+        exceed = np.zeros(len(pairs), dtype=np.int64)
+        for start in range(0, n_samples, batch_size):
+            signs = rng.choice(np.array([-1., 1.]), size=(min(batch_size, n_samples - start), diffs.shape[1]))
+            permuted = signs @ diffs.T / diffs.shape[1] # (permutations x pairs)
+            exceed += (np.abs(permuted) >= threshold).sum(axis=0)
+        p_values = (exceed + 1) / (n_samples + 1)
+        output += _paired_results(measure, pairs, mean, mean, correct(p_values, correction))
+    return output
+
+
+def bootstrap_ci(results: TYPE_RESULTS, measures: Iterable[Measure], baseline: Optional[Hashable] = None, correction: Optional[str] = None, confidence: float = 0.95, n_samples: int = 10_000, seed: Optional[int] = None, batch_size: int = 1_000) -> List[BootstrapResult]:
+    """
+    Percentile bootstrap confidence intervals of the mean difference between runs, from ``n_samples`` resamples of
+    the queries (with replacement).
+
+    The same resamples are used for every pair, and are processed ``batch_size`` at a time. With
+    ``correction='bonferroni'``, the confidence level of each interval is raised so that all the intervals of a
+    measure hold together at ``confidence``.
+    """
+    np = ir_measures.lazylibs.numpy()
+    if correction not in (None, 'bonferroni'):
+        raise ValueError(f'unsupported correction for confidence intervals: {correction!r} (only bonferroni is supported)')
+    rng = np.random.default_rng(seed)
+    output = []
+    for measure, pairs, diffs in _paired_diffs(results, measures, baseline):
+        num_queries = diffs.shape[1]
+        alpha = 1 - confidence
+        if correction == 'bonferroni':
+            alpha /= len(pairs)
+        samples = []
+        for start in range(0, n_samples, batch_size):
+            # the number of times each query is drawn in each resample
+            counts = rng.multinomial(num_queries, np.full(num_queries, 1 / num_queries), size=min(batch_size, n_samples - start))
+            samples.append(counts @ diffs.T / num_queries) # (resamples x pairs)
+        low, high = np.quantile(np.concatenate(samples), [alpha / 2, 1 - alpha / 2], axis=0)
+        mean = diffs.mean(axis=1)
+        for (run_a, run_b), m, l, h in zip(pairs, mean.tolist(), low.tolist(), high.tolist()):
+            output.append(BootstrapResult(measure, run_a, run_b, m, l, h))
+    return output
+
+
+def correct(p_values: Sequence[float], method: Optional[str] = None) -> 'numpy.ndarray':
+    """
+    Adjusts ``p_values`` for multiple comparisons, using ``'bonferroni'``, ``'holm'`` (Holm-Bonferroni), or
+    ``'fdr_bh'`` (Benjamini-Hochberg false discovery rate). With ``None``, the p-values are returned unchanged.
+    """
+    np = ir_measures.lazylibs.numpy()
+    values = np.asarray(p_values, dtype=np.float64)
+    n = len(values)
+    if method is None or n == 0:
+        return values
+    if method == 'bonferroni':
+        return np.minimum(values * n, 1.)
+    order = np.argsort(values, kind='stable')
+    ranked = values[order]
+    if method == 'holm':
+        adjusted = np.maximum.accumulate(ranked * (n - np.arange(n)))
+    elif method == 'fdr_bh':
+        adjusted = np.minimum.accumulate((ranked * n / np.arange(1, n + 1))[::-1])[::-1]
+    else:
+        raise ValueError(f'unknown correction {method!r}; expected one of: {", ".join(CORRECTIONS)}')
+    result = np.empty(n)
+    result[order] = np.minimum(adjusted, 1.)
+    return result
+
+
+def _paired_diffs(results, measures, baseline):
+    # yields (measure, pairs of run names, (pairs x queries) matrix of differences) for each measure
+    np = ir_measures.lazylibs.numpy()
+    names = list(results.keys())
+    if baseline is None:
+        pairs = list(itertools.combinations(names, 2))
+    elif baseline not in results:
+        raise KeyError(f'baseline {baseline!r} not found in results')
+    else:
+        pairs = [(name, baseline) for name in names if name != baseline]
+    if not pairs:
+        raise ValueError('at least two runs are needed for a comparison')
+    per_run = {name: _per_query_values(result) for name, result in results.items()}
+    for measure in measures:
+        query_ids, values = _aligned(measure, [per_run[name] for name in names])
+        if not query_ids:
+            raise ValueError(f'no queries have values of {measure} for all runs')
+        index = {name: i for i, name in enumerate(names)}
+        a = np.array([index[run_a] for run_a, _ in pairs])
+        b = np.array([index[run_b] for _, run_b in pairs])
+        yield measure, pairs, values[a] - values[b]
+
+
+def _per_query_values(result) -> Dict[Measure, Dict[str, float]]:
+    # measure -> query_id -> value for the per-query results of a run
+    if isinstance(result, CalcResults):
+        result = result.per_query
+    if isinstance(result, ColumnarResults):
+        present = result.present
+        query_ids = result.query_ids
+        return {measure: dict(zip(query_ids[present[:, i]].tolist(), result[measure][present[:, i]].tolist())) for i, measure in enumerate(result.measures)}
+    values: Dict[Measure, Dict[str, float]] = {}
+    for metric in result:
+        values.setdefault(metric.measure, {})[metric.query_id] = metric.value
+    return values
+
+
+def _aligned(measure, per_run) -> Tuple[List[str], 'numpy.ndarray']:
+    # the queries that all runs have values for, and the (runs x queries) matrix of the values
+    np = ir_measures.lazylibs.numpy()
+    for values in per_run:
+        if measure not in values:
+            raise KeyError(f'{measure} not found in the results of every run')
+    query_ids = sorted(set.intersection(*(set(values[measure]) for values in per_run)))
+    matrix = np.array([[values[measure][query_id] for query_id in query_ids] for values in per_run], dtype=np.float64)
+    return query_ids, matrix.reshape(len(per_run), len(query_ids))
+
+
+def _paired_results(measure, pairs, mean, statistic, p_values):
+    return [PairedTestResult(measure, run_a, run_b, m, s, p) for (run_a, run_b), m, s, p in zip(pairs, mean.tolist(), statistic.tolist(), p_values.tolist())]
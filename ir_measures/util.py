@@ -3,15 +3,20 @@ import re
 import io
 import ast
 import gzip
+import json
 import contextlib
+import csv
 import itertools
 import tempfile
+import functools
 from typing import Dict, List
 from collections import defaultdict
-from typing import NamedTuple, Union, Iterable
+from typing import Any, NamedTuple, Tuple, Union, Iterable, Iterator, TYPE_CHECKING
 import ir_measures
 if False: # this is to allow type-checking for pandas
     import pandas
+if TYPE_CHECKING:
+    import numpy
 
 class Qrel(NamedTuple):
     query_id: str
@@ -31,7 +36,14 @@ class Metric(NamedTuple):
 
 class CalcResults(NamedTuple):
     aggregated: Union[Dict['ir_measures.Measure', Union[float, int]], float, int]
-    per_query: List[Metric]
+    per_query: Union[List[Metric], 'ColumnarResults']
+
+class CurveResults(NamedTuple):
+    """The values of measures at a range of cutoffs (see :func:`ir_measures.calc_curve`)."""
+    cutoffs: 'numpy.ndarray' # (cutoffs,)
+    query_ids: List[str]
+    per_query: Dict['ir_measures.Measure', 'numpy.ndarray'] # (queries x cutoffs), rows in the order of query_ids
+    aggregated: Dict['ir_measures.Measure', 'numpy.ndarray'] # (cutoffs,)
 
 class GenericQrel(Qrel):
     def __new__(self, *args, **kwargs):
@@ -46,8 +58,367 @@ class GenericScoredDoc(ScoredDoc):
         return super().__new__(self, *args, **kwargs)
 GenericScoredDoc._fields = ScoredDoc._fields
 
-TYPE_RUN = Union[ Iterable[ScoredDoc], 'pandas.DataFrame', Dict[str, Dict[str, float]]]
-TYPE_QREL = Union[ Iterable[Qrel], 'pandas.DataFrame', Dict[str, Dict[str, int]]] 
+
+def _object_array(values):
+    # np.array(values, dtype=object) would build a 2D array if the values are themselves sequences (e.g., tuples)
+    np = ir_measures.lazylibs.numpy()
+    result = np.empty(len(values), dtype=object)
+    result[:] = values
+    return result
+
+
+def _factorize(values):
+    # interns a column of IDs, returning (lookup table, codes)
+    np = ir_measures.lazylibs.numpy()
+    if hasattr(values, 'factorize'): # pandas Series: use the C implementation
+        codes, uniques = values.factorize()
+        return _object_array(list(uniques)), codes.astype(np.int32)
+    table: Dict = {}
+    codes = np.fromiter((table.setdefault(v, len(table)) for v in values), dtype=np.int32, count=len(values))
+    return _object_array(list(table)), codes
+
+
+def _merge_codes(table_a, codes_a, table_b, codes_b):
+    # interns the IDs of two interned columns together, returning (merged lookup table, codes of both columns, joined)
+    np = ir_measures.lazylibs.numpy()
+    lookup = {v: i for i, v in enumerate(table_a.tolist())}
+    b_map = np.fromiter((lookup.setdefault(v, len(lookup)) for v in table_b.tolist()), dtype=np.int32, count=len(table_b))
+    return _object_array(list(lookup)), np.concatenate([np.asarray(codes_a, dtype=np.int32), b_map[codes_b]])
+
+
+_COLUMNAR_MAGIC = b'IRMCOL1\n'
+_COLUMNAR_ALIGN = 64
+
+
+def _write_columnar_file(path, kind, columns, tables):
+    # Layout: magic, uint64 header length, JSON header, then each array at an aligned offset. ID tables are stored as
+    # NUL-separated UTF-8 so they can be decoded with a single split.
+    np = ir_measures.lazylibs.numpy()
+    blobs = dict(columns)
+    for name, table in tables.items():
+        if table is None:
+            continue
+        ids = [str(i) for i in table]
+        if any('\x00' in i for i in ids):
+            raise ValueError(f'{name} IDs cannot contain NUL characters')
+        blobs[name] = np.frombuffer('\x00'.join(ids).encode(), dtype=np.uint8)
+    header = {'kind': kind, 'columns': {}, 'tables': {name: (len(table) if table is not None else None) for name, table in tables.items()}}
+    offset = 0
+    for name, arr in blobs.items():
+        arr = np.ascontiguousarray(arr)
+        header['columns'][name] = {'dtype': arr.dtype.newbyteorder('<').str, 'offset': offset, 'length': len(arr)}
+        offset += -(-arr.nbytes // _COLUMNAR_ALIGN) * _COLUMNAR_ALIGN
+    header_bytes = json.dumps(header).encode()
+    data_start = -(-(len(_COLUMNAR_MAGIC) + 8 + len(header_bytes)) // _COLUMNAR_ALIGN) * _COLUMNAR_ALIGN
+    with open(path, 'wb') as f:
+        f.write(_COLUMNAR_MAGIC)
+        f.write(np.uint64(len(header_bytes)).astype('<u8').tobytes())
+        f.write(header_bytes)
+        for name, arr in blobs.items():
+            f.seek(data_start + header['columns'][name]['offset'])
+            f.write(np.ascontiguousarray(arr).astype(header['columns'][name]['dtype'], copy=False).tobytes())
+        f.truncate(data_start + offset)
+
+
+def _read_columnar_file(path, kind):
+    np = ir_measures.lazylibs.numpy()
+    with open(path, 'rb') as f:
+        if f.read(len(_COLUMNAR_MAGIC)) != _COLUMNAR_MAGIC:
+            raise ValueError(f'{path} is not a columnar ir_measures file')
+        header_len = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        header = json.loads(f.read(header_len))
+    if header['kind'] != kind:
+        raise ValueError(f'{path} contains {header["kind"]}, not {kind}')
+    data_start = -(-(len(_COLUMNAR_MAGIC) + 8 + header_len) // _COLUMNAR_ALIGN) * _COLUMNAR_ALIGN
+    columns = {}
+    for name, info in header['columns'].items():
+        if info['length'] == 0:
+            columns[name] = np.empty(0, dtype=info['dtype'])
+        else:
+            columns[name] = np.memmap(path, dtype=info['dtype'], mode='r', offset=data_start + info['offset'], shape=(info['length'],))
+    for name, count in header['tables'].items():
+        if count is None:
+            columns[name] = None
+        elif count == 0:
+            columns[name] = _object_array([])
+        else:
+            columns[name] = _object_array(bytes(columns[name]).decode().split('\x00'))
+    return columns
+
+
+def is_columnar_file(path) -> bool:
+    """Returns ``True`` if ``path`` is a file written by :meth:`ColumnarRun.save` or :meth:`ColumnarQrels.save`."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(_COLUMNAR_MAGIC)) == _COLUMNAR_MAGIC
+    except (OSError, TypeError):
+        return False
+
+
+class ColumnarRun:
+    """
+    A run stored column-wise as NumPy arrays.
+
+    Query and document IDs are interned: ``query_ids`` and ``doc_ids`` are lookup tables of the distinct IDs, and
+    ``query_codes`` and ``doc_codes`` index into these tables for each row. Iterating over a ``ColumnarRun`` yields
+    :class:`~ir_measures.ScoredDoc` objects, so it can be used anywhere a run is accepted.
+
+    A ``ColumnarRun`` can be written to a compact binary file with :meth:`save` and re-opened with :meth:`load`, which
+    memory-maps the columns rather than re-parsing the run.
+    """
+    def __init__(self, query_ids, doc_ids, query_codes, doc_codes, scores):
+        self.query_ids = query_ids
+        self.doc_ids = doc_ids
+        self.query_codes = query_codes
+        self.doc_codes = doc_codes
+        self.scores = scores
+
+    @classmethod
+    def from_columns(cls, query_id, doc_id, score) -> 'ColumnarRun':
+        """Builds a ``ColumnarRun`` from parallel sequences of query IDs, document IDs, and scores."""
+        np = ir_measures.lazylibs.numpy()
+        query_ids, query_codes = _factorize(query_id)
+        doc_ids, doc_codes = _factorize(doc_id)
+        return cls(query_ids, doc_ids, query_codes, doc_codes, np.asarray(score, dtype=np.float64))
+
+    def save(self, path, score_dtype='float64'):
+        """
+        Writes this run to ``path`` in the columnar binary format.
+
+        Scores are stored as float64 by default, which preserves the ranking exactly. Passing ``score_dtype='float32'``
+        halves the size of the score column, but may introduce ties between nearly-equal scores.
+        """
+        np = ir_measures.lazylibs.numpy()
+        _write_columnar_file(path, 'run', {
+            'query_codes': self.query_codes.astype(np.int32, copy=False),
+            'doc_codes': self.doc_codes.astype(np.int32, copy=False),
+            'scores': self.scores.astype(score_dtype, copy=False),
+        }, {'query_ids': self.query_ids, 'doc_ids': self.doc_ids})
+
+    @classmethod
+    def load(cls, path) -> 'ColumnarRun':
+        """Opens a run written by :meth:`save`. The columns are memory-mapped (read-only), not read into memory."""
+        c = _read_columnar_file(path, 'run')
+        return cls(c['query_ids'], c['doc_ids'], c['query_codes'], c['doc_codes'], c['scores'])
+
+    def top_k(self, k: int) -> 'ColumnarRun':
+        """
+        Returns a run with only the ``k`` highest-scoring documents of each query. Documents tied with the ``k``-th
+        are kept too, so that any tie-breaking applied later is unaffected. If a document appears more than once for a
+        query, only its last row is kept (as in the dict-of-dict runs that most providers use), so the result is only
+        suitable for providers that count each document once (see
+        :attr:`Provider.DEDUPLICATES_RUN <ir_measures.providers.Provider.DEDUPLICATES_RUN>`). The rows keep their
+        original order.
+        """
+        np = ir_measures.lazylibs.numpy()
+        if len(self) == 0:
+            return self
+        # one sort of the (query, document) keys groups the rows by query and puts duplicate rows next to each other
+        keys = self.query_codes.astype(np.int64) * len(self.doc_ids) + self.doc_codes
+        grouped = np.argsort(keys)
+        sorted_keys = keys[grouped]
+        starts = np.flatnonzero(np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]]))
+        if len(starts) != len(self):
+            grouped = np.maximum.reduceat(grouped, starts) # the last row of each (query, document)
+        counts = np.bincount(self.query_codes[grouped], minlength=len(self.query_ids))
+        if len(grouped) == len(self) and not (counts > k).any():
+            return self
+        # the k-th highest score of each query that has more than k documents, by a partial selection (np.partition)
+        # of the query's scores rather than a full sort
+        scores = self.scores[grouped]
+        thresholds = np.full(len(counts), -np.inf)
+        ends = np.cumsum(counts)
+        for q in np.flatnonzero(counts > k).tolist():
+            segment = scores[ends[q] - counts[q]:ends[q]]
+            thresholds[q] = np.partition(segment, len(segment) - k)[len(segment) - k]
+        keep = np.zeros(len(self), dtype=bool)
+        keep[grouped[scores >= thresholds[self.query_codes[grouped]]]] = True
+        rows = np.flatnonzero(keep)
+        return ColumnarRun(self.query_ids, self.doc_ids, self.query_codes[rows], self.doc_codes[rows], self.scores[rows])
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __iter__(self) -> Iterator[ScoredDoc]:
+        query_ids = self.query_ids[self.query_codes].tolist()
+        doc_ids = self.doc_ids[self.doc_codes].tolist()
+        for query_id, doc_id, score in zip(query_ids, doc_ids, self.scores.tolist()):
+            yield ScoredDoc(query_id, doc_id, score)
+
+
+class ColumnarQrels:
+    """
+    Qrels stored column-wise as NumPy arrays.
+
+    Query and document IDs are interned: ``query_ids`` and ``doc_ids`` are lookup tables of the distinct IDs, and
+    ``query_codes`` and ``doc_codes`` index into these tables for each row. ``iterations``/``iteration_codes`` hold
+    the (optional) ``iteration`` column in the same way. Iterating over a ``ColumnarQrels`` yields
+    :class:`~ir_measures.Qrel` objects, so it can be used anywhere qrels are accepted.
+
+    Like :class:`ColumnarRun`, it can be written with :meth:`save` and memory-mapped back with :meth:`load`.
+    """
+    def __init__(self, query_ids, doc_ids, query_codes, doc_codes, relevance, iterations=None, iteration_codes=None):
+        self.query_ids = query_ids
+        self.doc_ids = doc_ids
+        self.query_codes = query_codes
+        self.doc_codes = doc_codes
+        self.relevance = relevance
+        self.iterations = iterations
+        self.iteration_codes = iteration_codes
+
+    @classmethod
+    def from_columns(cls, query_id, doc_id, relevance, iteration=None) -> 'ColumnarQrels':
+        """Builds a ``ColumnarQrels`` from parallel sequences of query IDs, document IDs, relevance (and iterations)."""
+        np = ir_measures.lazylibs.numpy()
+        query_ids, query_codes = _factorize(query_id)
+        doc_ids, doc_codes = _factorize(doc_id)
+        iterations, iteration_codes = None, None
+        if iteration is not None:
+            iterations, iteration_codes = _factorize(iteration)
+        return cls(query_ids, doc_ids, query_codes, doc_codes, np.asarray(relevance, dtype=np.int32), iterations, iteration_codes)
+
+    def save(self, path):
+        """Writes these qrels to ``path`` in the columnar binary format."""
+        np = ir_measures.lazylibs.numpy()
+        columns = {
+            'query_codes': self.query_codes.astype(np.int32, copy=False),
+            'doc_codes': self.doc_codes.astype(np.int32, copy=False),
+            'relevance': self.relevance.astype(np.int32, copy=False),
+        }
+        if self.iterations is not None:
+            columns['iteration_codes'] = self.iteration_codes.astype(np.int32, copy=False)
+        _write_columnar_file(path, 'qrels', columns, {'query_ids': self.query_ids, 'doc_ids': self.doc_ids, 'iterations': self.iterations})
+
+    @classmethod
+    def load(cls, path) -> 'ColumnarQrels':
+        """Opens qrels written by :meth:`save`. The columns are memory-mapped (read-only), not read into memory."""
+        c = _read_columnar_file(path, 'qrels')
+        return cls(c['query_ids'], c['doc_ids'], c['query_codes'], c['doc_codes'], c['relevance'], c['iterations'], c.get('iteration_codes'))
+
+    def update(self, qrels: 'ColumnarQrels') -> 'ColumnarQrels':
+        """
+        Returns these qrels with the judgments of ``qrels`` added. A judgment of a (query, document) pair that is
+        already judged replaces the existing judgment(s) of that pair. If either qrels has subtopics (more than one
+        distinct ``iteration``), judgments are instead keyed on (query, document, iteration), so that judging a document
+        for one subtopic keeps its judgments for the others.
+        """
+        np = ir_measures.lazylibs.numpy()
+        query_ids, query_codes = _merge_codes(self.query_ids, self.query_codes, qrels.query_ids, qrels.query_codes)
+        doc_ids, doc_codes = _merge_codes(self.doc_ids, self.doc_codes, qrels.doc_ids, qrels.doc_codes)
+        keys = query_codes.astype(np.int64) * max(len(doc_ids), 1) + doc_codes
+        iterations, iteration_codes = None, None
+        if self.iterations is not None or qrels.iterations is not None:
+            iterations, iteration_codes = _merge_codes(*self._iteration_columns(), *qrels._iteration_columns())
+            if self._has_subtopics() or qrels._has_subtopics():
+                keys = keys * max(len(iterations), 1) + iteration_codes
+        keep = np.concatenate([~np.isin(keys[:len(self)], keys[len(self):]), np.ones(len(qrels), dtype=bool)])
+        relevance = np.concatenate([self.relevance, qrels.relevance]).astype(np.int32)
+        if iteration_codes is not None:
+            iteration_codes = iteration_codes[keep]
+        return ColumnarQrels(query_ids, doc_ids, query_codes[keep], doc_codes[keep], relevance[keep], iterations, iteration_codes)
+
+    def _has_subtopics(self):
+        np = ir_measures.lazylibs.numpy()
+        return self.iterations is not None and len(np.unique(self.iteration_codes)) > 1
+
+    def _iteration_columns(self):
+        # (iterations, iteration_codes), with the default iteration ('0') if there is no iteration column
+        np = ir_measures.lazylibs.numpy()
+        if self.iterations is None:
+            return _object_array(['0']), np.zeros(len(self), dtype=np.int32)
+        return self.iterations, self.iteration_codes
+
+    def __len__(self):
+        return len(self.relevance)
+
+    def __iter__(self) -> Iterator[Qrel]:
+        query_ids = self.query_ids[self.query_codes].tolist()
+        doc_ids = self.doc_ids[self.doc_codes].tolist()
+        if self.iterations is not None:
+            iterations = self.iterations[self.iteration_codes].tolist()
+        else:
+            iterations = itertools.repeat('0')
+        for query_id, doc_id, relevance, iteration in zip(query_ids, doc_ids, self.relevance.tolist(), iterations):
+            yield Qrel(query_id, doc_id, relevance, iteration)
+
+
+class ColumnarResults:
+    """
+    Per-query results stored as a (queries x measures) float64 matrix, rather than as a list of
+    :class:`~ir_measures.Metric` objects. Returned as ``per_query`` by
+    :meth:`Evaluator.calc(run, columnar=True) <ir_measures.providers.Evaluator.calc>`.
+
+    ``query_ids`` (sorted) and ``measures`` index the rows and columns of ``values``. Entries for query/measure pairs
+    without a value are NaN. ``results[measure]`` returns the column of a measure as a view (without copying), and
+    iterating yields :class:`~ir_measures.Metric` objects for the entries that have values.
+    """
+    def __init__(self, query_ids, measures, values, present=None):
+        self.query_ids = query_ids
+        self.measures = list(measures)
+        self.values = values
+        self._present = present # which entries have values (None: entries that are not NaN)
+        self._measure_idx = {measure: i for i, measure in enumerate(self.measures)}
+
+    @classmethod
+    def from_columns(cls, measures, columns, qrel_qids=()) -> 'ColumnarResults':
+        """
+        Builds results from ``columns``, an iterable of ``(measure, query_ids, values)``. Measures that are missing a
+        value for any of ``qrel_qids`` are given the measure's ``DEFAULT`` value for these queries (like
+        :meth:`~ir_measures.providers.Evaluator.iter_calc`).
+        """
+        np = ir_measures.lazylibs.numpy()
+        measures = list(measures)
+        measure_idx = {measure: i for i, measure in enumerate(measures)}
+        columns = [(measure, _object_array(list(query_ids)), np.asarray(values, dtype=np.float64)) for measure, query_ids, values in columns]
+        qrel_qids = _object_array(list(qrel_qids))
+        query_ids = _object_array(sorted(set(qrel_qids.tolist()).union(*(c[1].tolist() for c in columns))))
+        values = np.full((len(query_ids), len(measures)), float('NaN'), order='F') # columns are contiguous
+        present = np.zeros(values.shape, dtype=bool, order='F')
+        for measure, column_qids, column_values in columns:
+            rows = np.searchsorted(query_ids, column_qids)
+            values[rows, measure_idx[measure]] = column_values
+            present[rows, measure_idx[measure]] = True
+        if len(qrel_qids):
+            qrel_rows = np.searchsorted(query_ids, qrel_qids)
+            for i, measure in enumerate(measures):
+                rows = qrel_rows[~present[qrel_rows, i]]
+                values[rows, i] = measure.DEFAULT
+                present[rows, i] = True
+        return cls(query_ids, measures, values, present)
+
+    @property
+    def present(self):
+        np = ir_measures.lazylibs.numpy()
+        return ~np.isnan(self.values) if self._present is None else self._present
+
+    def __getitem__(self, measure) -> 'numpy.ndarray':
+        return self.values[:, self._measure_idx[measure]]
+
+    def to_numpy(self) -> 'numpy.ndarray':
+        """Returns the (queries x measures) matrix of values (not a copy)."""
+        return self.values
+
+    def to_pandas(self) -> 'pandas.DataFrame':
+        """
+        Returns the values as a DataFrame indexed by ``query_id``, with a column for each measure (named by
+        ``str(measure)``, since pandas would treat measure objects, which are callable, as indexing functions).
+        """
+        pd = ir_measures.lazylibs.pandas()
+        return pd.DataFrame(self.values, index=pd.Index(self.query_ids, name='query_id'), columns=[str(m) for m in self.measures], copy=False)
+
+    def __len__(self):
+        return int(self.present.sum())
+
+    def __iter__(self) -> Iterator[Metric]:
+        present = self.present
+        for i, query_id in enumerate(self.query_ids.tolist()):
+            for j, measure in enumerate(self.measures):
+                if present[i, j]:
+                    yield Metric(query_id=query_id, measure=measure, value=float(self.values[i, j]))
+
+
+TYPE_RUN = Union[ Iterable[ScoredDoc], 'pandas.DataFrame', Dict[str, Dict[str, float]], ColumnarRun]
+TYPE_QREL = Union[ Iterable[Qrel], 'pandas.DataFrame', Dict[str, Dict[str, int]], ColumnarQrels]
 
 class QrelsConverter:
     def __init__(self, qrels, strict=True):
@@ -69,6 +440,8 @@ class QrelsConverter:
         error = None
         if isinstance(self.qrels, dict):
             result = 'dict_of_dict'
+        elif isinstance(self.qrels, ColumnarQrels):
+            result = 'columnar'
         elif hasattr(self.qrels, 'itertuples'):
             cols = self.qrels.columns
             missing_cols = [f for f in Qrel._fields if f not in cols and f not in Qrel._field_defaults]
@@ -124,6 +497,8 @@ class QrelsConverter:
                 yield from (Qrel(qrel.query_id, qrel.doc_id, qrel.relevance, qrel.iteration) for qrel in self.qrels.itertuples())
             else:
                 yield from (Qrel(qrel.query_id, qrel.doc_id, qrel.relevance) for qrel in self.qrels.itertuples())
+        if t == 'columnar':
+            yield from self.qrels
         if t == 'UNKNOWN':
             raise ValueError(f'unknown qrels format: {err}')
 
@@ -133,6 +508,16 @@ class QrelsConverter:
             if 'iteration' not in self.qrels.columns:
                 return self.qrels.assign(iteration=['0'] * len(self.qrels))
             return self.qrels
+        elif t == 'columnar':
+            pd = ir_measures.lazylibs.pandas()
+            qrels = self.qrels
+            iteration = qrels.iterations[qrels.iteration_codes] if qrels.iterations is not None else ['0'] * len(qrels)
+            return pd.DataFrame({
+                'query_id': qrels.query_ids[qrels.query_codes],
+                'doc_id': qrels.doc_ids[qrels.doc_codes],
+                'relevance': qrels.relevance.astype('int64'),
+                'iteration': iteration,
+            })
         else:
             pd = ir_measures.lazylibs.pandas()
             df = pd.DataFrame(self.as_namedtuple_iter())
@@ -140,6 +525,21 @@ class QrelsConverter:
                 df = pd.DataFrame([], columns=['query_id', 'doc_id', 'relevance', 'iteration'])
             return df
 
+    def as_columnar(self) -> ColumnarQrels:
+        t, err = self.predict_type()
+        if t == 'columnar':
+            return self.qrels
+        if t == 'pd_dataframe':
+            iteration = self.qrels['iteration'] if 'iteration' in self.qrels.columns else None
+            return ColumnarQrels.from_columns(self.qrels['query_id'], self.qrels['doc_id'], self.qrels['relevance'], iteration)
+        query_ids, doc_ids, relevances, iterations = [], [], [], []
+        for qrel in self.as_namedtuple_iter():
+            query_ids.append(qrel.query_id)
+            doc_ids.append(qrel.doc_id)
+            relevances.append(qrel.relevance)
+            iterations.append(getattr(qrel, 'iteration', '0'))
+        return ColumnarQrels.from_columns(query_ids, doc_ids, relevances, iterations)
+
     @contextlib.contextmanager
     def as_tmp_file(self):
         with tempfile.NamedTemporaryFile(mode='w+t') as f:
@@ -152,8 +552,41 @@ class QrelsConverter:
 
 
 
+def _read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def _shared_memo(fn):
+    # When the run is a SharedRun, the result of the conversion is computed once and re-used by every RunConverter
+    # over it. Generators are stored as lists, and the arrays of a ColumnarRun are handed out as read-only views, so a
+    # provider cannot change the run that the others see. (The dict-of-dict and DataFrame are not copied; the built-in
+    # providers do not modify them, which is checked in tests/test_util.py.)
+    @functools.wraps(fn)
+    def wrapped(self):
+        if self._shared is None:
+            return fn(self)
+        key = (fn.__name__, self.strict)
+        if key not in self._shared._memo:
+            result = fn(self)
+            if isinstance(result, Iterator):
+                result = list(result)
+            elif isinstance(result, ColumnarRun):
+                result = ColumnarRun(*(_read_only(column) for column in (result.query_ids, result.doc_ids,
+                                     result.query_codes, result.doc_codes, result.scores)))
+            self._shared._memo[key] = result
+        result = self._shared._memo[key]
+        return iter(result) if isinstance(result, list) else result
+    return wrapped
+
+
 class RunConverter:
     def __init__(self, run, strict=True):
+        self._shared = None
+        if isinstance(run, SharedRun):
+            self._shared = run
+            run = run.run
         self.run = run
         self._predicted_format = None
         self.strict = strict # setting strict to false prevents missing columns from raising an error for DFs
@@ -172,6 +605,8 @@ class RunConverter:
         error = None
         if isinstance(self.run, dict):
             result = 'dict_of_dict'
+        elif isinstance(self.run, ColumnarRun):
+            result = 'columnar'
         elif hasattr(self.run, 'itertuples'):
             cols = self.run.columns
             missing_cols = set(ScoredDoc._fields) - set(cols)
@@ -182,9 +617,12 @@ class RunConverter:
         elif hasattr(self.run, '__iter__'):
             # peek
             # TODO: is this an OK approach?
-            self.run, peek_run = itertools.tee(self.run, 2)
             sentinal = object()
-            item = next(peek_run, sentinal)
+            if isinstance(self.run, (list, tuple)):
+                item = self.run[0] if len(self.run) > 0 else sentinal
+            else:
+                self.run, peek_run = itertools.tee(self.run, 2)
+                item = next(peek_run, sentinal)
             if isinstance(item, tuple) and hasattr(item, '_fields'):
                 fields = item._fields
                 missing_fields = set(ScoredDoc._fields) - set(fields)
@@ -201,6 +639,7 @@ class RunConverter:
         self._predicted_format = (result, error)
         return result, error
 
+    @_shared_memo
     def as_dict_of_dict(self):
         t, err = self.predict_type()
         if t == 'dict_of_dict':
@@ -223,9 +662,12 @@ class RunConverter:
                     yield ScoredDoc(query_id=query_id, doc_id=doc_id, score=score)
         if t == 'pd_dataframe':
             yield from (ScoredDoc(sd.query_id, sd.doc_id, sd.score) for sd in self.run.itertuples())
+        if t == 'columnar':
+            yield from self.run
         if t == 'UNKNOWN':
             raise ValueError(f'unknown run format: {err}')
 
+    @_shared_memo
     def as_sorted_namedtuple_iter(self):
         qid = None
         items = []
@@ -240,6 +682,7 @@ class RunConverter:
         if qid is not None:
             yield from flush()
 
+    @_shared_memo
     def as_sorteddict(self) -> Dict[str, List[ScoredDoc]]:
         """Returns a map of topic ID -> sorted list of documents"""
         pertopic = defaultdict(list)
@@ -247,10 +690,18 @@ class RunConverter:
             pertopic[item.query_id].append(item)
         return {qid: sorted(items, key=lambda x: x.score, reverse=True) for qid, items in pertopic.items()}
 
+    @_shared_memo
     def as_pd_dataframe(self):
         t, err = self.predict_type()
         if t == 'pd_dataframe':
             return self.run
+        elif t == 'columnar':
+            pd = ir_measures.lazylibs.pandas()
+            return pd.DataFrame({
+                'query_id': self.run.query_ids[self.run.query_codes],
+                'doc_id': self.run.doc_ids[self.run.doc_codes],
+                'score': self.run.scores,
+            })
         else:
             pd = ir_measures.lazylibs.pandas()
             df = pd.DataFrame(self.as_namedtuple_iter())
@@ -258,6 +709,20 @@ class RunConverter:
                 df = pd.DataFrame([], columns=['query_id', 'doc_id', 'score'])
             return df
 
+    @_shared_memo
+    def as_columnar(self) -> ColumnarRun:
+        t, err = self.predict_type()
+        if t == 'columnar':
+            return self.run
+        if t == 'pd_dataframe':
+            return ColumnarRun.from_columns(self.run['query_id'], self.run['doc_id'], self.run['score'])
+        query_ids, doc_ids, scores = [], [], []
+        for scored_doc in self.as_namedtuple_iter():
+            query_ids.append(scored_doc.query_id)
+            doc_ids.append(scored_doc.doc_id)
+            scores.append(scored_doc.score)
+        return ColumnarRun.from_columns(query_ids, doc_ids, scores)
+
     @contextlib.contextmanager
     def as_tmp_file(self):
         with tempfile.NamedTemporaryFile(mode='w+t') as f:
@@ -272,6 +737,28 @@ class RunConverter:
             yield f
 
 
+class SharedRun:
+    """
+    A run that several evaluators work on in turn (e.g., those of the providers used by a
+    :class:`~ir_measures.providers.FallbackProvider`).
+
+    Any :class:`RunConverter` over a ``SharedRun`` re-uses the conversions (dict-of-dict, DataFrame, columnar, sorted
+    documents, etc.) that have already been built for it, so each representation of the run is only built (and held
+    in memory) once. Iterators are read into a list up front so that the run can be consumed more than once.
+    Converted representations must be treated as read-only (the arrays of the columnar representation are).
+    """
+    def __init__(self, run: TYPE_RUN):
+        if isinstance(run, SharedRun):
+            run = run.run
+        elif not isinstance(run, (dict, list, tuple, ColumnarRun)) and not hasattr(run, 'itertuples') and hasattr(run, '__iter__'):
+            run = list(run)
+        self.run: TYPE_RUN = run
+        self._memo: Dict[Tuple[str, bool], Any] = {} # (conversion, strict) -> converted run
+
+    def __iter__(self):
+        return RunConverter(self).as_namedtuple_iter()
+
+
 def parse_trec_qrels(file):
     warnings.warn("parse_trec_qrels deprecated in 0.2.0. Please use ir_measures.read_trec_qrels() instead.", DeprecationWarning)
     return read_trec_qrels(file)
@@ -310,6 +797,130 @@ def read_trec_run(file):
                 yield from read_trec_run(f)
 
 
+class _Interner:
+    # assigns integer codes to IDs that arrive in chunks. Each chunk is factorized on its own; the (much smaller) sets of
+    # per-chunk uniques are merged in a single pass at the end.
+    def __init__(self):
+        self.chunk_codes: List = []
+        self.chunk_uniques: List = []
+
+    def add(self, values):
+        codes, uniques = values.factorize()
+        self.chunk_codes.append(codes)
+        self.chunk_uniques.append(uniques)
+
+    def result(self):
+        np = ir_measures.lazylibs.numpy()
+        pd = ir_measures.lazylibs.pandas()
+        if not self.chunk_codes:
+            return _object_array([]), np.empty(0, dtype=np.int32)
+        remap, ids = pd.factorize(np.concatenate([np.asarray(u, dtype=object) for u in self.chunk_uniques]))
+        codes, offset = [], 0
+        for chunk_codes, uniques in zip(self.chunk_codes, self.chunk_uniques):
+            codes.append(remap[offset + chunk_codes])
+            offset += len(uniques)
+        return _object_array(list(ids)), np.concatenate(codes).astype(np.int32)
+
+
+@contextlib.contextmanager
+def _open_trec_binary(file):
+    if hasattr(file, 'read'):
+        yield file
+    elif '\n' in file:
+        yield io.StringIO(file)
+    else:
+        reader = gzip.open if file.endswith('.gz') else open
+        with reader(file, 'rb') as f:
+            yield f
+
+
+def _read_trec_columns(file, names, id_columns, value_column, value_dtype, chunk_size):
+    # Parses a whitespace-delimited TREC file chunk-by-chunk with pandas' C parser. Returns {id_column: (ids, codes)}
+    # and the value column. Like read_trec_run/read_trec_qrels, lines without exactly len(names) columns and
+    # non-integer values of an integer value column are rejected.
+    np = ir_measures.lazylibs.numpy()
+    pd = ir_measures.lazylibs.pandas()
+    integer_values = np.dtype(value_dtype).kind in 'iu'
+    # The other columns are only read to check that they are present, as categories (which are cheap to parse). pandas
+    # does not reliably reject lines with extra columns, so these go into an additional column that must be empty.
+    dtype = {c: 'category' for c in names + ('_extra',)}
+    dtype.update({c: str for c in id_columns})
+    if not integer_values:
+        dtype[value_column] = value_dtype
+    interners = {c: _Interner() for c in id_columns}
+    values = []
+    with _open_trec_binary(file) as f, warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.ParserWarning)
+        try:
+            chunks = pd.read_csv(f, sep=r'\s+', header=None, names=names + ('_extra',), index_col=False, dtype=dtype,
+                na_filter=False, quoting=csv.QUOTE_NONE, float_precision='round_trip', chunksize=chunk_size, engine='c')
+            for chunk in chunks:
+                if (chunk['_extra'] != '').any() or (chunk[names[-1]] == '').any():
+                    raise ValueError(f'expected {len(names)} columns on every line')
+                for c in id_columns:
+                    interners[c].add(chunk[c])
+                if integer_values:
+                    column = chunk[value_column].cat
+                    try:
+                        levels = np.array([int(v) for v in column.categories], dtype=value_dtype)
+                    except ValueError as ex:
+                        raise ValueError(f'{value_column} must be an integer ({ex})') from ex
+                    values.append(levels[column.codes.to_numpy()])
+                else:
+                    values.append(chunk[value_column].to_numpy())
+        except pd.errors.EmptyDataError:
+            pass
+    return {c: interners[c].result() for c in id_columns}, (np.concatenate(values) if values else np.empty(0, dtype=value_dtype))
+
+
+def read_trec_run_columnar(file, chunk_size=1_000_000) -> ColumnarRun:
+    """
+    Reads a TREC-formatted run into a :class:`ColumnarRun`.
+
+    Like :func:`read_trec_run`, ``file`` can be a path (optionally gzipped), a file object, or the contents of the run.
+    Rather than building a :class:`ScoredDoc` for every line, the file is parsed in chunks of ``chunk_size`` lines by
+    pandas' C parser (if available), which is much faster for large runs.
+    """
+    np = ir_measures.lazylibs.numpy()
+    try:
+        ir_measures.lazylibs.pandas()
+    except ImportError:
+        return RunConverter(read_trec_run(file)).as_columnar()
+    ids, scores = _read_trec_columns(file, ('query_id', 'iteration', 'doc_id', 'rank', 'score', 'tag'), ('query_id', 'doc_id'), 'score', np.float64, chunk_size)
+    (query_ids, query_codes), (doc_ids, doc_codes) = ids['query_id'], ids['doc_id']
+    return ColumnarRun(query_ids, doc_ids, query_codes, doc_codes, scores)
+
+
+def read_trec_qrels_columnar(file, chunk_size=1_000_000) -> ColumnarQrels:
+    """
+    Reads TREC-formatted qrels into a :class:`ColumnarQrels`.
+
+    Like :func:`read_trec_qrels`, ``file`` can be a path (optionally gzipped), a file object, or the contents of the
+    qrels. The file is parsed in chunks of ``chunk_size`` lines by pandas' C parser (if available).
+    """
+    np = ir_measures.lazylibs.numpy()
+    try:
+        ir_measures.lazylibs.pandas()
+    except ImportError:
+        return QrelsConverter(read_trec_qrels(file)).as_columnar()
+    ids, relevance = _read_trec_columns(file, ('query_id', 'iteration', 'doc_id', 'relevance'), ('query_id', 'iteration', 'doc_id'), 'relevance', np.int32, chunk_size)
+    (query_ids, query_codes), (doc_ids, doc_codes), (iterations, iteration_codes) = ids['query_id'], ids['doc_id'], ids['iteration']
+    return ColumnarQrels(query_ids, doc_ids, query_codes, doc_codes, relevance, iterations, iteration_codes)
+
+
+def read_run(run: Union[str, TYPE_RUN]) -> TYPE_RUN:
+    """
+    Returns ``run`` as-is, unless it is a string, in which case it is read as a path to (or the contents of) a run.
+
+    Files written by :meth:`ColumnarRun.save` are memory-mapped; anything else is parsed as a TREC-formatted run.
+    """
+    if isinstance(run, str):
+        if is_columnar_file(run):
+            return ColumnarRun.load(run)
+        return read_trec_run_columnar(run)
+    return run
+
+
 _AST_PARSE_ERROR = 'problem parsing measure {}; must be in format Measure(k1=v1, k2=v2)@c'
 
 
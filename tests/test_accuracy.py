@@ -53,6 +53,9 @@ class TestMeasures(unittest.TestCase):
 
         expected = sum(value for _, value in results_1) / len(results_1)
         self.assertAlmostEqual(provider.calc_aggregate([accuracy_1], qrels, run)[accuracy_1], expected, delta=1e-9)
+        # the default pipeline also skips the queries without enough levels of relevance
+        accuracy_2 = Accuracy(rel=2)
+        self.assertEqual(ir_measures.calc_aggregate([accuracy_2], qrels, run), provider.calc_aggregate([accuracy_2], qrels, run))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,154 @@
+import os
+import tempfile
+import unittest
+import ir_measures
+from ir_measures import *
+from ir_measures.providers import CachedProvider, ResultCache, fingerprint_run, fingerprint_qrels, fingerprint_provider
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.qrels = list(ir_measures.read_trec_qrels('''
+0 0 D0 0
+0 0 D1 1
+0 0 D2 1
+0 0 D3 2
+1 0 D0 1
+1 0 D3 2
+2 0 D5 2
+'''))
+        self.run = list(ir_measures.read_trec_run('''
+0 0 D0 1 0.8 run
+0 0 D2 2 0.7 run
+0 0 D1 3 0.3 run
+1 0 D1 1 0.8 run
+1 0 D3 2 0.7 run
+'''))
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cache.sqlite')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint_run(self.run), fingerprint_run(self.run[::-1]))
+        self.assertEqual(fingerprint_run(self.run), fingerprint_run(ir_measures.util.RunConverter(self.run).as_dict_of_dict()))
+        self.assertNotEqual(fingerprint_run(self.run), fingerprint_run(self.run[1:]))
+        self.assertNotEqual(fingerprint_run(self.run), fingerprint_run([r._replace(score=r.score + 1) for r in self.run]))
+        self.assertEqual(fingerprint_qrels(self.qrels), fingerprint_qrels(self.qrels[::-1]))
+        self.assertNotEqual(fingerprint_qrels(self.qrels), fingerprint_qrels([q._replace(relevance=1) for q in self.qrels]))
+        self.assertEqual(fingerprint_run([]), fingerprint_run({}))
+
+    def test_cached_provider(self):
+        calls = []
+        def impl(qrels, run):
+            calls.append(1)
+            return len(run)
+        num_docs = ir_measures.define_byquery(impl, name='NumDocs')
+        provider = CachedProvider(ir_measures.DefaultPipeline, self.path)
+        expected = ir_measures.calc([P@1, nDCG@5, num_docs], self.qrels, self.run)
+        calls.clear()
+        result = provider.calc([P@1, nDCG@5, num_docs], self.qrels, self.run)
+        self.assertEqual(result.aggregated, expected.aggregated)
+        key = lambda m: (m.query_id, str(m.measure))
+        self.assertEqual(sorted(result.per_query, key=key), sorted(expected.per_query, key=key))
+        self.assertEqual(len(calls), 2)
+
+        # cached: nothing is re-computed, even from a fresh provider (with the run in another order)
+        provider = CachedProvider(ir_measures.DefaultPipeline, self.path)
+        self.assertEqual(provider.calc_aggregate([P@1, num_docs], self.qrels, self.run[::-1]), {P@1: expected.aggregated[P@1], num_docs: expected.aggregated[num_docs]})
+        self.assertEqual(len(calls), 2)
+
+        # only the missing measure is computed
+        self.assertEqual(provider.calc_aggregate([num_docs, AP], self.qrels, self.run), {num_docs: expected.aggregated[num_docs], AP: ir_measures.calc_aggregate([AP], self.qrels, self.run)[AP]})
+        self.assertEqual(len(calls), 2)
+
+        provider.cache.invalidate(measures=[num_docs])
+        provider.calc_aggregate([num_docs], self.qrels, self.run)
+        self.assertEqual(len(calls), 4)
+
+        provider.cache.invalidate(qrels=self.qrels)
+        self.assertEqual(provider.cache.size(), 0)
+
+    def test_update_qrels(self):
+        calls = []
+        def impl(qrels, run):
+            calls.append(run['query_id'].iloc[0])
+            return float((qrels['relevance'] > 0).sum())
+        num_rel = ir_measures.define_byquery(impl, name='MyNumRel')
+        measures = [P@1, nDCG@5, num_rel]
+        evaluator = CachedProvider(ir_measures.DefaultPipeline, self.path).evaluator(measures, self.qrels)
+        evaluator.calc(self.run)
+        self.assertEqual(calls, ['0', '1'])
+        new_qrels = [Qrel('1', 'D1', 1), Qrel('3', 'D0', 1)]
+        self.assertEqual(evaluator.update_qrels(new_qrels), {'1', '3'})
+        calls.clear()
+        result = evaluator.calc(self.run)
+        # only query 1 is re-computed
+        self.assertEqual(calls, ['1'])
+        expected = ir_measures.calc(measures, self.qrels + new_qrels, self.run)
+        # (values can differ in the last bits, since native's per-query sums depend on the order of the queries in the qrels)
+        for measure in measures:
+            self.assertAlmostEqual(result.aggregated[measure], expected.aggregated[measure])
+        expected_per_query = {(m.query_id, m.measure): m.value for m in expected.per_query}
+        self.assertEqual(len(result.per_query), len(expected_per_query))
+        for metric in result.per_query:
+            self.assertAlmostEqual(metric.value, expected_per_query[metric.query_id, metric.measure])
+        # the results for the updated qrels are cached too
+        calls.clear()
+        self.assertEqual(evaluator.calc_aggregate(self.run), result.aggregated)
+        self.assertEqual(calls, [])
+
+    def test_provider_key(self):
+        # providers (and engines) that give different values for the same measure have separate entries
+        self.assertEqual(fingerprint_provider(ir_measures.gdeval), 'gdeval')
+        self.assertEqual(fingerprint_provider(ir_measures.providers.GdevalProvider()), 'gdeval')
+        self.assertEqual(fingerprint_provider(ir_measures.providers.GdevalProvider(engine='perl')), "gdeval(engine='perl')")
+        self.assertNotEqual(fingerprint_provider(ir_measures.DefaultPipeline), fingerprint_provider(ir_measures.providers.FallbackProvider([ir_measures.native])))
+        calls = []
+        def impl(qrels, run):
+            calls.append(1)
+            return len(run)
+        num_docs = ir_measures.define_byquery(impl, name='NumDocs')
+        provider = CachedProvider(ir_measures.runtime, self.path)
+        provider.calc_aggregate([num_docs], self.qrels, self.run)
+        self.assertEqual(len(calls), 2)
+        pipeline = CachedProvider(ir_measures.DefaultPipeline, self.path)
+        pipeline.calc_aggregate([num_docs], self.qrels, self.run)
+        self.assertEqual(len(calls), 4)
+        pipeline.calc_aggregate([num_docs], self.qrels, self.run)
+        self.assertEqual(len(calls), 4)
+        entry_size = provider.cache.size() // 2
+        provider.cache.invalidate(provider=ir_measures.runtime)
+        self.assertEqual(provider.cache.size(), entry_size)
+
+    def test_unnamed_runtime_measures(self):
+        # measures without an explicit name are all named after their function (e.g., '<lambda>'), so they are not cached
+        provider = CachedProvider(ir_measures.DefaultPipeline, self.path)
+        one = ir_measures.define_byquery(lambda qrels, run: 1.0)
+        two = ir_measures.define_byquery(lambda qrels, run: 2.0)
+        # (query 2 is not in the run)
+        self.assertEqual({m.query_id: m.value for m in provider.iter_calc([one], self.qrels, self.run)}, {'0': 1., '1': 1., '2': 0.})
+        self.assertEqual({m.query_id: m.value for m in provider.iter_calc([two], self.qrels, self.run)}, {'0': 2., '1': 2., '2': 0.})
+        self.assertEqual(provider.cache.size(), 0)
+        # ... while other measures alongside them still are
+        provider.calc_aggregate([two, NumRet], self.qrels, self.run)
+        self.assertGreater(provider.cache.size(), 0)
+        self.assertEqual(provider.calc_aggregate([two, NumRet], self.qrels, self.run)[two], 4 / 3)
+
+    def test_lru(self):
+        # measures whose stored values all have the same size
+        m1, m2, m3 = NumRet(rel=1), NumRet(rel=2), NumRet(rel=3)
+        provider = CachedProvider(ir_measures.DefaultPipeline, self.path, max_size=None)
+        provider.calc_aggregate([m1], self.qrels, self.run)
+        entry_size = provider.cache.size()
+        provider.cache.max_size = entry_size * 2
+        provider.calc_aggregate([m2], self.qrels, self.run)
+        provider.calc_aggregate([m1], self.qrels, self.run) # m1 is now more recently used than m2
+        provider.calc_aggregate([m3], self.qrels, self.run)
+        self.assertEqual(provider.cache.size(), entry_size * 2)
+        cached = provider.cache.get(fingerprint_provider(ir_measures.DefaultPipeline), fingerprint_run(self.run), fingerprint_qrels(self.qrels), [m1, m2, m3])
+        self.assertEqual(set(cached), {m1, m3})
+
+if __name__ == '__main__':
+    unittest.main()
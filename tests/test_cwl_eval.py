@@ -1,8 +1,10 @@
 import os
 import unittest
 import itertools
+import random
 import ir_measures
 from ir_measures import *
+from ir_measures.providers import CwlEvalProvider
 
 
 class TestCwlEval(unittest.TestCase):
@@ -40,6 +42,35 @@ class TestCwlEval(unittest.TestCase):
                     self.assertAlmostEqual(result.query_id, query_id, delta=0.0001)
                     self.assertAlmostEqual(result.value, value, delta=0.0001)
 
+    def test_native_matches_cwl(self):
+        cwl = CwlEvalProvider(engine='cwl')
+        if not cwl.is_available():
+            self.skipTest('cwl not available')
+        rng = random.Random(0)
+        qrels, run = [], []
+        for q in range(20):
+            for _ in range(rng.randint(0, 40)):
+                # includes negative relevance and documents judged more than once
+                qrels.append(Qrel(str(q), f'D{rng.randint(0, 60)}', rng.randint(-1, 3)))
+            for _ in range(1100 if q == 3 else rng.randint(0, 60)): # rankings are cut at 1000
+                # includes ties in score, duplicate documents, and queries missing from the qrels
+                score = float(rng.randint(0, 5)) if rng.random() < 0.5 else rng.random()
+                run.append(ScoredDoc(str(q) if q < 18 else f'X{q}', f'D{rng.randint(0, 90)}', score))
+        measures = [AP, AP(rel=2), RR, RR(rel=3), P@1, P@5, RBP(rel=1), RBP(rel=2, p=0.5), BPM(max_rel=3)@10,
+                    BPM(T=2., max_rel=3)@20, SDCG(max_rel=3)@10, NERR8(max_rel=3)@10, NERR9(max_rel=3)@5,
+                    NERR10(max_rel=3, p=0.7), NERR11(max_rel=3, T=2.), INST(max_rel=3), INST(T=2., min_rel=1, max_rel=3),
+                    INSQ(max_rel=3), INSQ(T=3., max_rel=2)]
+        key = lambda metric: (metric.query_id, str(metric.measure))
+        native = sorted(CwlEvalProvider().iter_calc(measures, qrels, run), key=key)
+        expected = sorted(cwl.iter_calc(measures, qrels, run), key=key)
+        self.assertEqual(len(native), len(expected))
+        for result, exp in zip(native, expected):
+            self.assertEqual(type(result), type(exp))
+            self.assertEqual(key(result), key(exp))
+            for field, value in exp._asdict().items():
+                if field not in ('query_id', 'measure'):
+                    self.assertAlmostEqual(getattr(result, field), value, places=12, msg=f'{field} of {key(exp)}')
+
 
 if __name__ == '__main__':
     unittest.main()
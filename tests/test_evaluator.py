@@ -0,0 +1,254 @@
+import os
+import tempfile
+import unittest
+import unittest.mock
+import ir_measures
+from ir_measures import *
+
+
+QRELS = '''
+0 0 D0 0
+0 0 D1 1
+0 0 D2 1
+0 0 D3 2
+0 0 D4 0
+1 0 D0 1
+1 0 D3 2
+1 0 D5 2
+'''
+
+RUN_A = '''
+0 0 D0 1 0.8 run
+0 0 D2 2 0.7 run
+0 0 D1 3 0.3 run
+0 0 D3 4 0.4 run
+0 0 D4 5 0.1 run
+1 0 D1 1 0.8 run
+1 0 D3 2 0.7 run
+1 0 D4 3 0.3 run
+1 0 D2 4 0.4 run
+'''
+
+RUN_B = '''
+0 0 D3 1 0.8 run
+0 0 D1 2 0.7 run
+1 0 D5 1 0.8 run
+1 0 D0 2 0.1 run
+'''
+
+
+class TestEvaluator(unittest.TestCase):
+
+    def test_calc_many(self):
+        qrels = list(ir_measures.read_trec_qrels(QRELS))
+        runs = {
+            'a': list(ir_measures.read_trec_run(RUN_A)),
+            'b': list(ir_measures.read_trec_run(RUN_B)),
+            'c': [],
+        }
+        # includes a measure from define, which cannot be pickled
+        num_docs = ir_measures.define_byquery(lambda qrels, run: len(run), name='NumDocs')
+        measures = [P@1, nDCG@5, ERR@5, num_docs]
+        evaluator = ir_measures.evaluator(measures, qrels)
+        expected = {name: evaluator.calc(run) for name, run in runs.items()}
+        for n_jobs in [1, 2, -1]:
+            with self.subTest(n_jobs=n_jobs):
+                results = evaluator.calc_many(runs, n_jobs=n_jobs)
+                self.assertEqual(list(results.keys()), ['a', 'b', 'c'])
+                for name in runs:
+                    self.assertEqual(results[name].aggregated, expected[name].aggregated)
+                    self.assertEqual(results[name].per_query, expected[name].per_query)
+                aggregates = evaluator.calc_aggregate_many(runs, n_jobs=n_jobs)
+                self.assertEqual(aggregates, {name: result.aggregated for name, result in expected.items()})
+
+        # sequences are keyed by position
+        self.assertEqual(evaluator.calc_aggregate_many([runs['a'], runs['b']], n_jobs=2), {0: expected['a'].aggregated, 1: expected['b'].aggregated})
+
+    def test_concurrent_pools(self):
+        # pools started by several threads at once each work on their own evaluator and runs
+        from concurrent.futures import ThreadPoolExecutor
+        qrels = list(ir_measures.read_trec_qrels(QRELS))
+        runs = {'a': list(ir_measures.read_trec_run(RUN_A)), 'b': list(ir_measures.read_trec_run(RUN_B))}
+        num_docs = ir_measures.define_byquery(lambda qrels, run: len(run), name='NumDocs')
+        evaluators = [ir_measures.evaluator([P@1, num_docs], qrels), ir_measures.evaluator([nDCG@5, AP], qrels)] * 4
+        expected = [evaluator.calc_aggregate_many(runs) for evaluator in evaluators]
+        with ThreadPoolExecutor(len(evaluators)) as pool:
+            results = list(pool.map(lambda evaluator: evaluator.calc_aggregate_many(runs, n_jobs=2), evaluators))
+        self.assertEqual(results, expected)
+        # workers are only forked on Linux; elsewhere, the runs are evaluated serially
+        with unittest.mock.patch('sys.platform', 'darwin'):
+            self.assertIsNone(ir_measures.providers.base._pool_context())
+            self.assertEqual(evaluators[0].calc_aggregate_many(runs, n_jobs=2), expected[0])
+
+    def test_calc_many_paths(self):
+        qrels = list(ir_measures.read_trec_qrels(QRELS))
+        evaluator = ir_measures.evaluator([P@1, nDCG@5], qrels)
+        with tempfile.TemporaryDirectory() as d:
+            path_a, path_b = os.path.join(d, 'a.run'), os.path.join(d, 'b.run')
+            with open(path_a, 'wt') as f:
+                f.write(RUN_A)
+            ir_measures.read_trec_run_columnar(RUN_B).save(path_b)
+            for n_jobs in [1, 2]:
+                with self.subTest(n_jobs=n_jobs):
+                    results = evaluator.calc_aggregate_many({'a': path_a, 'b': path_b}, n_jobs=n_jobs)
+                    self.assertEqual(results['a'], evaluator.calc_aggregate(ir_measures.read_trec_run(RUN_A)))
+                    self.assertEqual(results['b'], evaluator.calc_aggregate(ir_measures.read_trec_run(RUN_B)))
+
+    def test_calc_columnar(self):
+        qrels = list(ir_measures.read_trec_qrels(QRELS)) + [Qrel('2', 'D0', 1)]
+        run = list(ir_measures.read_trec_run(RUN_A)) + [ScoredDoc('3', 'D0', 1.)]
+        num_docs = ir_measures.define_byquery(lambda qrels, run: len(run), name='NumDocs')
+        measures = [P@1, nDCG@5, ERR@5, AP, NumQ, Judged@2, num_docs]
+        evaluator = ir_measures.evaluator(measures, qrels)
+        expected = evaluator.calc(run)
+        for n_jobs in [1, 2]:
+            with self.subTest(n_jobs=n_jobs):
+                result = evaluator.calc(run, n_jobs=n_jobs, columnar=True)
+                self.assertIsInstance(result.per_query, ir_measures.ColumnarResults)
+                self.assertEqual(result.aggregated.keys(), expected.aggregated.keys())
+                for measure in measures:
+                    self.assertAlmostEqual(result.aggregated[measure], expected.aggregated[measure])
+                self.assertEqual(sorted(result.per_query, key=lambda m: (m.query_id, str(m.measure))), sorted(expected.per_query, key=lambda m: (m.query_id, str(m.measure))))
+                self.assertEqual(len(result.per_query), len(expected.per_query))
+
+        result = ir_measures.calc(measures, qrels, run, columnar=True).per_query
+        # NumDocs also reports query 3, which is not in the qrels
+        self.assertEqual(result.query_ids.tolist(), ['0', '1', '2', '3'])
+        self.assertEqual(result.to_numpy().shape, (4, len(measures)))
+        # query 2 is not in the run, so it has default values
+        self.assertEqual(result[Judged@2].tolist()[:3], [1., 0.5, 0.])
+        self.assertEqual(result[num_docs].tolist()[3], 1.)
+        df = result.to_pandas()
+        self.assertEqual(list(df.columns), [str(m) for m in measures])
+        self.assertEqual(df.loc['1', 'AP'], result[AP][1])
+
+    def test_incremental(self):
+        qrels = list(ir_measures.read_trec_qrels(QRELS)) + [Qrel('2', 'D0', 1)]
+        run_a = list(ir_measures.read_trec_run(RUN_A)) + [ScoredDoc('3', 'D0', 1.)]
+        run_b = list(ir_measures.read_trec_run(RUN_B))
+        num_docs = ir_measures.define_byquery(lambda qrels, run: len(run), name='NumDocs')
+        measures = [P@1, nDCG@5, ERR@5, AP, NumQ, NumRet, Judged@2, num_docs]
+        evaluator = ir_measures.evaluator(measures, qrels)
+
+        def assert_matches(incremental, run):
+            expected = evaluator.calc(run)
+            for measure in measures:
+                self.assertAlmostEqual(incremental.aggregated[measure], expected.aggregated[measure])
+            key = lambda m: (m.query_id, str(m.measure))
+            self.assertEqual(sorted(incremental.per_query, key=key), sorted(expected.per_query, key=key))
+
+        incremental = evaluator.incremental(evaluator.calc(run_a))
+        assert_matches(incremental, run_a)
+        # replace query 0 with its ranking from run b, and add query 2
+        aggregated = incremental.update(run_b[:2] + [ScoredDoc('2', 'D0', 1.)])
+        run = run_b[:2] + run_a[5:] + [ScoredDoc('2', 'D0', 1.)]
+        self.assertEqual(aggregated, incremental.aggregated)
+        assert_matches(incremental, run)
+        # remove query 1 (which gets default values) and query 3 (which is not in the qrels, so is dropped)
+        incremental.update(removed=['1', '3'])
+        run = run_b[:2] + [ScoredDoc('2', 'D0', 1.)]
+        assert_matches(incremental, run)
+        self.assertEqual(incremental.results.aggregated, incremental.aggregated)
+
+        # starting from columnar results
+        incremental = evaluator.incremental(evaluator.calc(run_a, columnar=True))
+        incremental.update(run_b)
+        assert_matches(incremental, run_b + run_a[9:])
+
+        with self.assertRaises(ValueError):
+            incremental.update(run_b[:1], removed=['0'])
+
+    def test_update_qrels(self):
+        qrels = list(ir_measures.read_trec_qrels(QRELS))
+        new_qrels = [Qrel('0', 'D0', 2), Qrel('1', 'D1', 1), Qrel('2', 'D0', 1), Qrel('2', 'D1', 0)]
+        run = list(ir_measures.read_trec_run(RUN_A)) + [ScoredDoc('2', 'D1', 1.)]
+        num_rel = ir_measures.define_byquery(lambda qrels, run: float((qrels['relevance'] > 0).sum()), name='MyNumRel')
+        key = lambda m: (m.query_id, str(m.measure))
+        for provider, measures in [
+                (ir_measures.native, [P@1, nDCG@5, AP, R@3, NumRel, nDCG(gains={0: 1, 1: 3, 2: 4})]),
+                (ir_measures.pytrec_eval, [P@1, nDCG@5, AP, nDCG(gains={0: 1, 1: 3, 2: 4})]),
+                (ir_measures.runtime, [num_rel]),
+                (ir_measures.judged, [Judged@2]),
+                (ir_measures.DefaultPipeline, [P@1, nDCG@5, ERR@5, Judged@2, num_rel]),
+                (ir_measures.DefaultPipeline, [ERR@5, Judged@2])]:
+            with self.subTest(provider=getattr(provider, 'NAME', 'default'), measures=measures):
+                # the evaluators of gdeval and judged are rebuilt from the qrels by DefaultPipeline, so they are given
+                # as a list rather than an iterator
+                evaluator = provider.evaluator(measures, qrels if provider is ir_measures.DefaultPipeline else iter(qrels))
+                evaluator.calc(run)
+                if provider is ir_measures.judged:
+                    with self.assertRaises(NotImplementedError):
+                        evaluator.update_qrels(new_qrels)
+                    continue
+                self.assertEqual(evaluator.update_qrels(new_qrels), {'0', '1', '2'})
+                expected = provider.evaluator(measures, qrels + new_qrels).calc(run)
+                result = evaluator.calc(run)
+                self.assertEqual(result.aggregated, expected.aggregated)
+                self.assertEqual(sorted(result.per_query, key=key), sorted(expected.per_query, key=key))
+        # a judgment for another subtopic keeps the document's existing subtopic judgments
+        qrels = [Qrel('1', 'D1', 1, '0'), Qrel('1', 'D2', 1, '1'), Qrel('1', 'D3', 1, '0')]
+        new_qrels = [Qrel('1', 'D1', 1, '1')]
+        run = [ScoredDoc('1', 'D1', 3.), ScoredDoc('1', 'D2', 2.), ScoredDoc('1', 'D3', 1.)]
+        measures = [alpha_nDCG@3, StRecall@1, P@1]
+        evaluator = ir_measures.evaluator(measures, qrels)
+        evaluator.calc(run)
+        self.assertEqual(evaluator.update_qrels(new_qrels), {'1'})
+        self.assertEqual(evaluator.calc_aggregate(run), ir_measures.evaluator(measures, qrels + new_qrels).calc_aggregate(run))
+        self.assertEqual(evaluator.calc_aggregate(run), {alpha_nDCG@3: 1., StRecall@1: 1., P@1: 1.})
+        # the qrels given as a dict are not changed
+        qrels_dict = ir_measures.util.QrelsConverter(qrels).as_dict_of_dict()
+        ir_measures.pytrec_eval.evaluator([P@1], qrels_dict).update_qrels(new_qrels)
+        self.assertEqual(qrels_dict, ir_measures.util.QrelsConverter(qrels).as_dict_of_dict())
+        # evaluators that need to be rebuilt cannot be when the qrels were given as an iterator
+        evaluator = ir_measures.evaluator([P@1, ERR@5], iter(qrels))
+        with self.assertRaises(NotImplementedError):
+            evaluator.update_qrels(new_qrels)
+
+    def test_sharded(self):
+        qrels = list(ir_measures.read_trec_qrels(QRELS)) + [Qrel('2', 'D0', 1), Qrel('3', 'D1', 1)]
+        run = list(ir_measures.read_trec_run(RUN_A)) + list(ir_measures.read_trec_run(RUN_B.replace('\n0 ', '\n2 ').replace('\n1 ', '\n4 ')))
+        num_docs = ir_measures.define_byquery(lambda qrels, run: len(run), name='NumDocs')
+        measures = [P@1, nDCG@5, ERR@5, AP, NumQ, num_docs]
+        evaluator = ir_measures.evaluator(measures, qrels)
+        expected = evaluator.calc(run)
+        for n_jobs in [2, 3, 10, -1]:
+            with self.subTest(n_jobs=n_jobs):
+                result = evaluator.calc(run, n_jobs=n_jobs)
+                self.assertEqual(result.aggregated, expected.aggregated)
+                self.assertEqual(sorted(result.per_query, key=lambda m: (m.query_id, str(m.measure))), sorted(expected.per_query, key=lambda m: (m.query_id, str(m.measure))))
+                # deterministic order
+                self.assertEqual(list(evaluator.iter_calc(run, n_jobs=n_jobs)), result.per_query)
+                self.assertEqual(evaluator.calc_aggregate(run, n_jobs=n_jobs), expected.aggregated)
+        self.assertEqual(list(evaluator.iter_calc([], n_jobs=2)), list(evaluator.iter_calc([])))
+
+    def test_stream(self):
+        qrels = list(ir_measures.read_trec_qrels(QRELS)) + [Qrel('2', 'D0', 1)]
+        run = list(ir_measures.read_trec_run(RUN_A)) + list(ir_measures.read_trec_run(RUN_B.replace('\n0 ', '\n3 ').replace('\n1 ', '\n4 ')))
+        batch_rows = []
+        def num_docs(qrels, run):
+            batch_rows.append(len(run))
+            return [(qid, len(docs)) for qid, docs in run.groupby('query_id')]
+        measures = [P@1, nDCG@5, ERR@5, AP, Judged@2, ir_measures.define(num_docs, name='NumDocs', support_cutoff=False)]
+        evaluator = ir_measures.evaluator(measures, qrels)
+        expected = sorted(evaluator.iter_calc(run), key=lambda m: (m.query_id, str(m.measure)))
+        for batch_size in [1, 4, 6, 100]:
+            with self.subTest(batch_size=batch_size):
+                batch_rows.clear()
+                result = list(evaluator.iter_calc_stream(iter(run), batch_size=batch_size))
+                self.assertEqual(sorted(result, key=lambda m: (m.query_id, str(m.measure))), expected)
+                # whole queries are evaluated together, so a batch can exceed batch_size by less than one query
+                self.assertTrue(all(rows < batch_size + 5 for rows in batch_rows))
+                self.assertEqual(len(batch_rows), {1: 4, 4: 3, 6: 2, 100: 1}[batch_size])
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'run')
+            with open(path, 'wt') as f:
+                f.write(RUN_A)
+            self.assertEqual(list(evaluator.iter_calc_stream(path)), list(evaluator.iter_calc_stream(ir_measures.read_trec_run(RUN_A))))
+
+        ungrouped = run[:2] + run[5:] + run[2:5]
+        with self.assertRaises(ValueError):
+            list(evaluator.iter_calc_stream(ungrouped, batch_size=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
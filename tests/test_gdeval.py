@@ -1,6 +1,9 @@
 import unittest
 import itertools
+import random
+import subprocess
 import ir_measures
+from ir_measures.providers import GdevalProvider
 
 
 class TestPytrecEval(unittest.TestCase):
@@ -92,6 +95,57 @@ class TestPytrecEval(unittest.TestCase):
         self.assertEqual(result[1].value, 0.09375)
         self.assertEqual(provider.calc_aggregate([measure], qrels, run)[measure], 0.0625)
 
+    def _random_inputs(self):
+        rng = random.Random(0)
+        qrels, run = [], []
+        for q in range(30):
+            qid = str(q) if q % 3 else f'wt-{q}' # gdeval strips prefixes from query IDs
+            for _ in range(rng.randint(0, 30)):
+                # includes documents judged more than once and queries without relevant documents
+                qrels.append(ir_measures.Qrel(qid, f'D{rng.randint(0, 50)}', rng.randint(-1, 4)))
+            for _ in range(rng.randint(0, 40)):
+                # includes ties in score and duplicate documents
+                score = float(rng.randint(0, 5)) if rng.random() < 0.5 else rng.random()
+                run.append(ir_measures.ScoredDoc(qid if q < 25 else str(q + 100), f'D{rng.randint(0, 80)}', score))
+        measures = [ir_measures.ERR@5, ir_measures.ERR@20, ir_measures.nDCG@10, ir_measures.nDCG@20, ir_measures.nDCG@1000]
+        return measures, qrels, run
+
+    def test_native_matches_perl(self):
+        perl = GdevalProvider(engine='perl')
+        if not perl.is_available():
+            self.skipTest('perl not available')
+        measures, qrels, run = self._random_inputs()
+        native = GdevalProvider()
+        key = lambda metric: (metric.query_id, str(metric.measure))
+        self.assertEqual(sorted(native.iter_calc(measures, qrels, run), key=key), sorted(perl.iter_calc(measures, qrels, run), key=key))
+        self.assertEqual(native._num_passes(measures), 1)
+
+        with self.assertRaises(ValueError):
+            native.evaluator(measures, [ir_measures.Qrel('q1', 'D1', 1)])
+        with self.assertRaises(ValueError):
+            native.evaluator(measures, [ir_measures.Qrel('1', 'D1', 5)])
+
+    def test_perl_worker(self):
+        perl = GdevalProvider(engine='perl')
+        if not perl.is_available():
+            self.skipTest('perl not available')
+        measures, qrels, run = self._random_inputs()
+        key = lambda metric: (metric.query_id, str(metric.measure))
+        expected = sorted(perl.iter_calc(measures, qrels, run), key=key)
+        evaluator = GdevalProvider(engine='perl_worker').evaluator(measures, qrels)
+        try:
+            self.assertEqual(sorted(evaluator.iter_calc(run), key=key), expected)
+            pid = evaluator._worker.pid
+            # the same process scores later runs
+            self.assertEqual(sorted(evaluator.iter_calc(run), key=key), expected)
+            self.assertEqual(evaluator._worker.pid, pid)
+            self.assertEqual({m.value for m in evaluator.iter_calc([])}, {0.})
+        finally:
+            evaluator.close()
+        self.assertIsNone(evaluator._worker)
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            GdevalProvider(engine='perl_worker').evaluator(measures, [ir_measures.Qrel('q1', 'D1', 1)]).calc_aggregate(run)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,167 @@
+import unittest
+import itertools
+import ir_measures
+from ir_measures import *
+from .base import BaseMeasureTest
+
+
+class TestNative(BaseMeasureTest):
+    QRELS = '''
+0 0 D0 0
+0 0 D1 1
+0 0 D2 1
+0 0 D3 2
+0 0 D4 0
+0 0 D9 -1
+1 0 D0 1
+1 0 D3 2
+1 0 D5 2
+2 0 D0 0
+'''
+    RUN = '''
+0 0 D0 1 0.8 run
+0 0 D2 2 0.7 run
+0 0 D1 3 0.3 run
+0 0 D3 4 0.4 run
+0 0 D4 5 0.1 run
+0 0 D9 6 0.1 run
+0 0 D7 7 0.1 run
+1 0 D1 1 0.8 run
+1 0 D3 2 0.7 run
+1 0 D4 3 0.3 run
+1 0 D2 4 0.4 run
+2 0 D1 1 0.8 run
+3 0 D1 1 0.8 run
+'''
+
+    def test_basic(self):
+        qrels = list(ir_measures.read_trec_qrels(self.QRELS))
+        run = list(ir_measures.read_trec_run(self.RUN))
+        provider = ir_measures.native
+        result = {(m.query_id, m.measure): m.value for m in provider.iter_calc([P@3, RR, AP, NumRet, NumRel, Success@1], qrels, run)}
+        self.assertEqual(result['0', P@3], 2/3)
+        self.assertEqual(result['1', P@3], 1/3)
+        self.assertEqual(result['2', P@3], 0.)
+        self.assertEqual(result['0', RR], 1/2)
+        self.assertEqual(result['1', RR], 1/2)
+        self.assertAlmostEqual(result['0', AP], (1/2 + 2/3 + 3/4) / 3)
+        self.assertEqual(result['0', NumRet], 7)
+        self.assertEqual(result['1', NumRel], 3)
+        self.assertEqual(result['0', Success@1], 0.)
+        # query 3 is not in the qrels, so it is not reported
+        self.assertNotIn(('3', P@3), result)
+
+    def test_ties(self):
+        # ties are broken by doc_id descending, like trec_eval
+        qrels = [Qrel('0', 'A', 1), Qrel('0', 'B', 0)]
+        run = [ScoredDoc('0', 'A', 1.), ScoredDoc('0', 'B', 1.)]
+        self.assertEqual(ir_measures.native.calc_aggregate([RR], qrels, run)[RR], 0.5)
+        run = [ScoredDoc('0', 'A', 1.), ScoredDoc('0', 'B', 0.)]
+        self.assertEqual(ir_measures.native.calc_aggregate([RR], qrels, run)[RR], 1.)
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            ir_measures.native.evaluator([ERR@10], [])
+        with self.assertRaises(ValueError):
+            ir_measures.native.evaluator([RR@10], [])
+        # exp-log2 gains are left to gdeval, which gives different values (e.g., rounded to 5 decimal places)
+        with self.assertRaises(ValueError):
+            ir_measures.native.evaluator([nDCG(dcg='exp-log2')@10], [])
+        plan = ir_measures.DefaultPipeline.plan([nDCG(dcg='exp-log2')@10])
+        self.assertEqual([step.provider.NAME for step in plan], ['gdeval'])
+
+    def test_matches_pytrec_eval(self):
+        qrels = list(ir_measures.read_trec_qrels(self.QRELS))
+        run = list(ir_measures.read_trec_run(self.RUN))
+        measures = []
+        for rel, judged_only in itertools.product([1, 2], [False, True]):
+            measures += [P(rel=rel, judged_only=judged_only)@k for k in [1, 3, 5, 10]]
+            measures += [R(rel=rel, judged_only=judged_only)@k for k in [1, 3, 5, 10]]
+            measures += [AP(rel=rel, judged_only=judged_only), AP(rel=rel, judged_only=judged_only)@3]
+            measures += [RR(rel=rel, judged_only=judged_only), Rprec(rel=rel, judged_only=judged_only), Success(rel=rel, judged_only=judged_only)@3]
+            measures += [SetP(rel=rel, judged_only=judged_only), SetP(rel=rel, relative=True, judged_only=judged_only)]
+            measures += [SetF(rel=rel, judged_only=judged_only), SetAP(rel=rel, judged_only=judged_only)]
+        for judged_only in [False, True]:
+            measures += [nDCG(judged_only=judged_only), nDCG(judged_only=judged_only)@3, nDCG(gains={0: 1, 1: 3, 2: 4}, judged_only=judged_only)@5]
+        measures += [NumRet, NumRet(rel=1), NumQ, NumRel, SetR, SetF(beta=0.5), SetF(beta=2.)]
+        native = {(m.query_id, str(m.measure)): m.value for m in ir_measures.native.iter_calc(measures, qrels, run)}
+        pytrec = {(m.query_id, str(m.measure)): m.value for m in ir_measures.pytrec_eval.iter_calc(measures, qrels, run)}
+        self.assertEqual(native.keys(), pytrec.keys())
+        for key in native:
+            with self.subTest(key):
+                self.assertAlmostEqual(native[key], pytrec[key], places=7)
+
+    def test_dense(self):
+        np = ir_measures.lazylibs.numpy()
+        rng = np.random.default_rng(42)
+        scores = rng.normal(size=(20, 15))
+        labels = rng.integers(0, 3, size=(20, 15)) * (rng.random((20, 15)) < 0.3) - (rng.random((20, 15)) < 0.05)
+        mask = np.arange(15)[None, :] < rng.integers(0, 16, size=20)[:, None]
+        measures = [nDCG@10, nDCG, RR, AP, AP(rel=2), P@5, R@10, Success@3, Rprec, SetF, NumQ, NumRet, NumRel, nDCG(judged_only=True)@5]
+        evaluator = ir_measures.dense_evaluator(measures)
+        # the same rankings with IDs; zero-padded doc_ids and distinct scores avoid tie-breaking differences
+        run = [ScoredDoc(str(q), f'{c:02d}', float(scores[q, c])) for q, c in zip(*np.nonzero(mask))]
+        qrels = [Qrel(str(q), f'{c:02d}', int(labels[q, c])) for q, c in zip(*np.nonzero(mask))]
+        per_query = evaluator.calc(scores, labels, mask=mask)
+        expected = {(m.query_id, m.measure): m.value for m in ir_measures.native.iter_calc(measures, qrels, run)}
+        for measure in measures:
+            with self.subTest(measure=measure):
+                self.assertEqual(per_query[measure].shape, (20,))
+                for q in range(20):
+                    if str(q) in {qrel.query_id for qrel in qrels}:
+                        self.assertAlmostEqual(per_query[measure][q], expected[str(q), measure])
+                    else: # a query without any candidates
+                        self.assertEqual(per_query[measure][q], 1. if measure == NumQ else 0.)
+        aggregated = evaluator.calc_aggregate(scores, labels, mask=mask)
+        self.assertAlmostEqual(aggregated[AP], per_query[AP].mean())
+        self.assertEqual(aggregated[NumQ], 20)
+        self.assertEqual(aggregated[NumRet], mask.sum())
+
+        # without a mask, all candidates are used; ties keep the column order
+        result = ir_measures.dense_evaluator([RR, P@1]).calc_aggregate([[1., 1., 0.], [0., 1., 1.]], [[0, 1, 0], [0, 0, 1]])
+        self.assertEqual(result, {RR: 0.5, P@1: 0.})
+
+        with self.assertRaises(ValueError):
+            evaluator.calc(scores, labels[:5])
+        with self.assertRaises(ValueError):
+            evaluator.calc(scores, labels, mask=mask[:, :3])
+        with self.assertRaises(ValueError):
+            ir_measures.dense_evaluator([ERR@10])
+
+    def test_curve(self):
+        np = ir_measures.lazylibs.numpy()
+        qrels = list(ir_measures.read_trec_qrels(self.QRELS))
+        run = list(ir_measures.read_trec_run(self.RUN))
+        measures = [P, R, AP, nDCG, Success, P(rel=2), AP(judged_only=True), nDCG(gains={0: 1, 1: 3, 2: 4})]
+        curve = ir_measures.calc_curve(measures, qrels, run, cutoffs=8)
+        self.assertEqual(curve.query_ids, ['0', '1', '2'])
+        self.assertEqual(curve.cutoffs.tolist(), list(range(1, 9)))
+        for measure in measures:
+            with self.subTest(measure=measure):
+                at_cutoffs = [measure@k for k in range(1, 9)]
+                expected = {(m.query_id, m.measure): m.value for m in ir_measures.native.iter_calc(at_cutoffs, qrels, run)}
+                self.assertEqual(curve.per_query[measure].shape, (3, 8))
+                for i, query_id in enumerate(curve.query_ids):
+                    for j, m in enumerate(at_cutoffs):
+                        self.assertAlmostEqual(curve.per_query[measure][i, j], expected[query_id, m])
+                aggregated = ir_measures.native.calc_aggregate(at_cutoffs, qrels, run)
+                self.assertTrue(np.allclose(curve.aggregated[measure], [aggregated[m] for m in at_cutoffs]))
+
+        # arbitrary cutoffs; queries missing from the run are 0
+        curve = ir_measures.calc_curve([P], qrels, run[:7], cutoffs=[5, 1])
+        self.assertEqual(curve.per_query[P].tolist(), [[0.6, 0.], [0., 0.], [0., 0.]])
+        self.assertTrue(np.allclose(curve.aggregated[P], [0.2, 0.]))
+
+        with self.assertRaises(ValueError):
+            ir_measures.calc_curve([P@5], qrels, run, cutoffs=5)
+        with self.assertRaises(ValueError):
+            ir_measures.calc_curve([RR], qrels, run, cutoffs=5)
+        with self.assertRaises(ValueError):
+            ir_measures.calc_curve([P], qrels, run, cutoffs=[0, 1])
+
+    def test_empty(self):
+        self.assertEqual(list(ir_measures.native.iter_calc([P@5, nDCG], [], [])), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
+import sys
 import numpy
 import unittest
+import subprocess
 import itertools
 import ir_measures
 from ir_measures import *
@@ -146,6 +148,143 @@ class TestPytrecEval(unittest.TestCase):
         numpy.testing.assert_equal(ir_measures.accuracy.calc_aggregate([Accuracy()], empty, empty), {Accuracy(): float('NaN')})
 
 
+class TestLazyProviders(unittest.TestCase):
+
+    def test_builtin_measure_names(self):
+        for name, (module, measure_names) in ir_measures.providers.BUILTIN_PROVIDERS.items():
+            with self.subTest(name):
+                # once loaded, the real provider replaces the stand-in in the registry
+                provider = ir_measures.providers.LazyProvider(name, module).load()
+                self.assertNotIsInstance(provider, ir_measures.providers.LazyProvider)
+                self.assertEqual(sorted(measure_names), sorted({m.NAME for m in provider.SUPPORTED_MEASURES}))
+
+    def test_import_is_lazy(self):
+        heavy = ['numpy', 'pandas', 'pytrec_eval', 'cwl', 'ranx', 'trectools', 'pyndeval', 'sqlite3', 'multiprocessing',
+                 'ir_measures.providers.cwl_eval', 'ir_measures.providers.pytrec_eval_provider', 'ir_measures.providers.native_provider']
+        script = f'import sys, ir_measures; print(sorted(m for m in {heavy!r} if m in sys.modules))'
+        output = subprocess.check_output([sys.executable, '-c', script], text=True)
+        self.assertEqual(output.strip(), '[]')
+
+        # building and running a native evaluator only needs numpy
+        script = ('import sys, ir_measures; from ir_measures import P, nDCG, Qrel, ScoredDoc; '
+                  "evaluator = ir_measures.native.evaluator([P@5, nDCG@10], [Qrel('0', 'a', 1)]); "
+                  "result = evaluator.calc_aggregate([ScoredDoc('0', 'a', 1.)]); "
+                  f'print(sorted(m for m in {heavy!r} if m in sys.modules), result[P@5])')
+        output = subprocess.check_output([sys.executable, '-c', script], text=True)
+        self.assertEqual(output.strip(), "['ir_measures.providers.native_provider', 'numpy'] 0.2")
+
+    def test_import_time(self):
+        # A timed check that catches regressions in laziness that only add time (see also
+        # examples/import_time_benchmark.py). Times are compared with that of importing numpy on the same machine,
+        # rather than with a fixed budget: importing ir_measures eagerly (numpy and the providers) took over twice as
+        # long as numpy, and it now takes less.
+        def import_time(module):
+            # the fastest of 3 runs, as the cumulative import time (in microseconds) reported by -X importtime
+            times = []
+            for _ in range(3):
+                stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True, check=True).stderr
+                times.append(next(int(line.split('|')[1]) for line in stderr.splitlines() if line.split('|')[-1] == f' {module}'))
+            return min(times)
+        self.assertLess(import_time('ir_measures'), 1.5 * import_time('numpy'))
+
+    def test_evaluation_is_lazy(self):
+        # planning an evaluation only loads the providers (and libraries) that it uses
+        heavy = ['pandas', 'pytrec_eval', 'cwl', 'ranx', 'numba', 'trectools', 'pyndeval', 'ir_measures.providers.cwl_eval']
+        script = ('import sys, ir_measures; from ir_measures import P, nDCG, Qrel, ScoredDoc; '
+                  "result = ir_measures.calc_aggregate([P@5, nDCG@10], [Qrel('0', 'a', 1)], [ScoredDoc('0', 'a', 1.)]); "
+                  f'print(sorted(m for m in {heavy!r} if m in sys.modules), result[P@5])')
+        output = subprocess.check_output([sys.executable, '-c', script], text=True)
+        self.assertEqual(output.strip(), '[] 0.2')
+
+
+class TestFallbackPlanner(unittest.TestCase):
+    QRELS = [Qrel('0', 'D0', 0), Qrel('0', 'D1', 1), Qrel('0', 'D2', 2), Qrel('1', 'D0', 1), Qrel('1', 'D3', 2)]
+    RUN = [ScoredDoc('0', 'D0', 0.9), ScoredDoc('0', 'D2', 0.8), ScoredDoc('0', 'D1', 0.1), ScoredDoc('1', 'D3', 0.5), ScoredDoc('1', 'D1', 0.4)]
+
+    def test_plan(self):
+        measures = [P@5, nDCG@10, ERR@20, Bpref]
+        steps = ir_measures.DefaultPipeline.plan(measures, self.QRELS)
+        plan = {step.provider.NAME: set(step.measures) for step in steps}
+        # Bpref is only supported by pytrec_eval, so it also takes P@5 and nDCG@10 rather than converting the inputs
+        # again for native
+        self.assertEqual(plan, {'pytrec_eval': {P@5, nDCG@10, Bpref}, 'gdeval': {ERR@20}})
+        plan = {step.provider.NAME: set(step.measures) for step in ir_measures.DefaultPipeline.plan([P@5, nDCG@10, ERR@20], self.QRELS)}
+        self.assertEqual(plan, {'native': {P@5, nDCG@10}, 'gdeval': {ERR@20}})
+        self.assertTrue(all(step.cost > 0 for step in steps))
+
+        # the cheapest equivalent provider is used, even if it comes later in the pipeline
+        pipeline = ir_measures.providers.FallbackProvider([ir_measures.pytrec_eval, ir_measures.native])
+        self.assertEqual([step.provider.NAME for step in pipeline.plan([P@5], self.QRELS)], ['native'])
+        pipeline = ir_measures.providers.FallbackProvider([ir_measures.pytrec_eval, ir_measures.native], cost_based=False)
+        self.assertEqual([step.provider.NAME for step in pipeline.plan([P@5], self.QRELS)], ['pytrec_eval'])
+        # ... but never one that may give different values
+        pipeline = ir_measures.providers.FallbackProvider([ir_measures.trectools, ir_measures.native])
+        self.assertEqual([step.provider.NAME for step in pipeline.plan([P@5], self.QRELS)], ['trectools'])
+
+        with self.assertRaises(ValueError):
+            ir_measures.DefaultPipeline.plan([Judged@5, Bpref(rel=2), RBP(p=0.5)], {})
+        with self.assertRaises(ValueError):
+            ir_measures.providers.FallbackProvider([ir_measures.native]).plan([ERR@5])
+
+    def test_equivalent(self):
+        measures = [P@5, nDCG@10, ERR@20, Bpref, Judged@10, nDCG(gains={0: 1, 1: 2, 2: 3})@5, SetF, RBP(rel=1)]
+        first_fit = ir_measures.providers.FallbackProvider(ir_measures.DefaultPipeline.providers, cost_based=False)
+        expected = first_fit.calc_aggregate(measures, self.QRELS, self.RUN)
+        result = ir_measures.DefaultPipeline.calc_aggregate(measures, self.QRELS, self.RUN)
+        self.assertEqual(result.keys(), expected.keys())
+        for measure in measures:
+            self.assertAlmostEqual(result[measure], expected[measure], places=4)
+
+    def test_independent_of_other_measures(self):
+        # a measure's value must not depend on which other measures are calculated alongside it
+        numpy.random.seed(0)
+        qrels = [Qrel(str(q), f'D{d}', int(numpy.random.randint(-1, 4))) for q in range(10) for d in numpy.random.choice(50, 20, replace=False)]
+        run = [ScoredDoc(str(q), f'D{d}', float(numpy.random.randint(0, 20))) for q in range(10) for d in numpy.random.choice(50, 30, replace=False)]
+        measures = [AP, P@10, RR, RR@10, nDCG@10, R@20, Bpref, ERR@20, Judged@10, SetF, RBP(rel=1), SDCG(max_rel=3)@10, NERR10(max_rel=3)]
+        combined = ir_measures.calc_aggregate(measures, qrels, run)
+        for measure in measures:
+            with self.subTest(str(measure)):
+                # (equivalent providers may still round differently)
+                self.assertAlmostEqual(ir_measures.calc_aggregate([measure], qrels, run)[measure], combined[measure], places=12)
+
+    def test_max_depth(self):
+        self.assertEqual([m.max_depth() for m in [P@5, nDCG@10, RR@10, ERR@20, Judged@3]], [5, 10, 10, 20, 3])
+        self.assertEqual([m.max_depth() for m in [AP, RR, NumRet, Bpref, P(judged_only=True)@5, RBP]], [None] * 6)
+
+        numpy.random.seed(0)
+        qrels = [Qrel(str(q), f'D{d}', int(numpy.random.randint(-1, 3))) for q in range(5) for d in numpy.random.choice(100, 20, replace=False)]
+        run = [ScoredDoc(str(q), f'D{d}', float(numpy.random.randint(0, 50))) for q in range(5) for d in range(100)]
+        measures = [P@5, nDCG@10, RR@10, ERR@20, Judged@10, AP@10, R@20, Success@3]
+        evaluator = ir_measures.evaluator(measures, qrels)
+        self.assertEqual(evaluator.max_depth, 20)
+        pruned = sorted(evaluator.iter_calc(run), key=lambda m: (m.query_id, str(m.measure)))
+        evaluator.max_depth = None
+        expected = sorted(evaluator.iter_calc(run), key=lambda m: (m.query_id, str(m.measure)))
+        self.assertEqual([(m.query_id, m.measure) for m in pruned], [(m.query_id, m.measure) for m in expected])
+        for p, e in zip(pruned, expected):
+            self.assertAlmostEqual(p.value, e.value)
+
+        # duplicated documents in the run give the same results with and without truncation
+        qrels = [Qrel('0', 'A', 0), Qrel('0', 'B', 1)]
+        run = [ScoredDoc('0', 'A', 2.), ScoredDoc('0', 'B', 1.), ScoredDoc('0', 'A', 0.5)]
+        self.assertEqual(ir_measures.calc_aggregate([P@1], qrels, run)[P@1], ir_measures.calc_aggregate([P@1, AP], qrels, run)[P@1])
+        self.assertEqual(ir_measures.calc_aggregate([P@1], qrels, run)[P@1], ir_measures.pytrec_eval.calc_aggregate([P@1], qrels, run)[P@1])
+        # ... while gdeval scores every row, so it is given the whole run
+        qrels = [Qrel('0', 'A', 2), Qrel('0', 'B', 1)]
+        run = [ScoredDoc('0', 'A', 3.), ScoredDoc('0', 'B', 2.), ScoredDoc('0', 'A', 1.)] + [ScoredDoc('0', f'X{i}', 0.) for i in range(10)]
+        for measures in [[ERR@10], [ERR@10, P@1], [nDCG(dcg='exp-log2')@10, P@1]]:
+            with self.subTest(str(measures)):
+                self.assertEqual(ir_measures.calc_aggregate(measures, qrels, run), ir_measures.gdeval.calc_aggregate(measures[:1], qrels, run) | ir_measures.pytrec_eval.calc_aggregate(measures[1:], qrels, run))
+
+        # an unbounded measure needs the full run
+        self.assertNotIsInstance(ir_measures.evaluator([P@5, AP], qrels), ir_measures.providers.fallback_provider.FallbackEvaluator)
+
+    def test_explain(self):
+        explanation = ir_measures.DefaultPipeline.explain([P@5, ERR@20])
+        self.assertIn('gdeval: ERR@20', explanation)
+        self.assertIn('native: P@5', explanation)
+        self.assertIn('pytrec_eval (not used)', explanation)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,10 @@
+import math
+import random
 import unittest
 import itertools
 import ir_measures
 from ir_measures import *
+from ir_measures.providers import PyNdEvalProvider
 
 
 class TestPynedvalEval(unittest.TestCase):
@@ -81,6 +84,77 @@ class TestPynedvalEval(unittest.TestCase):
         self.assertAlmostEqual(result[1].value, 0.1803, places=4)
         self.assertAlmostEqual(provider.calc_aggregate([measure], qrels, run)[measure], 0.3231, places=4)
 
+    def test_native_matches_pyndeval(self):
+        pyndeval = PyNdEvalProvider(engine='pyndeval')
+        if not pyndeval.is_available():
+            self.skipTest('pyndeval not available')
+        rng = random.Random(0)
+        qrels, run = [], []
+        for q in range(30):
+            subtopics = rng.randint(1, 6)
+            for doc_id in {f'D{rng.randint(0, 60)}' for _ in range(rng.randint(0, 40))}:
+                for subtopic in rng.sample(range(subtopics), rng.randint(1, subtopics)):
+                    # subtopic IDs are shared between some queries
+                    qrels.append(Qrel(str(q), doc_id, rng.choice([0, 0, 1, 2, 3]), f'{q % 3}-{subtopic}'))
+            for doc_id in rng.sample(range(90), rng.randint(0, 50)):
+                # includes ties in score, unjudged documents, and queries missing from the qrels
+                run.append(ScoredDoc(str(q) if q < 28 else f'X{q}', f'D{doc_id}', float(rng.randint(0, 10))))
+        measures = [ERR_IA@1, ERR_IA@5, ERR_IA(rel=2)@20, nERR_IA@1, nERR_IA@10, nERR_IA(judged_only=True)@20,
+                    alpha_DCG@5, alpha_DCG(alpha=0.2)@20, alpha_nDCG@10, alpha_nDCG(alpha=0.9, rel=2)@3,
+                    alpha_nDCG(judged_only=True)@20, NRBP, NRBP(alpha=0.3, beta=0.8), nNRBP, nNRBP(alpha=0.7, beta=0.2, rel=2),
+                    AP_IA, AP_IA(rel=2), AP_IA(judged_only=True), P_IA@5, P_IA(rel=3)@20, P_IA(judged_only=True)@7,
+                    StRecall@5, StRecall(rel=2)@20]
+        self._assert_engines_match(pyndeval, measures, qrels, run)
+
+    def test_native_duplicate_documents(self):
+        pyndeval = PyNdEvalProvider(engine='pyndeval')
+        if not pyndeval.is_available():
+            self.skipTest('pyndeval not available')
+        rng = random.Random(1)
+        qrels, run = [], []
+        for q in range(20):
+            for subtopic in range(rng.randint(1, 4)):
+                for doc_id in rng.sample(range(20), rng.randint(1, 10)):
+                    qrels.append(Qrel(str(q), f'D{doc_id}', rng.choice([0, 1, 2, 3]), str(subtopic)))
+            # documents are returned several times, with the same or different scores
+            for _ in range(rng.randint(0, 40)):
+                run.append(ScoredDoc(str(q), f'D{rng.randint(0, 25)}', float(rng.randint(0, 10))))
+        measures = [ERR_IA@5, nERR_IA(rel=2)@10, alpha_DCG@20, alpha_nDCG@10, alpha_nDCG(judged_only=True)@10,
+                    NRBP, nNRBP(rel=2), AP_IA, AP_IA(rel=3), P_IA@5, StRecall(rel=2)@10]
+        self._assert_engines_match(pyndeval, measures, qrels, run)
+
+    def _assert_engines_match(self, pyndeval, measures, qrels, run):
+        key = lambda metric: (metric.query_id, str(metric.measure))
+        native = sorted(PyNdEvalProvider().iter_calc(measures, qrels, run), key=key)
+        expected = sorted(pyndeval.iter_calc(measures, qrels, run), key=key)
+        self.assertEqual([key(m) for m in native], [key(m) for m in expected])
+        for result, exp in zip(native, expected):
+            if math.isnan(exp.value): # nNRBP of queries without relevant documents
+                self.assertTrue(math.isnan(result.value), msg=str(key(exp)))
+            else:
+                self.assertAlmostEqual(result.value, exp.value, places=12, msg=str(key(exp)))
+
+    def test_native_judged_only(self):
+        qrels = list(ir_measures.read_trec_qrels('''
+0 0 D0 0
+0 0 D1 1
+0 1 D2 1
+0 1 D3 1
+'''))
+        run = list(ir_measures.read_trec_run('''
+0 0 D5 1 0.9 run
+0 0 D1 2 0.8 run
+0 0 D6 3 0.7 run
+0 0 D2 4 0.6 run
+'''))
+        judged_run = [scoreddoc for scoreddoc in run if scoreddoc.doc_id in ('D1', 'D2')]
+        provider = PyNdEvalProvider()
+        for measure in [ERR_IA@5, nERR_IA@5, alpha_nDCG@30, AP_IA, P_IA@2]:
+            with self.subTest(measure=measure):
+                judged_only = measure(judged_only=True)
+                result = provider.calc_aggregate([judged_only], qrels, run)[judged_only]
+                self.assertEqual(result, provider.calc_aggregate([measure], qrels, judged_run)[measure])
+                self.assertNotEqual(result, provider.calc_aggregate([measure], qrels, run)[measure])
 
 
 if __name__ == '__main__':
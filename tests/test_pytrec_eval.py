@@ -571,6 +571,14 @@ class TestPytrecEval(BaseMeasureTest):
                 [Metric(query_id='0', measure=measure, value=0.97177),
                 Metric(query_id='1', measure=measure, value=0.14949)])
 
+        # nDCG with the default gains must not share an invocation with custom gains
+        measures = [ir_measures.nDCG(gains={0:1,1:4}), ir_measures.nDCG]
+        result = {(m.query_id, m.measure): m.value for m in provider.iter_calc(measures, qrels, run)}
+        self.assertAlmostEqual(result['0', measures[0]], 0.97177, places=4)
+        self.assertAlmostEqual(result['1', measures[0]], 0.14949, places=4)
+        self.assertAlmostEqual(result['0', measures[1]], 0.76018, places=4)
+        self.assertAlmostEqual(result['1', measures[1]], 0.32739, places=4)
+
     def test_P(self):
         qrels = list(ir_measures.read_trec_qrels('''
 0 0 D0 -1
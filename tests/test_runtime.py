@@ -2,6 +2,7 @@ import unittest
 import itertools
 import ir_measures
 import pandas as pd
+import numpy as np
 
 class TestRuntime(unittest.TestCase):
 
@@ -96,6 +97,107 @@ class TestRuntime(unittest.TestCase):
         self.assertEqual(result[1].value, 0.)
         self.assertEqual((MyS@2).calc_aggregate(qrels, run), 0.5)
 
+    def test_define_byquery_grouping(self):
+        calls = []
+        def my_p(qrels, run):
+            calls.append((list(qrels['doc_id']), list(run['doc_id'])))
+            relevant = set(qrels['doc_id'][qrels['relevance'] > 0])
+            return sum(doc_id in relevant for doc_id in run['doc_id']) / len(run['doc_id'])
+        MyP = ir_measures.define_byquery(my_p, name='MyP')
+        MyPNumpy = ir_measures.define_byquery(my_p, name='MyPNumpy', numpy=True)
+        # qrels are not grouped by query; query 2 has no qrels (but is still reported) and query 3 is not in the run
+        qrels = pd.DataFrame({'query_id': ['1', '0', '1', '0', '3'], 'doc_id': ['D3', 'D1', 'D0', 'D2', 'D0'], 'relevance': [2, 1, 0, 0, 1]})
+        run = pd.DataFrame({'query_id': ['0', '1', '0', '2', '1'], 'doc_id': ['D1', 'D3', 'D2', 'D0', 'D0'], 'score': [0.5, 0.9, 0.8, 0.1, 0.1]})
+        result = {(m.query_id, str(m.measure)): m.value for m in ir_measures.iter_calc([MyP@1, MyPNumpy@1, MyP, MyPNumpy], qrels, run)}
+        self.assertEqual(result, {
+            ('0', 'MyP@1'): 0., ('1', 'MyP@1'): 1., ('2', 'MyP@1'): 0., ('3', 'MyP@1'): 0.,
+            ('0', 'MyPNumpy@1'): 0., ('1', 'MyPNumpy@1'): 1., ('2', 'MyPNumpy@1'): 0., ('3', 'MyPNumpy@1'): 0.,
+            ('0', 'MyP'): 0.5, ('1', 'MyP'): 0.5, ('2', 'MyP'): 0., ('3', 'MyP'): 0.,
+            ('0', 'MyPNumpy'): 0.5, ('1', 'MyPNumpy'): 0.5, ('2', 'MyPNumpy'): 0., ('3', 'MyPNumpy'): 0.,
+        })
+        # each call gets only the qrels of its query, and the run sorted by score
+        calls.clear()
+        list(MyPNumpy.iter_calc(qrels, run))
+        self.assertEqual(calls, [(['D1', 'D2'], ['D2', 'D1']), (['D0', 'D3'], ['D3', 'D0']), ([], ['D0'])])
+
+    def test_parallel(self):
+        qrels = pd.DataFrame({'query_id': [str(q) for q in range(20) for _ in range(3)], 'doc_id': ['D0', 'D1', 'D2'] * 20, 'relevance': [1, 0, 2] * 20})
+        run = pd.DataFrame({'query_id': [str(q) for q in range(25) for _ in range(q % 4 + 1)]})
+        run['doc_id'] = [f'D{i % 5}' for i in range(len(run))]
+        run['score'] = [-float(i) for i in range(len(run))]
+        my_p = lambda qrels, run: float(run['doc_id'].isin(qrels['doc_id'][qrels['relevance'] > 0]).mean())
+        def my_ps(qrels, run):
+            run = run.merge(qrels, 'left', on=['query_id', 'doc_id'])
+            for qid, df in run.groupby('query_id'):
+                yield qid, (df['relevance'] > 0).sum() / len(df)
+        expected = list(ir_measures.iter_calc([ir_measures.define_byquery(my_p, name='MyP')@2, ir_measures.define(my_ps, name='MyPs')@2], qrels, run))
+        for executor, n_jobs in [('thread', 2), ('thread', -1), ('process', 3)]:
+            with self.subTest(executor=executor, n_jobs=n_jobs):
+                measures = [
+                    ir_measures.define_byquery(my_p, name='MyP', n_jobs=n_jobs, executor=executor)@2,
+                    ir_measures.define(my_ps, name='MyPs', n_jobs=n_jobs, executor=executor)@2,
+                ]
+                # same values, in the same (query) order
+                self.assertEqual(list(ir_measures.iter_calc(measures, qrels, run)), expected)
+        with self.assertRaises(ValueError):
+            ir_measures.define_byquery(my_p, executor='gpu')
+
+    def test_define_batched(self):
+        def my_p(batch):
+            return np.add.reduceat((batch.relevance > 0).astype(float), batch.offsets[:-1]) / np.diff(batch.offsets)
+        def my_r(batch):
+            num_rel = np.add.reduceat(np.append(batch.qrels_relevance > 0, False).astype(float), batch.qrels_offsets[:-1])
+            num_ret = np.bincount(batch.query_codes[batch.relevance > 0], minlength=len(batch.query_ids))
+            return np.where(num_rel > 0, num_ret / np.maximum(num_rel, 1), 0.)
+        MyP = ir_measures.define_batched(my_p)
+        MyR = ir_measures.define_batched(my_r, name='MyR')
+        self.assertEqual(str(MyP@3), 'my_p@3')
+        qrels = list(ir_measures.read_trec_qrels('''
+0 0 D0 0
+0 0 D1 1
+0 0 D2 1
+0 0 D3 2
+0 0 D3 2
+1 0 D0 1
+1 0 D3 0
+1 0 D5 2
+2 0 D0 1
+'''))
+        run = list(ir_measures.read_trec_run('''
+1 0 D1 1 0.8 run
+1 0 D5 2 0.7 run
+0 0 D0 1 0.8 run
+0 0 D2 2 0.7 run
+0 0 D1 3 0.3 run
+0 0 D3 4 0.4 run
+0 0 D4 5 0.1 run
+3 0 D0 1 0.8 run
+'''))
+        result = {(m.query_id, str(m.measure)): m.value for m in ir_measures.iter_calc([MyP@2, MyP, MyR@3], qrels, run)}
+        names = {ir_measures.P@2: 'my_p@2', ir_measures.SetP: 'my_p', ir_measures.R@3: 'MyR@3'}
+        expected = {(m.query_id, names[m.measure]): m.value for m in ir_measures.iter_calc(list(names), qrels, run)}
+        # query 3 is not in the qrels, but is reported
+        self.assertEqual(result, {**expected, ('3', 'my_p@2'): 0., ('3', 'my_p'): 0., ('3', 'MyR@3'): 0.})
+
+        batches = []
+        ir_measures.calc_aggregate([ir_measures.define_batched(lambda batch: batches.append(batch) or np.zeros(len(batch.query_ids)), name='X')@2], qrels, run)
+        batch, = batches
+        self.assertEqual(batch.query_ids.tolist(), ['0', '1', '3'])
+        self.assertEqual(batch.offsets.tolist(), [0, 2, 4, 5])
+        self.assertEqual(batch.query_codes.tolist(), [0, 0, 1, 1, 2])
+        self.assertEqual(batch.score.tolist(), [0.8, 0.7, 0.8, 0.7, 0.8])
+        self.assertEqual(batch.rank.tolist(), [0, 1, 0, 1, 0])
+        self.assertEqual(batch.relevance.tolist(), [0, 1, 0, 2, 0])
+        self.assertEqual(batch.judged.tolist(), [True, True, False, True, False])
+        # the duplicate judgment of (0, D3) is only included once
+        self.assertEqual(batch.qrels_offsets.tolist(), [0, 4, 7, 7])
+        self.assertEqual(batch.qrels_relevance.tolist(), [0, 1, 1, 2, 1, 0, 2])
+
+        with self.assertRaises(ValueError):
+            ir_measures.calc_aggregate([ir_measures.define_batched(lambda batch: np.zeros(1), name='X')], qrels, run)
+        # with an empty run, the queries in the qrels get the default value
+        self.assertEqual([m.value for m in (MyP@2).iter_calc(qrels, [])], [0., 0., 0.])
+
     def test_define(self):
         def my_p(qrels, run):
             run = run.merge(qrels, 'left', on=['query_id', 'doc_id'])
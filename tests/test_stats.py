@@ -0,0 +1,98 @@
+import unittest
+import itertools
+import ir_measures
+from ir_measures import *
+from ir_measures import stats
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        np = ir_measures.lazylibs.numpy()
+        rng = np.random.default_rng(0)
+        qrels = [Qrel(str(q), f'D{d}', int(rng.integers(0, 3)) * (d % 3 == 0)) for q in range(30) for d in range(20)]
+        # run i ranks the (potentially) relevant documents increasingly well
+        runs = {f'run{i}': [ScoredDoc(str(q), f'D{d}', float(rng.random() + 0.3 * i * (d % 3 == 0))) for q in range(30) for d in range(20)] for i in range(3)}
+        evaluator = ir_measures.evaluator([nDCG@10, AP], qrels)
+        self.results = evaluator.calc_many(runs)
+        self.results['run2'] = evaluator.calc(runs['run2'], columnar=True) # inputs can be mixed
+        self.values = {name: {m.measure: {} for m in result.per_query} for name, result in self.results.items()}
+        for name, result in self.results.items():
+            for metric in result.per_query:
+                self.values[name][metric.measure][metric.query_id] = metric.value
+
+    def diffs(self, run_a, run_b, measure):
+        a, b = self.values[run_a][measure], self.values[run_b][measure]
+        return [a[q] - b[q] for q in sorted(a)]
+
+    def test_ttest(self):
+        try:
+            import scipy.stats
+        except ImportError:
+            self.skipTest('scipy not available')
+        results = stats.ttest(self.results, [nDCG@10, AP])
+        self.assertEqual([(r.measure, r.run_a, r.run_b) for r in results], [(m, a, b) for m in [nDCG@10, AP] for a, b in itertools.combinations(['run0', 'run1', 'run2'], 2)])
+        for result in results:
+            expected = scipy.stats.ttest_1samp(self.diffs(result.run_a, result.run_b, result.measure), 0.)
+            self.assertAlmostEqual(result.statistic, expected.statistic)
+            self.assertAlmostEqual(result.p_value, expected.pvalue)
+        corrected = stats.ttest(self.results, [AP], baseline='run0', correction='bonferroni')
+        self.assertEqual([(r.run_a, r.run_b) for r in corrected], [('run1', 'run0'), ('run2', 'run0')])
+        for result in corrected:
+            raw = next(r for r in results if (r.measure, r.run_a, r.run_b) == (AP, 'run0', result.run_a))
+            self.assertAlmostEqual(result.p_value, min(raw.p_value * 2, 1.))
+            self.assertAlmostEqual(result.mean_diff, -raw.mean_diff)
+
+    def test_randomization_test(self):
+        np = ir_measures.lazylibs.numpy()
+        results = stats.randomization_test(self.results, [nDCG@10, AP], n_samples=2000, seed=42, batch_size=300)
+        self.assertEqual(len(results), 6)
+        for result in results:
+            diffs = np.array(self.diffs(result.run_a, result.run_b, result.measure))
+            self.assertAlmostEqual(result.mean_diff, diffs.mean())
+            # compare with a straightforward (per-pair) implementation
+            signs = np.random.default_rng(0).choice([-1., 1.], size=(2000, len(diffs)))
+            expected = ((np.abs((signs * diffs).mean(axis=1)) >= abs(diffs.mean()) - 1e-12).sum() + 1) / 2001
+            self.assertAlmostEqual(result.p_value, expected, delta=0.03)
+        # run2 is clearly better than run0
+        self.assertLess(next(r for r in results if (r.run_a, r.run_b, r.measure) == ('run0', 'run2', AP)).p_value, 0.01)
+        # identical runs
+        same = stats.randomization_test({'a': self.results['run0'], 'b': self.results['run0']}, [AP], n_samples=100)
+        self.assertEqual(same[0].p_value, 1.)
+        # the same seed gives the same results, regardless of the batch size
+        self.assertEqual(stats.randomization_test(self.results, [AP], seed=1, n_samples=500), stats.randomization_test(self.results, [AP], seed=1, n_samples=500, batch_size=64))
+
+    def test_bootstrap_ci(self):
+        results = stats.bootstrap_ci(self.results, [nDCG@10, AP], baseline='run0', n_samples=2000, seed=0)
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertLess(result.ci_low, result.mean_diff)
+            self.assertGreater(result.ci_high, result.mean_diff)
+        wider = stats.bootstrap_ci(self.results, [nDCG@10, AP], baseline='run0', n_samples=2000, seed=0, correction='bonferroni')
+        for result, corrected in zip(results, wider):
+            self.assertLessEqual(corrected.ci_low, result.ci_low)
+            self.assertGreaterEqual(corrected.ci_high, result.ci_high)
+        with self.assertRaises(ValueError):
+            stats.bootstrap_ci(self.results, [AP], correction='holm')
+
+    def test_correct(self):
+        p_values = [0.01, 0.04, 0.03, 0.005]
+        self.assertEqual(stats.correct(p_values).tolist(), p_values)
+        self.assertEqual([round(p, 6) for p in stats.correct(p_values, 'bonferroni')], [0.04, 0.16, 0.12, 0.02])
+        self.assertEqual([round(p, 6) for p in stats.correct(p_values, 'holm')], [0.03, 0.06, 0.06, 0.02])
+        self.assertEqual([round(p, 6) for p in stats.correct(p_values, 'fdr_bh')], [0.02, 0.04, 0.04, 0.02])
+        self.assertEqual(stats.correct([0.9, 0.8], 'holm').tolist(), [1., 1.])
+        with self.assertRaises(ValueError):
+            stats.correct(p_values, 'sidak')
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            stats.ttest({'a': self.results['run0']}, [AP])
+        with self.assertRaises(KeyError):
+            stats.ttest(self.results, [AP], baseline='missing')
+        with self.assertRaises(KeyError):
+            stats.ttest(self.results, [P@5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,6 @@
+import os
+import gzip
+import tempfile
 import pandas as pd
 import unittest
 import itertools
@@ -77,13 +80,15 @@ class TestUtil(unittest.TestCase):
             'qrels_nt_iter': lambda: iter(qrels_list),
             'qrels_df': lambda: qrels_df,
             'qrels_df_noit': lambda: qrels_df_noit,
-            'qrels_dict': lambda: qrels_dict
+            'qrels_dict': lambda: qrels_dict,
+            'qrels_columnar': lambda: ir_measures.util.QrelsConverter(qrels_list).as_columnar(),
         }
         for n, fn in sources.items():
             with self.subTest(n):
                 self.assertEqual(ir_measures.util.QrelsConverter(fn()).as_dict_of_dict(), qrels_dict)
                 self.assertEqual(list(ir_measures.util.QrelsConverter(fn()).as_namedtuple_iter()), qrels_list)
                 assert_frame_equal(ir_measures.util.QrelsConverter(fn()).as_pd_dataframe(), qrels_df)
+                self.assertEqual(list(ir_measures.util.QrelsConverter(fn()).as_columnar()), qrels_list)
 
         bad_df = pd.DataFrame([
             {'query_id': '0', 'docno': 'A', 'relevance': 1}
@@ -119,6 +124,8 @@ class TestUtil(unittest.TestCase):
             'run_nt_iter': lambda: iter(run_list),
             'run_df': lambda: run_df,
             'run_dict': lambda: run_dict,
+            'run_columnar': lambda: ir_measures.util.RunConverter(run_list).as_columnar(),
+            'run_shared': lambda: ir_measures.util.SharedRun(iter(run_list)),
         }
         for n, fn in sources.items():
             with self.subTest(n):
@@ -126,6 +133,7 @@ class TestUtil(unittest.TestCase):
                 self.assertEqual(list(ir_measures.util.RunConverter(fn()).as_namedtuple_iter()), run_list)
                 assert_frame_equal(ir_measures.util.RunConverter(fn()).as_pd_dataframe(), run_df)
                 self.assertEqual(ir_measures.util.RunConverter(fn()).as_sorteddict(), run_sorteddict)
+                self.assertEqual(list(ir_measures.util.RunConverter(fn()).as_columnar()), run_list)
 
         out_of_order_source = [
             ir_measures.ScoredDoc('1', 'A', 1.2),
@@ -152,6 +160,157 @@ class TestUtil(unittest.TestCase):
 
         self.assertEqual(context.exception.args[0], "unknown run format: unexpected format; please provide either: (1) an iterable of namedtuples (fields ('query_id', 'doc_id', 'score'), e.g., from ir_measures.ScoredDoc); (2) a pandas DataFrame with columns ('query_id', 'doc_id', 'score'); or (3) a dict-of-dict")
 
+    def test_shared_run(self):
+        run = ir_measures.util.SharedRun(ir_measures.read_trec_run('1 0 A 0 1.2 run\n1 0 B 1 0.9 run\n2 0 A 0 3.5 run\n'))
+        # each conversion is built once and re-used by later converters
+        for method in ['as_dict_of_dict', 'as_pd_dataframe', 'as_columnar', 'as_sorteddict']:
+            with self.subTest(method):
+                self.assertIs(getattr(ir_measures.util.RunConverter(run), method)(), getattr(ir_measures.util.RunConverter(run), method)())
+        self.assertEqual(list(ir_measures.util.RunConverter(run).as_sorted_namedtuple_iter()), list(ir_measures.util.RunConverter(run).as_sorted_namedtuple_iter()))
+        self.assertEqual(len(list(run)), 3)
+        self.assertEqual(len(list(run)), 3)
+
+        # evaluators in a FallbackEvaluator share the run, even if it is an iterator
+        qrels = [Qrel('1', 'A', 1), Qrel('1', 'B', 2), Qrel('2', 'A', 0), Qrel('2', 'C', 1)]
+        measures = [P@1, Judged@2, nDCG(gains={0: 0, 1: 1, 2: 5})@2, RR, ERR@2]
+        evaluator = ir_measures.evaluator(measures, qrels)
+        self.assertIsInstance(evaluator, ir_measures.providers.fallback_provider.FallbackEvaluator)
+        expected = evaluator.calc_aggregate(list(run))
+        self.assertEqual(evaluator.calc_aggregate(iter(list(run))), expected)
+        self.assertEqual(evaluator.calc_aggregate(run), expected)
+
+    def test_shared_run_not_modified(self):
+        # the conversions of a SharedRun are handed to every provider, so none of the built-in providers may modify them
+        qrels = [Qrel('1', 'A', 1, '0'), Qrel('1', 'B', 2, '1'), Qrel('1', 'C', 0, '0'), Qrel('2', 'A', 0, '0'), Qrel('2', 'C', 1, '1')]
+        run = [ScoredDoc('1', 'C', 0.5), ScoredDoc('1', 'A', 1.2), ScoredDoc('1', 'B', 0.9), ScoredDoc('2', 'A', 3.5), ScoredDoc('2', 'B', 0.1)]
+        providers = ir_measures.providers
+        diversity = [alpha_nDCG@2, ERR_IA@2, NRBP, AP_IA, P_IA@2, StRecall@2]
+        for provider, measures in [
+                (ir_measures.native, [P@2, nDCG@2, AP, RR, R@2, SetF]),
+                (ir_measures.pytrec_eval, [P@2, nDCG@2, AP, Bpref, infAP, IPrec@0.5]),
+                (ir_measures.cwl_eval, [P@2, RBP(rel=1), SDCG(max_rel=2)@2, INST(max_rel=2)]),
+                (providers.CwlEvalProvider(engine='cwl'), [P@2, RBP(rel=1), SDCG(max_rel=2)@2, INST(max_rel=2)]),
+                (ir_measures.compat, [Compat(p=0.8)]),
+                (ir_measures.pyndeval, diversity),
+                (providers.PyNdEvalProvider(engine='pyndeval'), diversity),
+                (ir_measures.judged, [Judged@2]),
+                (ir_measures.msmarco, [RR@2]),
+                (ir_measures.gdeval, [ERR@2, nDCG(dcg='exp-log2')@2]),
+                (providers.GdevalProvider(engine='perl'), [ERR@2]),
+                (providers.GdevalProvider(engine='perl_worker'), [ERR@2]),
+                (ir_measures.accuracy, [Accuracy()]),
+                (ir_measures.trectools, [P@2, nDCG@2, AP, RBP]),
+                (ir_measures.ranx, [P@2, nDCG@2, AP, RR]),
+                (ir_measures.runtime, [ir_measures.define_byquery(lambda qrels, run: len(run), name='Len'),
+                                       ir_measures.define(lambda qrels, run: run.groupby('query_id').size().items(), name='Len2'),
+                                       ir_measures.define_batched(lambda batch: batch.score[batch.offsets[:-1]], name='Top')])]:
+            with self.subTest(provider=provider.NAME, measures=measures):
+                if not provider.is_available():
+                    self.skipTest(f'{provider.NAME} not available')
+                shared = ir_measures.util.SharedRun(run)
+                converter = ir_measures.util.RunConverter(shared)
+                conversions = [converter.as_dict_of_dict(), converter.as_sorteddict(), converter.as_pd_dataframe(), converter.as_columnar()]
+                list(provider.evaluator(measures, qrels)._iter_calc(shared))
+                fresh = ir_measures.util.RunConverter(run)
+                self.assertEqual(conversions[0], fresh.as_dict_of_dict())
+                self.assertEqual(conversions[1], fresh.as_sorteddict())
+                assert_frame_equal(conversions[2], fresh.as_pd_dataframe())
+                self.assertEqual(list(conversions[3]), list(fresh.as_columnar()))
+        # the arrays of the shared columnar run cannot be written to
+        columnar = ir_measures.util.RunConverter(ir_measures.util.SharedRun(run)).as_columnar()
+        with self.assertRaises(ValueError):
+            columnar.scores[0] = 0.
+
+    def test_top_k(self):
+        run = ir_measures.read_trec_run_columnar('1 0 A 0 1.2 run\n1 0 B 1 0.9 run\n1 0 C 2 0.9 run\n1 0 D 3 0.1 run\n2 0 A 0 3.5 run\n1 0 E 4 2.0 run\n')
+        self.assertEqual([(d.query_id, d.doc_id) for d in run.top_k(2)], [('1', 'A'), ('2', 'A'), ('1', 'E')])
+        # documents tied with the k-th are kept
+        self.assertEqual([(d.query_id, d.doc_id) for d in run.top_k(3)], [('1', 'A'), ('1', 'B'), ('1', 'C'), ('2', 'A'), ('1', 'E')])
+        self.assertIs(run.top_k(5), run)
+        empty = ir_measures.ColumnarRun.from_columns([], [], [])
+        self.assertEqual(len(empty.top_k(1)), 0)
+        # only the last row of a duplicated document counts (as in the providers)
+        run = ir_measures.read_trec_run_columnar('1 0 A 0 2.0 run\n1 0 B 1 1.0 run\n1 0 A 2 0.5 run\n2 0 C 0 1.0 run\n')
+        self.assertEqual([(d.query_id, d.doc_id, d.score) for d in run.top_k(1)], [('1', 'B', 1.0), ('2', 'C', 1.0)])
+        self.assertEqual([(d.query_id, d.doc_id, d.score) for d in run.top_k(5)], [('1', 'B', 1.0), ('1', 'A', 0.5), ('2', 'C', 1.0)])
+
+    def test_columnar_results(self):
+        results = ir_measures.ColumnarResults.from_columns([P@5, AP], [(AP, ['b', 'a'], [0.5, 0.25]), (P@5, ['c'], [1.])], qrel_qids=['a', 'b'])
+        self.assertEqual(results.query_ids.tolist(), ['a', 'b', 'c'])
+        self.assertEqual(results[AP].tolist()[:2], [0.25, 0.5])
+        # missing values of qrels queries are filled in; others are NaN
+        self.assertEqual(results[P@5].tolist(), [0., 0., 1.])
+        self.assertTrue(pd.isna(results[AP][2]))
+        self.assertEqual(list(results), [Metric('a', P@5, 0.), Metric('a', AP, 0.25), Metric('b', P@5, 0.), Metric('b', AP, 0.5), Metric('c', P@5, 1.)])
+        self.assertEqual(len(results), 5)
+        # column slices and the DataFrame are views of the same values
+        results[AP][0] = 0.75
+        self.assertEqual(results.to_pandas().loc['a', 'AP'], 0.75)
+        self.assertEqual(results.to_pandas().index.name, 'query_id')
+
+    def test_columnar_file(self):
+        run = [
+            ir_measures.ScoredDoc('1', 'A', 1.2),
+            ir_measures.ScoredDoc('1', 'B', 0.9),
+            ir_measures.ScoredDoc('2', 'A', 3.5),
+        ]
+        qrels = [
+            ir_measures.Qrel('1', 'A', 1),
+            ir_measures.Qrel('2', 'C', 2, 'Q1'),
+        ]
+        with tempfile.TemporaryDirectory() as d:
+            ir_measures.util.RunConverter(run).as_columnar().save(os.path.join(d, 'run'))
+            ir_measures.util.QrelsConverter(qrels).as_columnar().save(os.path.join(d, 'qrels'))
+            self.assertTrue(ir_measures.util.is_columnar_file(os.path.join(d, 'run')))
+            self.assertFalse(ir_measures.util.is_columnar_file(os.path.join(d, 'missing')))
+            loaded_run = ColumnarRun.load(os.path.join(d, 'run'))
+            loaded_qrels = ColumnarQrels.load(os.path.join(d, 'qrels'))
+            self.assertEqual(list(loaded_run), run)
+            self.assertEqual(list(loaded_qrels), qrels)
+            self.assertIs(ir_measures.util.RunConverter(loaded_run).as_columnar(), loaded_run)
+            self.assertEqual(ir_measures.util.RunConverter(loaded_run).as_dict_of_dict(), ir_measures.util.RunConverter(run).as_dict_of_dict())
+            with self.assertRaises(ValueError):
+                ColumnarRun.load(os.path.join(d, 'qrels'))
+
+            ColumnarRun.from_columns([], [], []).save(os.path.join(d, 'empty'))
+            self.assertEqual(list(ColumnarRun.load(os.path.join(d, 'empty'))), [])
+
+    def test_read_trec_columnar(self):
+        run_text = '''
+1 Q0 A 0 1.2 run
+1 Q0 B 1 0.9 run
+
+2 Q0 A 0 3.5 run
+2 Q0 NA 1 1e-3 run
+'''
+        qrels_text = '''
+1 0 A 1
+2 Q1 C 2
+2 0 NA -1
+'''
+        self.assertEqual(list(ir_measures.read_trec_run_columnar(run_text)), list(ir_measures.read_trec_run(run_text)))
+        self.assertEqual(list(ir_measures.read_trec_run_columnar(run_text, chunk_size=1)), list(ir_measures.read_trec_run(run_text)))
+        self.assertEqual(list(ir_measures.read_trec_qrels_columnar(qrels_text)), list(ir_measures.read_trec_qrels(qrels_text)))
+        self.assertEqual(list(ir_measures.read_trec_qrels_columnar(qrels_text, chunk_size=2)), list(ir_measures.read_trec_qrels(qrels_text)))
+        self.assertEqual(list(ir_measures.read_trec_run_columnar('\n')), [])
+        with tempfile.TemporaryDirectory() as d:
+            with gzip.open(os.path.join(d, 'run.gz'), 'wt') as f:
+                f.write(run_text)
+            self.assertEqual(list(ir_measures.read_trec_run_columnar(os.path.join(d, 'run.gz'))), list(ir_measures.read_trec_run(run_text)))
+        # malformed lines are rejected, like by read_trec_run and read_trec_qrels
+        for run_text in ['1 Q0 A 0 1.2 run x\n', '1 Q0 A 0 1.2 run\n1 Q0 B 1 0.9 run x\n', '1 Q0 A 0 1.2\n', '1 Q0 A 0 1.2 run\n1 Q0 B 1 0.9\n', '1 Q0 A 0 x run\n']:
+            with self.subTest(run_text):
+                with self.assertRaises(ValueError):
+                    list(ir_measures.read_trec_run(run_text))
+                with self.assertRaises(ValueError):
+                    ir_measures.read_trec_run_columnar(run_text, chunk_size=1)
+        for qrels_text in ['1 0 A 1 x\n', '1 0 A 1\n1 0 B 0 x\n', '1 0 A 1\n1 0 B\n', '1 0 A 1.0\n', '1 0 A x\n']:
+            with self.subTest(qrels_text):
+                with self.assertRaises(ValueError):
+                    list(ir_measures.read_trec_qrels(qrels_text))
+                with self.assertRaises(ValueError):
+                    ir_measures.read_trec_qrels_columnar(qrels_text, chunk_size=1)
+
 
 if __name__ == '__main__':
     unittest.main()